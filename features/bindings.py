@@ -9,7 +9,7 @@ from features.serializers import CalculationSerializer
 class DatasetBinding(WebsocketBinding):
     model = Dataset
     stream = 'dataset'
-    fields = ['name', 'status']
+    fields = ['name', 'status', 'progress', 'available_features']
 
     @classmethod
     def group_names(cls, instance: Dataset) -> List[str]:
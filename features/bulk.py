@@ -0,0 +1,34 @@
+"""
+Bulk writes that Django does not offer itself.
+"""
+from typing import List
+
+from django.db.models import Case, Model, Value, When
+from django.db.models.functions import Cast
+
+# Rows that are written by one query, keeps the number of query parameters below the limits of the database
+BULK_BATCH_SIZE = 1000
+
+
+def bulk_update(objects: List[Model], fields: List[str]):
+    """
+    Write fields of many objects of one model with an UPDATE query per BULK_BATCH_SIZE objects. Every field is set by
+    a CASE expression over the primary keys, the values are cast to the field's column type so that NULL values are
+    typed as well. Wrap calls in a transaction to write all batches at once.
+
+    :param objects: Saved objects of the same model
+    :param fields: Names of the fields to write
+    """
+    if len(objects) == 0:
+        return
+    model = type(objects[0])
+
+    for batch_start in range(0, len(objects), BULK_BATCH_SIZE):
+        batch = objects[batch_start:batch_start + BULK_BATCH_SIZE]
+        updates = {}
+        for field_name in fields:
+            field = model._meta.get_field(field_name)
+            updates[field_name] = Case(*[When(pk=instance.pk, then=Cast(Value(getattr(instance, field.attname),
+                                                                              output_field=field), field))
+                                         for instance in batch], output_field=field)
+        model.objects.filter(pk__in=[instance.pk for instance in batch]).update(**updates)
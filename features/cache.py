@@ -0,0 +1,661 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import SharedArray as sa
+import numpy as np
+from django.conf import settings
+from pandas import DataFrame, Series, concat, read_csv
+
+from features.columnar import read_manifest, open_columns, columnar_size, SparseColumn
+from features.models import Dataset
+
+logger = logging.getLogger(__name__)
+
+# Segments, headers and locks of all containers sharing this directory live next to each other
+SHM_ROOT = '/dev/shm'
+
+# Column segments are named <dataset uuid>.<column index> and get a .loading suffix until they are complete,
+# sparse columns keep the row indices of their values in an additional .indices segment
+_SEGMENT_PATTERN = re.compile(r'^([0-9a-f-]{36})\.(\d+)(\.indices)?(\.loading)?$')
+
+# Headers in /dev/shm describe a dataset's segments, so that they can be reattached after a restart
+HEADER_VERSION = 1
+_HEADER_PATTERN = re.compile(r'^([0-9a-f-]{36})\.json$')
+
+# Headers never change for a dataset, so every process keeps the ones it has seen
+_headers = {}
+
+# Counters of every dataset are kept in /dev/shm next to its segments and shared by all processes
+_STATS_PATTERN = re.compile(r'^([0-9a-f-]{36})\.stats$')
+
+# Upper bounds in seconds of the load time histogram's buckets, slower loads are counted in an additional bucket
+LOAD_TIME_BUCKETS = (0.01, 0.1, 1, 10, 60)
+
+# Hits and reads from disk are counted in memory by every process and added to the shared counters after this many
+# seconds, or together with the next miss or eviction of their dataset, so that reads never lock or rewrite the
+# counters' file
+FLUSH_INTERVAL = 10
+
+_pending_counts = defaultdict(Counter)
+_pending_counts_lock = threading.Lock()
+_last_flush = time.time()
+
+
+def _segment_name(dataset_id: str, column_index: int) -> str:
+    """
+    Every column of a dataset lives in its own contiguous segment, addressed by its position in the header.
+    """
+    return '{0}.{1}'.format(dataset_id, column_index)
+
+
+def _shm_path(name: str) -> str:
+    return os.path.join(SHM_ROOT, name)
+
+
+def _header_path(dataset_id: str) -> str:
+    return _shm_path('{0}.json'.format(dataset_id))
+
+
+def _list_segments(dataset_id: str) -> List[str]:
+    names = [segment.name.decode('ascii') for segment in sa.list()]
+    matches = [_SEGMENT_PATTERN.match(name) for name in names]
+    return [match.group(0) for match in matches
+            if match is not None and match.group(1) == dataset_id and match.group(4) is None]
+
+
+@contextmanager
+def dataset_lock(dataset_id: str):
+    """
+    Exclusive lock for a single dataset that works across processes and containers sharing /dev/shm.
+    The lock is released by the kernel if the holding process dies.
+
+    :param dataset_id: The uuid of a dataset
+    """
+    with open(_shm_path('{0}.lock'.format(dataset_id)), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_header(dataset_id: str) -> Dict:
+    try:
+        with open(_header_path(dataset_id)) as header_file:
+            header = json.load(header_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    # Headers of other versions might describe segments differently
+    if header.get('version') != HEADER_VERSION:
+        return None
+    return header
+
+
+def _write_header(dataset_id: str, header: Dict):
+    # Write and rename so that readers never see a partial header
+    path = _header_path(dataset_id)
+    with open(path + '.tmp', 'w') as header_file:
+        json.dump(header, header_file)
+    os.replace(path + '.tmp', path)
+
+
+def _stats_path(dataset_id: str) -> str:
+    return _shm_path('{0}.stats'.format(dataset_id))
+
+
+def _empty_stats() -> Dict:
+    return {'hits': 0, 'misses': 0, 'disk_reads': 0, 'evictions': 0, 'loaded_bytes': 0,
+            'load_seconds': {'buckets': list(LOAD_TIME_BUCKETS), 'counts': [0] * (len(LOAD_TIME_BUCKETS) + 1),
+                             'sum': 0.0}}
+
+
+def _read_stats(dataset_id: str) -> Dict:
+    try:
+        with open(_stats_path(dataset_id)) as stats_file:
+            return json.load(stats_file)
+    except (FileNotFoundError, ValueError):
+        return _empty_stats()
+
+
+def _record(dataset_id: str, load_seconds: float=None, **increments):
+    with _pending_counts_lock:
+        pending_counts = _pending_counts.pop(dataset_id, Counter())
+    for counter, count in pending_counts.items():
+        increments[counter] = increments.get(counter, 0) + count
+
+    # Updates of all processes are serialized by a lock on the counters' file itself
+    with open(_stats_path(dataset_id), 'a+') as stats_file:
+        fcntl.flock(stats_file, fcntl.LOCK_EX)
+        try:
+            stats_file.seek(0)
+            content = stats_file.read()
+            stats = json.loads(content) if content else _empty_stats()
+
+            for counter, increment in increments.items():
+                stats[counter] += increment
+            if load_seconds is not None:
+                bucket = next((index for index, bound in enumerate(LOAD_TIME_BUCKETS) if load_seconds <= bound),
+                              len(LOAD_TIME_BUCKETS))
+                stats['load_seconds']['counts'][bucket] += 1
+                stats['load_seconds']['sum'] += load_seconds
+
+            stats_file.truncate(0)
+            json.dump(stats, stats_file)
+        finally:
+            fcntl.flock(stats_file, fcntl.LOCK_UN)
+
+
+def _count(dataset_id: str, counter: str):
+    with _pending_counts_lock:
+        _pending_counts[dataset_id][counter] += 1
+        flush = time.time() - _last_flush >= FLUSH_INTERVAL
+    if flush:
+        _flush_counts()
+
+
+@atexit.register
+def _flush_counts():
+    global _last_flush
+    with _pending_counts_lock:
+        _last_flush = time.time()
+        dataset_ids = list(_pending_counts.keys())
+    for dataset_id in dataset_ids:
+        _record(dataset_id)
+
+
+def _build_header(dataset: Dataset) -> Dict:
+    header = {'version': HEADER_VERSION, 'created_at': time.time()}
+
+    # Only read the header, the data is loaded lazily per column
+    manifest = read_manifest(dataset)
+    if manifest is not None:
+        header.update({
+            'columns': [column['name'] for column in manifest['columns']],
+            'dtypes': [column['dtype'] for column in manifest['columns']],
+            'sparse': [column['name'] for column in manifest['columns'] if 'indices' in column],
+            'rows': manifest['rows'],
+            'nbytes': columnar_size(dataset, manifest),
+            'checksum': manifest.get('checksum')
+        })
+    else:
+        column_names = list(read_csv(dataset.content.path, nrows=0).columns)
+        header.update({
+            'columns': column_names,
+            'dtypes': [np.dtype(float).str] * len(column_names),
+            'sparse': [],
+            'rows': None,
+            'nbytes': None,
+            'checksum': None
+        })
+    return header
+
+
+def _get_header(dataset_id: str) -> Dict:
+    try:
+        return _headers[dataset_id]
+    except KeyError:
+        pass
+
+    header = _read_header(dataset_id)
+    if header is None:
+        header = _build_header(Dataset.objects.get(pk=dataset_id))
+
+    _headers[dataset_id] = header
+    return header
+
+
+def get_column_names(dataset_id: str) -> List[str]:
+    """
+    Get the column names of a dataset without loading any of its columns.
+
+    :param dataset_id: The uuid of a dataset
+    :return: Column names in the order of the dataset's header
+    """
+    return _get_header(str(dataset_id))['columns']
+
+
+def is_out_of_core(dataset_id: str) -> bool:
+    """
+    Datasets that would take more than the cache's high watermark or the size of /dev/shm are never copied into
+    shared memory. Their columns are memory mapped from the columnar files instead, so they are read from disk.
+
+    :param dataset_id: The uuid of a dataset
+    :return: True if the dataset's columns are memory mapped from disk
+    """
+    nbytes = _get_header(str(dataset_id)).get('nbytes')
+    if nbytes is None:
+        return False
+
+    shm_stat = os.statvfs(SHM_ROOT)
+    capacity = min(settings.DATASET_CACHE_HIGH_WATERMARK * settings.DATASET_CACHE_BUDGET,
+                   shm_stat.f_frsize * shm_stat.f_blocks)
+    return nbytes > capacity
+
+
+def _attach_segment(segment_name: str) -> np.ndarray:
+    shared_array = sa.attach('shm://' + segment_name)
+    # The modification time of a segment is its last access for the LRU eviction
+    os.utime(_shm_path(segment_name))
+    return shared_array
+
+
+def _attach_columns(dataset_id: str, column_indices: Dict[str, int]) -> Tuple[Dict[str, np.ndarray], Dict[str, int]]:
+    header = _get_header(dataset_id)
+    shared_arrays = {}
+    missing_column_indices = {}
+    for column_name, column_index in column_indices.items():
+        segment_name = _segment_name(dataset_id, column_index)
+        try:
+            if column_name in header['sparse']:
+                shared_arrays[column_name] = SparseColumn(_attach_segment(segment_name + '.indices'),
+                                                          _attach_segment(segment_name), header['rows'])
+            else:
+                shared_arrays[column_name] = _attach_segment(segment_name)
+        except FileNotFoundError:
+            missing_column_indices[column_name] = column_index
+    return shared_arrays, missing_column_indices
+
+
+def _read_columns(dataset: Dataset, column_names: List[str]) -> Dict[str, np.ndarray]:
+    manifest = read_manifest(dataset)
+    if manifest is not None:
+        return open_columns(dataset, manifest, column_names)
+
+    # Datasets without columnar files have to be parsed
+    logger.warning('No columnar files for dataset {0}, parsing its CSV'.format(dataset.id))
+    dataframe = read_csv(dataset.content.path, usecols=column_names)
+    return {column_name: dataframe[column_name].values.astype(float) for column_name in column_names}
+
+
+def _create_segment(segment_name: str, array: np.ndarray) -> np.ndarray:
+    # Fill the segment under a temporary name, readers only ever attach to complete columns
+    shared_array = sa.create('shm://{0}.loading'.format(segment_name), (len(array),), dtype=array.dtype)
+    shared_array[:] = array
+    os.rename(_shm_path(segment_name + '.loading'), _shm_path(segment_name))
+    return shared_array
+
+
+def _load_columns(dataset_id: str, column_indices: Dict[str, int]) -> Dict[str, np.ndarray]:
+    dataset = Dataset.objects.get(pk=dataset_id)
+    columns = _read_columns(dataset, list(column_indices.keys()))
+    make_room(sum(column.nbytes for column in columns.values()))
+
+    shared_arrays = {}
+    for column_name, column_index in column_indices.items():
+        segment_name = _segment_name(dataset_id, column_index)
+        column = columns[column_name]
+        if isinstance(column, SparseColumn):
+            # Only one of both segments might have been evicted
+            for name in (segment_name, segment_name + '.indices'):
+                try:
+                    sa.delete('shm://' + name)
+                except FileNotFoundError:
+                    pass
+            shared_arrays[column_name] = SparseColumn(_create_segment(segment_name + '.indices', column.indices),
+                                                      _create_segment(segment_name, column.values), len(column))
+        else:
+            shared_arrays[column_name] = _create_segment(segment_name, column)
+    del columns
+
+    return shared_arrays
+
+
+def get_columns(dataset_id: str, columns: List[str]=None) -> Dict[str, np.ndarray]:
+    """
+    Get columns of a dataset from the system's shared memory (/dev/shm). Columns that can't be found are copied from
+    the dataset's columnar files into their own segment, so only the requested columns are ever loaded.
+
+    Cache hits never take a lock. On a miss only the lock of that dataset is held while loading, so callers of other
+    datasets are not affected and callers of the same dataset wait for the load instead of repeating it.
+
+    Datasets that don't fit into the cache at all are memory mapped from their columnar files, see is_out_of_core.
+    Process their columns in chunks to keep the memory bounded.
+
+    IMPORTANT NOTE: Least recently used columns get evicted once the cache runs out of its memory budget. Wrap the
+    usage of the returned views in pin_dataset to protect them.
+
+    :param dataset_id: The uuid of a dataset
+    :param columns: Names of the columns to return or None for all columns
+    :return: Ordered mapping from column name to a view on its shared memory segment or a SparseColumn of views
+    """
+    dataset_id = str(dataset_id)
+
+    column_names = get_column_names(dataset_id)
+    if columns is None:
+        columns = column_names
+
+    if is_out_of_core(dataset_id):
+        logger.info('Dataset {0} exceeds the cache, mapping its columns from disk'.format(dataset_id))
+        _count(dataset_id, 'disk_reads')
+        dataset = Dataset.objects.get(pk=dataset_id)
+        mapped_columns = open_columns(dataset, read_manifest(dataset), columns)
+        return OrderedDict((column_name, mapped_columns[column_name]) for column_name in columns)
+
+    shared_arrays, missing_column_indices = _attach_columns(
+        dataset_id, {column_name: column_names.index(column_name) for column_name in columns})
+
+    if len(missing_column_indices) == 0:
+        logger.info('Cache hit for dataset {0}'.format(dataset_id))
+        _count(dataset_id, 'hits')
+    else:
+        with dataset_lock(dataset_id):
+            # Somebody else might have loaded the columns while we were waiting for the lock
+            loaded_arrays, missing_column_indices = _attach_columns(dataset_id, missing_column_indices)
+            shared_arrays.update(loaded_arrays)
+
+            if _read_header(dataset_id) is None:
+                _write_header(dataset_id, _get_header(dataset_id))
+
+            if len(missing_column_indices) > 0:
+                logger.info('Cache miss for {0} columns of dataset {1}'.format(len(missing_column_indices),
+                                                                              dataset_id))
+                start_time = time.time()
+                loaded_arrays = _load_columns(dataset_id, missing_column_indices)
+                shared_arrays.update(loaded_arrays)
+                _record(dataset_id, load_seconds=time.time() - start_time, misses=1,
+                        loaded_bytes=sum(column.nbytes for column in loaded_arrays.values()))
+                logger.info('Cache save for dataset {0}'.format(dataset_id))
+            else:
+                _count(dataset_id, 'hits')
+
+    touch_dataset(dataset_id)
+
+    return OrderedDict((column_name, shared_arrays[column_name]) for column_name in columns)
+
+
+def get_column(dataset_id: str, column: str) -> np.ndarray:
+    """
+    Get a single column of a dataset without touching any other column.
+
+    :param dataset_id: The uuid of a dataset
+    :param column: Name of the column
+    :return: View on the column's shared memory segment or a SparseColumn of views
+    """
+    return get_columns(dataset_id, [column])[column]
+
+
+def get_dataframe(dataset_id: str, columns: List[str]=None) -> DataFrame:
+    """
+    Get a dataset or a subset of its columns as dataframe. Prefer get_column for tasks that work on a single column,
+    sparse columns are densified.
+
+    Every column stays its own block that wraps the shared memory segment, the frame is never consolidated into a
+    private copy. Wrap its usage in pin_dataset like the views of get_columns.
+
+    :param dataset_id: The uuid of a dataset
+    :param columns: Names of the columns to return or None for all columns
+    :return: Pandas Dataframe containing the requested columns
+    """
+    shared_arrays = get_columns(dataset_id, columns)
+    if len(shared_arrays) == 0:
+        return DataFrame()
+    # Concatenating series keeps a block per column, a DataFrame of a dict would copy them into one block per dtype
+    return concat([Series(np.asarray(column), name=column_name, copy=False)
+                   for column_name, column in shared_arrays.items()], axis=1, copy=False)
+
+
+def touch_dataset(dataset_id: str):
+    """
+    Update the last access time of a dataset, which is the modification time of its header in /dev/shm.
+
+    :param dataset_id: The uuid of a dataset
+    """
+    try:
+        os.utime(_header_path(str(dataset_id)))
+    except FileNotFoundError:
+        pass
+
+
+def last_access(dataset_id: str) -> float:
+    """
+    :param dataset_id: The uuid of a dataset
+    :return: UNIX timestamp of the last access or None if the dataset is not in shared memory
+    """
+    try:
+        return os.stat(_header_path(str(dataset_id))).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def pin_dataset(dataset_id: str):
+    """
+    Protect the segments of a dataset from eviction. Hold the pin for as long as views returned by get_columns are
+    used, any number of processes can pin the same dataset at once.
+
+    :param dataset_id: The uuid of a dataset
+    """
+    with open(_shm_path('{0}.pin'.format(dataset_id)), 'a') as pin_file:
+        fcntl.flock(pin_file, fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(pin_file, fcntl.LOCK_UN)
+
+
+def is_pinned(dataset_id: str) -> bool:
+    """
+    :param dataset_id: The uuid of a dataset
+    :return: True if any process currently holds a pin on the dataset
+    """
+    with open(_shm_path('{0}.pin'.format(dataset_id)), 'a') as pin_file:
+        try:
+            fcntl.flock(pin_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(pin_file, fcntl.LOCK_UN)
+        return False
+
+
+@contextmanager
+def ingestion_lock(dataset_id: str):
+    """
+    Exclusive lock held while the content of a dataset is parsed into its columnar files. The lock is released by the
+    kernel if the holding process dies, so a held lock always belongs to a running ingestion.
+
+    :param dataset_id: The uuid of a dataset
+    :return: Context that is True if the lock was acquired and False if another process holds it
+    """
+    with open(_shm_path('{0}.ingest'.format(dataset_id)), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def is_ingesting(dataset_id: str) -> bool:
+    """
+    :param dataset_id: The uuid of a dataset
+    :return: True if any process currently parses the content of the dataset
+    """
+    with ingestion_lock(dataset_id) as acquired:
+        return not acquired
+
+
+def _scan_segments() -> List[Tuple[str, os.stat_result]]:
+    segments = []
+    for entry in os.scandir(SHM_ROOT):
+        if _SEGMENT_PATTERN.match(entry.name):
+            try:
+                segments.append((entry.name, entry.stat()))
+            except FileNotFoundError:
+                # Evicted by someone else in the meantime
+                pass
+    return segments
+
+
+def cache_usage() -> int:
+    """
+    :return: Bytes of shared memory used by all dataset segments, including the ones that are currently loading
+    """
+    return sum(stat.st_size for _, stat in _scan_segments())
+
+
+def make_room(required_bytes: int):
+    """
+    Evict least recently used columns until the required bytes fit into the cache. Nothing happens as long as the
+    cache stays below its high watermark, otherwise columns are evicted down to the low watermark so that the next
+    loads don't have to evict again. Columns of pinned datasets and columns that are still loading are never evicted.
+
+    :param required_bytes: Bytes that are about to be added to the cache
+    """
+    budget = settings.DATASET_CACHE_BUDGET
+    high_watermark = settings.DATASET_CACHE_HIGH_WATERMARK * budget
+    low_watermark = settings.DATASET_CACHE_LOW_WATERMARK * budget
+
+    # Only one process evicts at a time, otherwise they would free the same space twice
+    with dataset_lock('eviction'):
+        segments = _scan_segments()
+        usage = sum(stat.st_size for _, stat in segments)
+        if usage + required_bytes <= high_watermark:
+            return
+
+        pinned_datasets = {}
+        evictions = defaultdict(int)
+        for segment_name, stat in sorted(segments, key=lambda segment: segment[1].st_mtime):
+            if usage + required_bytes <= low_watermark:
+                break
+
+            dataset_id, _, _, loading = _SEGMENT_PATTERN.match(segment_name).groups()
+            if loading is not None:
+                continue
+            if dataset_id not in pinned_datasets:
+                pinned_datasets[dataset_id] = is_pinned(dataset_id)
+            if pinned_datasets[dataset_id]:
+                continue
+
+            try:
+                sa.delete('shm://' + segment_name)
+            except FileNotFoundError:
+                continue
+            usage -= stat.st_size
+            evictions[dataset_id] += 1
+            logger.info('Cache evict for segment {0} ({1} bytes)'.format(segment_name, stat.st_size))
+
+        for dataset_id, count in evictions.items():
+            _record(dataset_id, evictions=count)
+
+    if usage + required_bytes > budget:
+        logger.warning('Dataset cache exceeds its budget of {0} bytes, {1} bytes are pinned or loading'.format(
+            budget, usage))
+
+
+def cache_statistics() -> Dict:
+    """
+    :return: Budget and usage of the whole cache and for every dataset that was ever loaded: resident bytes and
+        segments, last access, hits, misses, reads from disk, evictions, loaded bytes and a histogram of load times.
+        Hits and reads from disk of other processes are up to FLUSH_INTERVAL seconds late.
+    """
+    _flush_counts()
+
+    resident = defaultdict(lambda: {'resident_bytes': 0, 'segments': 0})
+    for segment_name, stat in _scan_segments():
+        dataset_statistics = resident[_SEGMENT_PATTERN.match(segment_name).group(1)]
+        dataset_statistics['resident_bytes'] += stat.st_size
+        dataset_statistics['segments'] += 1
+
+    dataset_ids = set(resident.keys()) | {match.group(1) for match in map(_STATS_PATTERN.match, os.listdir(SHM_ROOT))
+                                          if match is not None}
+    datasets = []
+    for dataset_id in sorted(dataset_ids):
+        dataset_statistics = {'id': dataset_id, 'last_access': last_access(dataset_id)}
+        dataset_statistics.update(resident[dataset_id])
+        dataset_statistics.update(_read_stats(dataset_id))
+        datasets.append(dataset_statistics)
+
+    return {
+        'budget': settings.DATASET_CACHE_BUDGET,
+        'usage': sum(dataset_statistics['resident_bytes'] for dataset_statistics in datasets),
+        'datasets': datasets
+    }
+
+
+def _remove_segments(dataset_id: str) -> int:
+    segment_names = _list_segments(dataset_id)
+    for segment_name in segment_names:
+        sa.delete('shm://' + segment_name)
+    try:
+        os.remove(_header_path(dataset_id))
+    except FileNotFoundError:
+        pass
+    return len(segment_names)
+
+
+def remove_dataset(dataset_id: str):
+    """
+    Delete all segments of a dataset from shared memory, they are counted as evictions. Processes that are still
+    attached keep their views.
+
+    :param dataset_id: The uuid of a dataset
+    """
+    dataset_id = str(dataset_id)
+    with dataset_lock(dataset_id):
+        _record(dataset_id, evictions=_remove_segments(dataset_id))
+
+
+def _remove_loading_segments():
+    for segment_name, _ in _scan_segments():
+        dataset_id, _, _, loading = _SEGMENT_PATTERN.match(segment_name).groups()
+        if loading is None:
+            continue
+
+        # Segments are only loading while their dataset is locked, afterwards they are left over from a dead process
+        with dataset_lock(dataset_id):
+            try:
+                sa.delete('shm://' + segment_name)
+                logger.info('Removed segment {0} that was left loading'.format(segment_name))
+            except FileNotFoundError:
+                pass
+
+
+def reattach_datasets() -> List[str]:
+    """
+    Rebuild the registry of a restarted process from the headers in /dev/shm, so that the segments that survived the
+    restart are used instead of being loaded again. Segments that can't be trusted are removed: those of datasets that
+    were deleted or whose checksum doesn't match their columnar files anymore, those described by a header of another
+    version and those that were left loading by a process that died.
+
+    :return: Uuids of the datasets that were reattached
+    """
+    _remove_loading_segments()
+
+    dataset_ids = [match.group(1) for match in map(_HEADER_PATTERN.match, os.listdir(SHM_ROOT)) if match is not None]
+    reattached_dataset_ids = []
+    for dataset_id in dataset_ids:
+        with dataset_lock(dataset_id):
+            header = _read_header(dataset_id)
+            dataset = Dataset.objects.filter(pk=dataset_id).first()
+            manifest = read_manifest(dataset) if dataset is not None else None
+            if header is None or dataset is None or header['checksum'] != (manifest or {}).get('checksum'):
+                logger.info('Removing stale segments of dataset {0}'.format(dataset_id))
+                _headers.pop(dataset_id, None)
+                _remove_segments(dataset_id)
+                if dataset is None:
+                    with _pending_counts_lock:
+                        _pending_counts.pop(dataset_id, None)
+                    try:
+                        os.remove(_stats_path(dataset_id))
+                    except FileNotFoundError:
+                        pass
+                continue
+
+        _headers[dataset_id] = header
+        reattached_dataset_ids.append(dataset_id)
+
+    logger.info('Reattached {0} datasets from shared memory'.format(len(reattached_dataset_ids)))
+    return reattached_dataset_ids
@@ -0,0 +1,235 @@
+"""
+Analytics on columns in fixed size row chunks. Memory stays bounded by the chunk size, even for columns that are
+memory mapped from disk because their dataset does not fit into the dataset cache.
+
+Blocks of columns are processed together: their chunks are stacked into one matrix, so that a pass over all columns
+takes a few vectorized operations per chunk instead of a pass per column.
+"""
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+# Rows that are processed at once
+CHUNK_SIZE = 1000000
+
+# Bytes of a stacked chunk of a block of columns
+BLOCK_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def iter_chunks(column: np.ndarray, chunk_size: int=None) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    :param column: A dense column
+    :param chunk_size: Rows per chunk, defaults to CHUNK_SIZE
+    :return: Iterator over the start row and the values of each chunk
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    for start in range(0, len(column), chunk_size):
+        yield start, np.asarray(column[start:start + chunk_size])
+
+
+def _finite(chunk: np.ndarray) -> np.ndarray:
+    return chunk[~np.isnan(chunk)] if chunk.dtype.kind == 'f' else chunk
+
+
+def statistics(column: np.ndarray, max_unique: int=None) -> Dict:
+    """
+    Min, max, mean and variance of a column the way numpy calculates them on the whole column: missing values
+    propagate into min, max and mean and are ignored by the variance.
+
+    :param column: A dense column
+    :param max_unique: Stop collecting unique values once there are more than this many or None to collect all
+    :return: Dictionary with min, max, mean, variance and the sorted unique values, which are None if there were more
+        than max_unique of them
+    """
+    minimum = maximum = None
+    total = 0.0
+    count = 0
+    mean = variance = 0.0
+    unique_values = np.array([], dtype=column.dtype)
+
+    for _, chunk in iter_chunks(column):
+        minimum = np.amin(chunk) if minimum is None else np.minimum(minimum, np.amin(chunk))
+        maximum = np.amax(chunk) if maximum is None else np.maximum(maximum, np.amax(chunk))
+        total += np.sum(chunk, dtype=float)
+
+        # Variances of chunks are combined as described by Chan et al.
+        finite_chunk = _finite(chunk)
+        if finite_chunk.size > 0:
+            chunk_count = finite_chunk.size
+            chunk_mean = np.mean(finite_chunk)
+            chunk_variance = np.var(finite_chunk)
+            if count == 0:
+                mean, variance = chunk_mean, chunk_variance
+            else:
+                combined_count = count + chunk_count
+                delta = chunk_mean - mean
+                variance = (count * variance + chunk_count * chunk_variance +
+                            delta ** 2 * count * chunk_count / combined_count) / combined_count
+                mean += delta * chunk_count / combined_count
+            count += chunk_count
+
+        if unique_values is not None:
+            unique_values = np.union1d(unique_values, chunk)
+            if max_unique is not None and unique_values.size > max_unique:
+                unique_values = None
+
+    return {
+        'min': minimum,
+        'max': maximum,
+        'mean': np.float64(total / len(column)),
+        'variance': np.float64(variance) if count > 0 else np.float64(np.nan),
+        'unique': unique_values
+    }
+
+
+def histogram(column: np.ndarray, bins: int, value_range: Tuple[float, float]=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Same as numpy.histogram on the whole column, but in two passes over its chunks. Missing values are not counted.
+
+    :param column: A dense column
+    :param bins: Number of equal width bins between the column's min and max
+    :param value_range: Bounds of the bins or None for the column's min and max
+    :return: Counts and bin edges
+    """
+    if value_range is None:
+        finite_chunks = (_finite(chunk) for _, chunk in iter_chunks(column))
+        bounds = [(np.amin(chunk), np.amax(chunk)) for chunk in finite_chunks if chunk.size > 0]
+        value_range = (min(bound[0] for bound in bounds), max(bound[1] for bound in bounds)) if bounds else (0, 1)
+
+    counts = np.zeros(bins, dtype=np.int64)
+    bin_edges = None
+    for _, chunk in iter_chunks(column):
+        chunk_counts, bin_edges = np.histogram(chunk, bins=bins, range=value_range)
+        counts += chunk_counts
+
+    if bin_edges is None:
+        _, bin_edges = np.histogram([], bins=bins, range=value_range)
+    return counts, bin_edges
+
+
+def iter_block_chunks(columns: List[np.ndarray]) -> Iterator[np.ndarray]:
+    """
+    :param columns: Dense columns of the same length
+    :return: Iterator over float64 matrices with a column per column, that hold the same rows of all columns
+    """
+    rows = len(columns[0]) if columns else 0
+    chunk_size = max(min(BLOCK_CHUNK_BYTES // (8 * max(len(columns), 1)), CHUNK_SIZE), 1)
+    for start in range(0, rows, chunk_size):
+        chunk = np.empty((min(chunk_size, rows - start), len(columns)))
+        for column_index, column in enumerate(columns):
+            chunk[:, column_index] = column[start:start + chunk_size]
+        yield chunk
+
+
+def block_statistics(columns: List[np.ndarray], max_unique: List[int]) -> List[Dict]:
+    """
+    Same as statistics for every column of a block, in a single pass over the block.
+
+    :param columns: Dense columns of the same length
+    :param max_unique: For every column, the maximum number of unique values to collect or None to collect all
+    :return: For every column a dictionary like the one of statistics, with the bounds of its finite values as range
+        or None if it has no finite values
+    """
+    column_count = len(columns)
+    minimum = np.full(column_count, np.inf)
+    maximum = np.full(column_count, -np.inf)
+    finite_minimum = np.full(column_count, np.inf)
+    finite_maximum = np.full(column_count, -np.inf)
+    total = np.zeros(column_count)
+    count = np.zeros(column_count)
+    mean = np.zeros(column_count)
+    variance = np.zeros(column_count)
+    unique_values = [np.array([], dtype=column.dtype) for column in columns]
+
+    for chunk in iter_block_chunks(columns):
+        # Missing values propagate into min and max
+        minimum = np.minimum(minimum, np.amin(chunk, axis=0))
+        maximum = np.maximum(maximum, np.amax(chunk, axis=0))
+        total += np.sum(chunk, axis=0)
+
+        is_finite = ~np.isnan(chunk)
+        finite_minimum = np.minimum(finite_minimum, np.amin(np.where(is_finite, chunk, np.inf), axis=0))
+        finite_maximum = np.maximum(finite_maximum, np.amax(np.where(is_finite, chunk, -np.inf), axis=0))
+
+        # Variances of chunks are combined as described by Chan et al., columns without finite values are skipped
+        chunk_count = np.count_nonzero(is_finite, axis=0)
+        divisor = np.maximum(chunk_count, 1)
+        chunk_mean = np.sum(np.where(is_finite, chunk, 0), axis=0) / divisor
+        chunk_variance = np.sum(np.where(is_finite, chunk - chunk_mean, 0) ** 2, axis=0) / divisor
+        combined_count = count + chunk_count
+        delta = chunk_mean - mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = np.where(chunk_count == 0, variance, np.where(count == 0, chunk_variance, (
+                count * variance + chunk_count * chunk_variance + delta ** 2 * count * chunk_count / combined_count) /
+                combined_count))
+            mean = np.where(chunk_count == 0, mean, mean + delta * chunk_count / combined_count)
+        count = combined_count
+
+        for column_index, column_unique_values in enumerate(unique_values):
+            if column_unique_values is not None:
+                column_unique_values = np.union1d(column_unique_values, chunk[:, column_index].astype(
+                    columns[column_index].dtype))
+                if max_unique[column_index] is not None and column_unique_values.size > max_unique[column_index]:
+                    column_unique_values = None
+                unique_values[column_index] = column_unique_values
+
+    rows = len(columns[0]) if columns else 0
+    column_statistics = []
+    for column_index, column in enumerate(columns):
+        has_values = rows > 0
+        column_statistics.append({
+            'min': column.dtype.type(minimum[column_index]) if has_values else None,
+            'max': column.dtype.type(maximum[column_index]) if has_values else None,
+            'mean': np.float64(total[column_index] / rows) if has_values else np.float64(np.nan),
+            'variance': np.float64(variance[column_index]) if count[column_index] > 0 else np.float64(np.nan),
+            'unique': unique_values[column_index],
+            'range': (finite_minimum[column_index], finite_maximum[column_index]) if count[column_index] > 0 else None
+        })
+    return column_statistics
+
+
+def block_histograms(columns: List[np.ndarray], bins: List[int],
+                     ranges: List[Tuple[float, float]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Same as numpy.histogram with a range for every column of a block, in a single pass over the block. Values of all
+    columns are counted by one bincount per chunk.
+
+    :param columns: Dense columns of the same length
+    :param bins: Number of equal width bins of every column
+    :param ranges: Lower and upper bound of the bins of every column
+    :return: Counts and bin edges of every column
+    """
+    bins = np.asarray(bins, dtype=np.intp)
+    lower = np.array([float(value_range[0]) for value_range in ranges])
+    upper = np.array([float(value_range[1]) for value_range in ranges])
+    # Like numpy, empty ranges are widened
+    lower, upper = np.where(lower == upper, lower - 0.5, lower), np.where(lower == upper, upper + 0.5, upper)
+    edges = [np.linspace(lower[column_index], upper[column_index], bins[column_index] + 1)
+             for column_index in range(len(columns))]
+
+    count_offsets = np.concatenate([[0], np.cumsum(bins)[:-1]]).astype(np.intp)
+    edge_offsets = count_offsets + np.arange(len(columns))
+    all_edges = np.concatenate(edges) if edges else np.array([])
+    counts = np.zeros(int(np.sum(bins)), dtype=np.int64)
+    norm = bins / (upper - lower)
+
+    for chunk in iter_block_chunks(columns):
+        # Missing values and values outside of the range are not counted
+        with np.errstate(invalid='ignore'):
+            is_counted = (chunk >= lower) & (chunk <= upper)
+        values = chunk[is_counted]
+        column_indices = np.nonzero(is_counted)[1]
+
+        indices = ((values - lower[column_indices]) * norm[column_indices]).astype(np.intp)
+        indices[indices == bins[column_indices]] -= 1
+        # Correct rounding errors at the edges the way numpy does
+        is_below = values < all_edges[edge_offsets[column_indices] + indices]
+        indices[is_below] -= 1
+        is_above = (values >= all_edges[edge_offsets[column_indices] + indices + 1]) & \
+            (indices != bins[column_indices] - 1)
+        indices[is_above] += 1
+
+        counts += np.bincount(count_offsets[column_indices] + indices, minlength=counts.size)
+
+    return [(counts[count_offsets[column_index]:count_offsets[column_index] + bins[column_index]],
+             edges[column_index]) for column_index in range(len(columns))]
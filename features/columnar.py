@@ -0,0 +1,850 @@
+"""
+Binary columnar representation of a dataset, written once at ingestion next to the uploaded CSV.
+
+Every column is stored as its own .npy file and described by a small manifest, so loading a column is a memory
+mapped read of one file instead of parsing the whole CSV again. Columns that are mostly zero only store their non zero
+values together with the row indices of these values.
+
+Besides CSV files, which may be gzip or zstd compressed, Parquet and Arrow files and NPZ archives of one dimensional
+arrays are converted. Their columns are read batch by batch and keep their types.
+"""
+import gzip
+import io
+import json
+import os
+import shutil
+import struct
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Dict, Tuple, Iterator
+
+import numpy as np
+from pandas import read_csv, factorize
+from pandas.api.types import is_numeric_dtype
+
+from features.models import Dataset
+from features.sketches import ColumnSketch, MAX_UNIQUE
+from features.uploads import file_checksum, dataset_format, CSV, CSV_FORMATS, GZIP_CSV, ZSTD_CSV, PARQUET, ARROW
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+# Rows that are parsed at once while converting, bounds the memory needed for ingestion
+CHUNK_SIZE = 100000
+
+# Byte ranges of the CSV that are parsed concurrently and the size below which a file is not split any further
+PARSE_THREADS = os.cpu_count() or 1
+MIN_RANGE_SIZE = 64 * 1024 * 1024
+
+# Column files that are open at once while a binary source is converted, wide sources have thousands of columns
+MAX_OPEN_FILES = 64
+
+# Columns with fewer non zero values than this fraction of their rows are stored sparse
+SPARSE_DENSITY_THRESHOLD = 0.05
+
+# Rows of a dataset preview by default and at most
+PREVIEW_ROWS = 50
+MAX_PREVIEW_ROWS = 1000
+
+# Fixed size of the .npy headers, so that the row count can be written after all rows were appended
+_NPY_HEADER_LENGTH = 128
+
+
+def columnar_path(dataset: Dataset) -> str:
+    return '{0}.columns'.format(dataset.content.path)
+
+
+def _npy_header(dtype: np.dtype, rows: int) -> bytes:
+    header = "{{'descr': {0!r}, 'fortran_order': False, 'shape': ({1},), }}".format(
+        np.lib.format.dtype_to_descr(dtype), rows)
+    # Magic string, version 1.0 and header length take 10 bytes, the header is terminated by a newline
+    header = header.ljust(_NPY_HEADER_LENGTH - 10 - 1) + '\n'
+    return np.lib.format.MAGIC_PREFIX + b'\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def _fits_float32(values: np.ndarray) -> bool:
+    """
+    Float32 keeps 6 significant decimal digits when printed back, so values with at most 6 significant digits in the
+    source lose no precision when they are narrowed.
+    """
+    values = np.abs(values[np.isfinite(values) & (values != 0)])
+    if values.size == 0:
+        return True
+    if values.max() > np.finfo(np.float32).max or values.min() < np.finfo(np.float32).tiny:
+        return False
+
+    scaled = values * 10.0 ** (5 - np.floor(np.log10(values)))
+    return bool(np.all(np.abs(scaled - np.round(scaled)) < 1e-6))
+
+
+class _DtypeInference(object):
+    """
+    Collects what is needed to choose the narrowest dtype of a column while its chunks are parsed.
+    """
+    def __init__(self):
+        self.is_bool = True
+        self.is_integral = True
+        self.fits_float32 = True
+        self.min = None
+        self.max = None
+        self.count = 0
+        self.nonzero_count = 0
+
+    def update(self, values: np.ndarray):
+        self.is_bool = self.is_bool and values.dtype == np.bool_
+        # Floats of binary sources keep their precision
+        is_float32 = values.dtype in (np.float16, np.float32)
+        values = values.astype(float)
+        self.fits_float32 = self.fits_float32 and (is_float32 or _fits_float32(values))
+        # Missing values count as non zero, they have to be stored explicitly
+        self.count += values.size
+        self.nonzero_count += np.count_nonzero(values)
+        finite_values = values[np.isfinite(values)]
+
+        # Integer dtypes can't represent missing values
+        self.is_integral = self.is_integral and finite_values.size == values.size and \
+            bool(np.all(np.mod(finite_values, 1) == 0))
+        if finite_values.size > 0:
+            self.min = finite_values.min() if self.min is None else min(self.min, finite_values.min())
+            self.max = finite_values.max() if self.max is None else max(self.max, finite_values.max())
+
+    def merge(self, other: '_DtypeInference'):
+        # Combine with the inference of another part of the same column
+        self.is_bool = self.is_bool and other.is_bool
+        self.is_integral = self.is_integral and other.is_integral
+        self.fits_float32 = self.fits_float32 and other.fits_float32
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self.count += other.count
+        self.nonzero_count += other.nonzero_count
+
+    def dtype(self) -> np.dtype:
+        if self.min is None:
+            return np.dtype(float)
+        if self.is_bool:
+            return np.dtype(bool)
+        if self.is_integral:
+            candidates = (np.int8, np.int16, np.int32, np.int64) if self.min < 0 else \
+                (np.uint8, np.uint16, np.uint32, np.uint64)
+            for candidate in candidates:
+                if np.iinfo(candidate).min <= self.min and self.max <= np.iinfo(candidate).max:
+                    return np.dtype(candidate)
+        if self.fits_float32:
+            return np.dtype(np.float32)
+        return np.dtype(float)
+
+    def is_sparse(self) -> bool:
+        return self.count > 0 and self.nonzero_count < SPARSE_DENSITY_THRESHOLD * self.count
+
+
+class SparseColumn(object):
+    """
+    Column of which only the non zero values are stored, together with their ascending row indices. Statistics,
+    histograms, filters and indexing work on the stored values and account for the zeros without densifying them.
+    """
+    def __init__(self, indices: np.ndarray, values: np.ndarray, length: int):
+        self.indices = indices
+        self.values = values
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __array__(self, dtype=None):
+        return self.todense() if dtype is None else self.todense().astype(dtype)
+
+    def __getitem__(self, key) -> np.ndarray:
+        """
+        :param key: A slice, an array of row indices or a boolean mask
+        :return: Dense values of the selected rows
+        """
+        if isinstance(key, slice):
+            positions = np.arange(*key.indices(self.length))
+        else:
+            positions = np.asarray(key)
+            if positions.dtype == np.bool_:
+                positions = np.flatnonzero(positions)
+
+        # Positions that are not stored are zero
+        stored_positions = np.minimum(np.searchsorted(self.indices, positions), len(self.indices) - 1)
+        result = np.zeros(len(positions), dtype=self.dtype)
+        if len(self.indices) > 0:
+            is_stored = self.indices[stored_positions] == positions
+            result[is_stored] = self.values[stored_positions[is_stored]]
+        return result
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.values.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.indices.nbytes + self.values.nbytes
+
+    @property
+    def zero_count(self) -> int:
+        return self.length - len(self.values)
+
+    def todense(self) -> np.ndarray:
+        dense = np.zeros(self.length, dtype=self.dtype)
+        dense[self.indices] = self.values
+        return dense
+
+    def _distinct_values(self) -> np.ndarray:
+        # The stored values plus a single zero represent the value range of the whole column
+        if self.zero_count > 0:
+            return np.append(self.values, np.zeros(1, dtype=self.dtype))
+        return self.values
+
+    def min(self):
+        return np.amin(self._distinct_values())
+
+    def max(self):
+        return np.amax(self._distinct_values())
+
+    def mean(self):
+        return np.sum(self.values, dtype=float) / self.length
+
+    def nanvar(self):
+        values = self.values[~np.isnan(self.values)] if self.dtype.kind == 'f' else self.values
+        count = len(values) + self.zero_count
+        mean = np.sum(values, dtype=float) / count
+        return (np.sum((values - mean) ** 2) + self.zero_count * mean ** 2) / count
+
+    def unique(self) -> np.ndarray:
+        return np.unique(self._distinct_values())
+
+    def histogram(self, bins: int, value_range: Tuple[float, float]=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Same as numpy.histogram on the dense column.
+
+        :param value_range: Bounds of the bins or None for the bounds of the column
+        """
+        if value_range is None:
+            distinct_values = self._distinct_values()
+            value_range = (np.amin(distinct_values), np.amax(distinct_values))
+        counts, bin_edges = np.histogram(self.values, bins=bins, range=value_range)
+        if self.zero_count > 0:
+            zero_bin = min(max(np.searchsorted(bin_edges, 0, side='right') - 1, 0), len(counts) - 1)
+            counts[zero_bin] += self.zero_count
+        return counts, bin_edges
+
+    def mask(self, predicate: Callable[[np.ndarray], np.ndarray], start: int=0, stop: int=None) -> np.ndarray:
+        """
+        :param predicate: Vectorized condition on values
+        :param start: First row of the mask
+        :param stop: Row after the last row of the mask or None for the end of the column
+        :return: Boolean mask of the rows that fulfill the condition, the predicate is evaluated once for all zeros
+        """
+        stop = self.length if stop is None else stop
+        first, last = np.searchsorted(self.indices, [start, stop])
+        mask = np.full(stop - start, bool(predicate(np.zeros(1, dtype=self.dtype))[0]))
+        mask[self.indices[first:last] - start] = predicate(self.values[first:last])
+        return mask
+
+
+def _encode(values: np.ndarray, dictionary: Dict[str, int]) -> np.ndarray:
+    """
+    Replace labels by their integer codes, labels that were not seen in earlier chunks are added to the dictionary.
+    Missing values get the code -1.
+    """
+    chunk_codes, chunk_labels = factorize(values)
+    # Appending -1 maps the missing values' code -1 to itself
+    codes = np.array([dictionary.setdefault(label, len(dictionary)) for label in chunk_labels] + [-1])
+    return codes[chunk_codes]
+
+
+def _narrow_column(path: str, dtype: np.dtype):
+    # Rewrite a float64 file with its narrower dtype, reading the source memory mapped chunk by chunk
+    source = np.load(path, mmap_mode='r')
+    with open(path + '.tmp', 'wb') as column_file:
+        column_file.write(_npy_header(dtype, len(source)))
+        for start in range(0, len(source), CHUNK_SIZE):
+            column_file.write(np.ascontiguousarray(source[start:start + CHUNK_SIZE], dtype=dtype).data)
+    del source
+    os.replace(path + '.tmp', path)
+
+
+def _sparsify_column(path: str, indices_path: str, dtype: np.dtype):
+    # Split a float64 file into the row indices and the narrowed values of its non zero entries
+    source = np.load(path, mmap_mode='r')
+    index_dtype = np.min_scalar_type(max(len(source) - 1, 0))
+    nonzero_count = 0
+    with open(indices_path, 'wb') as indices_file, open(path + '.tmp', 'wb') as values_file:
+        indices_file.write(_npy_header(index_dtype, nonzero_count))
+        values_file.write(_npy_header(dtype, nonzero_count))
+        for start in range(0, len(source), CHUNK_SIZE):
+            chunk = source[start:start + CHUNK_SIZE]
+            chunk_indices = np.flatnonzero(chunk)
+            indices_file.write(np.ascontiguousarray(chunk_indices + start, dtype=index_dtype).data)
+            values_file.write(np.ascontiguousarray(chunk[chunk_indices], dtype=dtype).data)
+            nonzero_count += len(chunk_indices)
+
+        indices_file.seek(0)
+        indices_file.write(_npy_header(index_dtype, nonzero_count))
+        values_file.seek(0)
+        values_file.write(_npy_header(dtype, nonzero_count))
+    del source
+    os.replace(path + '.tmp', path)
+
+
+def _line_aligned_ranges(path: str, parts: int) -> List[Tuple[int, int]]:
+    """
+    Split the rows of a CSV into byte ranges of about equal size that start at the beginning of a line. Quoted values
+    that contain line breaks are not supported.
+
+    :param path: Path of the CSV
+    :param parts: Maximum number of ranges
+    :return: Start and stop offsets of the ranges, the header line is not part of any range
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as csv_file:
+        csv_file.readline()
+        boundaries = [csv_file.tell()]
+        parts = max(min(parts, (size - boundaries[0]) // MIN_RANGE_SIZE), 1)
+        for part in range(1, parts):
+            # Reading the rest of the line from one byte before the split also aligns splits that hit a line start
+            csv_file.seek(boundaries[0] + (size - boundaries[0]) * part // parts - 1)
+            csv_file.readline()
+            boundaries.append(min(max(csv_file.tell(), boundaries[-1]), size))
+        boundaries.append(size)
+
+    return [(start, stop) for start, stop in zip(boundaries, boundaries[1:]) if stop > start]
+
+
+class _RangeReader(io.RawIOBase):
+    """
+    Reads a byte range of a file as if it was the whole file.
+    """
+    def __init__(self, path: str, start: int, stop: int):
+        super().__init__()
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = stop - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.file.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def _parse_range(range_file, column_names: List[str], string_column_names: List[str], part_path: str) -> Dict:
+    """
+    Parse a byte range of a CSV, given as binary file object that is closed afterwards, chunk by chunk into a single
+    float64 file, that holds the columns of every chunk one
+    after another. Text columns are encoded with dictionaries that are local to the range.
+
+    :return: Dictionary with the offset and row count of every chunk in the part file, the dtype inference and sketch
+        of every column that is not text and the dictionaries of the text columns
+    """
+    chunks = []
+    inferences = [_DtypeInference() for _ in column_names]
+    sketches = [ColumnSketch(max_unique=MAX_UNIQUE) for _ in column_names]
+    dictionaries = {column_name: {} for column_name in string_column_names}
+
+    string_dtypes = {column_name: str for column_name in string_column_names}
+    with range_file, open(part_path, 'wb') as part_file:
+        for chunk in read_csv(range_file, header=None, names=column_names, chunksize=CHUNK_SIZE,
+                              dtype=string_dtypes):
+            chunks.append((part_file.tell(), len(chunk)))
+            for column_name, inference, sketch in zip(column_names, inferences, sketches):
+                values = chunk[column_name].values
+                if column_name in dictionaries:
+                    values = _encode(values, dictionaries[column_name])
+                else:
+                    inference.update(values)
+                    sketch.update(values)
+                part_file.write(np.ascontiguousarray(values, dtype=float).data)
+
+    return {'chunks': chunks, 'inferences': inferences, 'sketches': sketches, 'dictionaries': dictionaries}
+
+
+def _sketch_codes(sketch: ColumnSketch, codes: np.ndarray):
+    # Missing text has the code -1, the sketch has to count it as missing instead of as a value
+    sketch.update(np.where(codes < 0, np.nan, codes))
+
+
+def _concatenate_column(path: str, column_index: int, column_count: int, parts: List[Dict], part_paths: List[str],
+                        rows: int, code_mappings: List[np.ndarray]=None, sketch: ColumnSketch=None) -> _DtypeInference:
+    """
+    Write one column of all part files in order into a float64 .npy file.
+
+    :param code_mappings: For text columns, the merged code of every local code per part, with -1 appended
+    :param sketch: Sketch that is updated with the written values, if any
+    :return: Dtype inference of the written values
+    """
+    inference = _DtypeInference()
+    with open(path, 'wb') as column_file:
+        column_file.write(_npy_header(np.dtype(float), rows))
+        for part_index, (part, part_path) in enumerate(zip(parts, part_paths)):
+            with open(part_path, 'rb') as part_file:
+                for offset, chunk_rows in part['chunks']:
+                    part_file.seek(offset + column_index * chunk_rows * np.dtype(float).itemsize)
+                    values = np.fromfile(part_file, dtype=float, count=chunk_rows)
+                    if code_mappings is not None:
+                        values = code_mappings[part_index][values.astype(int)].astype(float)
+                    inference.update(values)
+                    if sketch is not None and code_mappings is not None:
+                        _sketch_codes(sketch, values)
+                    elif sketch is not None:
+                        sketch.update(values)
+                    column_file.write(values.data)
+    return inference
+
+
+def _open_csv(path: str, file_format: str):
+    if file_format == GZIP_CSV:
+        return gzip.open(path, 'rb')
+    if file_format == ZSTD_CSV:
+        # Optional dependency, only needed for zstd compressed files
+        import zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'rb')
+
+
+def _write_csv_columns(path: str, file_format: str, directory: str, progress: Callable[[float], None]) -> Tuple:
+    """
+    :return: Columns of the manifest, dictionaries of the text columns, dtype inferences, sketches and the row count
+    """
+    # Columns that start with text are dictionary encoded
+    with _open_csv(path, file_format) as csv_file:
+        first_chunk = read_csv(csv_file, nrows=CHUNK_SIZE)
+    column_names = list(first_chunk.columns)
+    string_column_names = [column_name for column_name in column_names
+                           if not is_numeric_dtype(first_chunk[column_name].dtype)]
+    dictionaries = {column_name: {} for column_name in string_column_names}
+    del first_chunk
+
+    columns = [{'name': column_name, 'file': '{0}.npy'.format(column_index), 'dtype': np.dtype(float).str}
+               for column_index, column_name in enumerate(column_names)]
+
+    # Parse byte ranges of the CSV in parallel as float64 and narrow the binary files afterwards, compressed files
+    # can only be read as a whole
+    if file_format == CSV:
+        ranges = _line_aligned_ranges(path, PARSE_THREADS)
+        range_files = [io.BufferedReader(_RangeReader(path, start, stop)) for start, stop in ranges]
+    else:
+        ranges = [(0, os.path.getsize(path))]
+        range_files = [_open_csv(path, file_format)]
+        # Like the byte ranges, the decompressed stream has to start after the header line
+        range_files[0].readline()
+    part_paths = [os.path.join(directory, 'part{0}.bin'.format(part)) for part in range(len(ranges))]
+    try:
+        with ThreadPoolExecutor(max_workers=PARSE_THREADS) as executor:
+            # Parts are stitched together in the order of their ranges, completion order only drives the progress
+            futures = [executor.submit(_parse_range, range_file, column_names, string_column_names, part_path)
+                       for range_file, part_path in zip(range_files, part_paths)]
+            range_sizes = [stop - start for start, stop in ranges]
+
+            parsed_bytes = 0
+            range_indices = {future: range_index for range_index, future in enumerate(futures)}
+            for future in as_completed(futures):
+                parsed_bytes += range_sizes[range_indices[future]]
+                if progress is not None:
+                    progress(parsed_bytes / max(sum(range_sizes), 1))
+
+        parts = [future.result() for future in futures]
+        rows = sum(sum(chunk_rows for _, chunk_rows in part['chunks']) for part in parts)
+
+        inferences = []
+        sketches = []
+        for column_index, column in enumerate(columns):
+            if column['name'] in dictionaries:
+                # Codes of every range refer to its own dictionary, they are translated to the merged one
+                code_mappings = []
+                for part in parts:
+                    part_dictionary = part['dictionaries'][column['name']]
+                    labels = sorted(part_dictionary.keys(), key=part_dictionary.get)
+                    code_mappings.append(np.array([dictionaries[column['name']].setdefault(label, len(
+                        dictionaries[column['name']])) for label in labels] + [-1]))
+                # Codes only become comparable across ranges after the translation
+                sketch = ColumnSketch(max_unique=MAX_UNIQUE)
+                inferences.append(_concatenate_column(os.path.join(directory, column['file']), column_index,
+                                                      len(columns), parts, part_paths, rows, code_mappings, sketch))
+                sketches.append(sketch)
+            else:
+                _concatenate_column(os.path.join(directory, column['file']), column_index, len(columns), parts,
+                                    part_paths, rows)
+                inference = _DtypeInference()
+                sketch = ColumnSketch(max_unique=MAX_UNIQUE)
+                for part in parts:
+                    inference.merge(part['inferences'][column_index])
+                    sketch.merge(part['sketches'][column_index])
+                inferences.append(inference)
+                sketches.append(sketch)
+    finally:
+        for part_path in part_paths:
+            try:
+                os.remove(part_path)
+            except FileNotFoundError:
+                pass
+
+    return columns, dictionaries, inferences, sketches, rows
+
+
+def _arrow_values(array) -> np.ndarray:
+    import pyarrow
+
+    if pyarrow.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    if pyarrow.types.is_boolean(array.type) and array.null_count > 0:
+        # Missing values become NaN as in parsed CSV files, integers with missing values are converted by numpy
+        array = array.cast(pyarrow.float64())
+    return array.to_numpy(zero_copy_only=False)
+
+
+def _arrow_chunks(batches, row_count: int) -> Iterator[Tuple[int, np.ndarray, float]]:
+    read_rows = 0
+    for batch in batches:
+        read_rows += batch.num_rows
+        for column_index, array in enumerate(batch.columns):
+            yield column_index, _arrow_values(array), read_rows / max(row_count, 1)
+
+
+def _parquet_chunks(path: str) -> Tuple[List[str], Iterator[Tuple[int, np.ndarray, float]]]:
+    # Optional dependency, only needed for Parquet and Arrow files
+    import pyarrow.parquet
+
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    return parquet_file.schema_arrow.names, _arrow_chunks(parquet_file.iter_batches(batch_size=CHUNK_SIZE),
+                                                          parquet_file.metadata.num_rows)
+
+
+def _arrow_file_chunks(path: str) -> Tuple[List[str], Iterator[Tuple[int, np.ndarray, float]]]:
+    import pyarrow
+
+    # Batches of a memory mapped file are read without copying
+    reader = pyarrow.ipc.open_file(pyarrow.memory_map(path))
+    batches = [reader.get_batch(batch_index) for batch_index in range(reader.num_record_batches)]
+    return reader.schema.names, _arrow_chunks(batches, sum(batch.num_rows for batch in batches))
+
+
+def _npz_chunks(path: str) -> Tuple[List[str], Iterator[Tuple[int, np.ndarray, float]]]:
+    npz_file = np.load(path, allow_pickle=False)
+
+    def chunks():
+        # Arrays are decompressed one at a time
+        with npz_file:
+            for column_index, column_name in enumerate(npz_file.files):
+                values = npz_file[column_name]
+                if values.ndim != 1:
+                    raise ValueError('Array {0} is not one dimensional'.format(column_name))
+                for start in range(0, len(values), CHUNK_SIZE):
+                    yield column_index, values[start:start + CHUNK_SIZE], (column_index + 1) / len(npz_file.files)
+
+    return list(npz_file.files), chunks()
+
+
+def _write_binary_columns(column_names: List[str], chunks: Iterator[Tuple[int, np.ndarray, float]], directory: str,
+                          progress: Callable[[float], None]) -> Tuple:
+    """
+    Append the chunks of a binary source to float64 files like parsed CSV files, the inferences keep integers, bools
+    and float32 as they were. Everything that is not a number is dictionary encoded as text.
+
+    :param chunks: Column index, values and the read fraction of the source of every chunk
+    :return: Columns of the manifest, dictionaries of the text columns, dtype inferences, sketches and the row count
+    """
+    columns = [{'name': column_name, 'file': '{0}.npy'.format(column_index), 'dtype': np.dtype(float).str}
+               for column_index, column_name in enumerate(column_names)]
+    dictionaries = {}
+    inferences = [_DtypeInference() for _ in columns]
+    sketches = [ColumnSketch(max_unique=MAX_UNIQUE) for _ in columns]
+    column_rows = [0] * len(columns)
+    reported_fraction = 0
+
+    for column in columns:
+        with open(os.path.join(directory, column['file']), 'wb') as column_file:
+            column_file.write(_npy_header(np.dtype(float), 0))
+
+    # Chunks are appended through the least recently used files, so only a bounded number of them is open
+    column_files = OrderedDict()
+    try:
+        for column_index, values, fraction in chunks:
+            if values.dtype.kind not in 'biuf':
+                if values.dtype.kind != 'O':
+                    values = values.astype(str).astype(object)
+                values = _encode(values, dictionaries.setdefault(columns[column_index]['name'], {}))
+                _sketch_codes(sketches[column_index], values)
+            else:
+                sketches[column_index].update(values)
+            inferences[column_index].update(values)
+            if column_index in column_files:
+                column_files.move_to_end(column_index)
+            else:
+                if len(column_files) >= MAX_OPEN_FILES:
+                    column_files.popitem(last=False)[1].close()
+                column_files[column_index] = open(os.path.join(directory, columns[column_index]['file']), 'ab')
+            column_files[column_index].write(np.ascontiguousarray(values, dtype=float).data)
+            column_rows[column_index] += len(values)
+
+            # Every saved progress is broadcast, so it is only reported in steps of a percent
+            if progress is not None and (fraction - reported_fraction >= 0.01 or
+                                         (fraction == 1 and reported_fraction < 1)):
+                reported_fraction = fraction
+                progress(fraction)
+
+    finally:
+        for column_file in column_files.values():
+            column_file.close()
+
+    if len(set(column_rows)) > 1:
+        raise ValueError('Columns have different lengths')
+
+    for column, rows in zip(columns, column_rows):
+        with open(os.path.join(directory, column['file']), 'r+b') as column_file:
+            column_file.write(_npy_header(np.dtype(float), rows))
+
+    return columns, dictionaries, inferences, sketches, column_rows[0] if column_rows else 0
+
+
+def write_columnar(dataset: Dataset, progress: Callable[[float], None]=None) -> Dict:
+    """
+    Convert the content of a dataset chunk by chunk into one .npy file per column and write the manifest last, so that
+    a manifest always describes complete files. Line aligned byte ranges of uncompressed CSV files are parsed
+    concurrently, the column types of CSV files are inferred from the first rows.
+
+    Every column gets the narrowest dtype that holds its values: bools take one byte, integers the smallest width
+    that fits and floats with few enough significant digits or from float32 sources are stored as float32. Text
+    columns are stored as integer codes and their labels are written once per column. Columns that are mostly zero
+    are stored sparse.
+
+    :param dataset: The dataset to convert
+    :param progress: Called with the converted fraction of the content as conversion proceeds
+    :return: The manifest
+    """
+    directory = columnar_path(dataset)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+    file_format = dataset_format(dataset)
+    if file_format in CSV_FORMATS:
+        columns, dictionaries, inferences, sketches, rows = _write_csv_columns(dataset.content.path, file_format,
+                                                                               directory, progress)
+    else:
+        readers = {PARQUET: _parquet_chunks, ARROW: _arrow_file_chunks}
+        column_names, chunks = readers.get(file_format, _npz_chunks)(dataset.content.path)
+        columns, dictionaries, inferences, sketches, rows = _write_binary_columns(column_names, chunks, directory,
+                                                                                  progress)
+
+    for column in columns:
+        if column['name'] in dictionaries:
+            column['labels'] = column['file'].replace('.npy', '.labels.json')
+            dictionary = dictionaries[column['name']]
+            with open(os.path.join(directory, column['labels']), 'w') as labels_file:
+                # Labels of binary sources can be objects like dates or decimals
+                json.dump(sorted(dictionary.keys(), key=dictionary.get), labels_file, default=str)
+
+    for column, inference, sketch in zip(columns, inferences, sketches):
+        column['statistics'] = sketch.summary()
+        dtype = inference.dtype()
+        if inference.is_sparse():
+            column['indices'] = column['file'].replace('.npy', '.indices.npy')
+            _sparsify_column(os.path.join(directory, column['file']), os.path.join(directory, column['indices']),
+                             dtype)
+        elif dtype != np.dtype(column['dtype']):
+            _narrow_column(os.path.join(directory, column['file']), dtype)
+        column['dtype'] = dtype.str
+
+    # The checksum identifies the source, so that copies of the columns can be checked against it
+    manifest = {'version': MANIFEST_VERSION, 'rows': rows, 'columns': columns,
+                'checksum': dataset.checksum or file_checksum(dataset.content.path)}
+    with open(os.path.join(directory, MANIFEST_NAME + '.tmp'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(os.path.join(directory, MANIFEST_NAME + '.tmp'), os.path.join(directory, MANIFEST_NAME))
+
+    return manifest
+
+
+def read_manifest(dataset: Dataset) -> Dict:
+    """
+    :param dataset: The dataset
+    :return: The manifest of the dataset's columnar files or None if they were not written (yet)
+    """
+    try:
+        with open(os.path.join(columnar_path(dataset), MANIFEST_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def open_columns(dataset: Dataset, manifest: Dict, column_names: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Memory map columns from disk without reading them.
+
+    :param dataset: The dataset
+    :param manifest: The dataset's manifest
+    :param column_names: Names of the columns to open
+    :return: Mapping from column name to a read-only memory map of its file or a SparseColumn of memory maps
+    """
+    directory = columnar_path(dataset)
+    columns = {column['name']: column for column in manifest['columns']}
+
+    opened_columns = {}
+    for column_name in column_names:
+        column = columns[column_name]
+        values = np.load(os.path.join(directory, column['file']), mmap_mode='r')
+        if 'indices' in column:
+            indices = np.load(os.path.join(directory, column['indices']), mmap_mode='r')
+            opened_columns[column_name] = SparseColumn(indices, values, manifest['rows'])
+        else:
+            opened_columns[column_name] = values
+    return opened_columns
+
+
+def columnar_size(dataset: Dataset, manifest: Dict) -> int:
+    """
+    :param dataset: The dataset
+    :param manifest: The dataset's manifest
+    :return: Bytes of all column files, which is what loading the whole dataset into memory takes
+    """
+    directory = columnar_path(dataset)
+    files = [column['file'] for column in manifest['columns']] + \
+        [column['indices'] for column in manifest['columns'] if 'indices' in column]
+    return sum(os.path.getsize(os.path.join(directory, file)) for file in files)
+
+
+def read_labels(dataset: Dataset, manifest: Dict, column_name: str) -> List[str]:
+    """
+    :param dataset: The dataset
+    :param manifest: The dataset's manifest
+    :param column_name: Name of the column
+    :return: Labels of a dictionary encoded column indexed by their code or None for numeric columns
+    """
+    column = next(column for column in manifest['columns'] if column['name'] == column_name)
+    if 'labels' not in column:
+        return None
+    with open(os.path.join(columnar_path(dataset), column['labels'])) as labels_file:
+        return json.load(labels_file)
+
+
+def column_values(values: np.ndarray, labels: List[str]=None) -> list:
+    """
+    Python values of a column. Float32 values are printed with the 7 significant digits they hold, so that narrowed
+    columns return the values of their source instead of the nearest float32.
+
+    :param labels: Labels of a dictionary encoded text column, its codes are returned as their labels and missing
+        values as None
+    """
+    values = np.asarray(values)
+    if labels is not None:
+        return [labels[code] if code >= 0 else None for code in values.astype(int).tolist()]
+    if values.dtype == np.float32:
+        return [float('%.7g' % value) for value in values.tolist()]
+    return values.tolist()
+
+
+def _preview_values(values: np.ndarray, labels: List[str]=None) -> list:
+    # NaN is not valid JSON, so missing numbers and text become None
+    if labels is not None:
+        return column_values(values, labels)
+    if values.dtype.kind == 'f':
+        return [None if np.isnan(value) else value for value in column_values(values)]
+    if values.dtype.kind in 'biu':
+        return values.tolist()
+    return [None if value is None or value != value else str(value) for value in values.tolist()]
+
+
+def _csv_head(path: str, file_format: str, rows: int) -> Dict[str, np.ndarray]:
+    with _open_csv(path, file_format) as csv_file:
+        head = read_csv(csv_file, nrows=rows)
+    # Like while parsing, columns that start with text are text
+    return {column_name: head[column_name].values if is_numeric_dtype(head[column_name].dtype) else
+            np.asarray(head[column_name].values, dtype=object) for column_name in head.columns}
+
+
+def _arrow_head(column_names: List[str], batches, rows: int) -> Dict[str, np.ndarray]:
+    arrays = [[] for _ in column_names]
+    read_rows = 0
+    for batch in batches:
+        if read_rows >= rows:
+            break
+        for column_arrays, array in zip(arrays, batch.columns):
+            column_arrays.append(_arrow_values(array))
+        read_rows += batch.num_rows
+    return {column_name: np.concatenate(column_arrays)[:rows] if column_arrays else np.array([])
+            for column_name, column_arrays in zip(column_names, arrays)}
+
+
+def _npz_head(path: str, rows: int) -> Dict[str, np.ndarray]:
+    # Only the beginning of every array is decompressed, numpy.load would decompress whole arrays
+    head = {}
+    with zipfile.ZipFile(path) as archive:
+        for member_name in archive.namelist():
+            with archive.open(member_name) as member:
+                if np.lib.format.read_magic(member) == (1, 0):
+                    shape, _, dtype = np.lib.format.read_array_header_1_0(member)
+                else:
+                    shape, _, dtype = np.lib.format.read_array_header_2_0(member)
+                column_name = member_name[:-len('.npy')] if member_name.endswith('.npy') else member_name
+                if len(shape) != 1 or dtype.hasobject:
+                    raise ValueError('Array {0} is not one dimensional or holds objects'.format(column_name))
+                count = min(rows, shape[0])
+                head[column_name] = np.frombuffer(member.read(count * dtype.itemsize), dtype=dtype, count=count)
+    return head
+
+
+def read_preview(dataset: Dataset, rows: int) -> Dict:
+    """
+    Read the first rows of a dataset without loading it. They come from the columnar files if they were written and
+    otherwise from the head of the stored content, whose dtypes are inferred from the read rows only.
+
+    :param dataset: The dataset
+    :param rows: Maximum number of rows
+    :return: Name, dtype and whether it is text of every column together with the rows as lists of values
+    """
+    manifest = read_manifest(dataset)
+    if manifest is not None:
+        columns = [{'name': column['name'], 'dtype': column['dtype'], 'text': 'labels' in column}
+                   for column in manifest['columns']]
+        opened_columns = open_columns(dataset, manifest, [column['name'] for column in columns])
+        values = [_preview_values(np.asarray(opened_columns[column['name']][:rows]),
+                                  read_labels(dataset, manifest, column['name'])) for column in columns]
+        return {'columns': columns, 'rows': [list(row) for row in zip(*values)]}
+
+    path = dataset.content.path
+    file_format = dataset_format(dataset)
+    if file_format in CSV_FORMATS:
+        head = _csv_head(path, file_format, rows)
+    elif file_format == PARQUET:
+        import pyarrow.parquet
+
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        head = _arrow_head(parquet_file.schema_arrow.names, parquet_file.iter_batches(batch_size=max(rows, 1)), rows)
+    elif file_format == ARROW:
+        import pyarrow
+
+        reader = pyarrow.ipc.open_file(pyarrow.memory_map(path))
+        head = _arrow_head(reader.schema.names, (reader.get_batch(batch_index) for batch_index in range(
+            reader.num_record_batches)), rows)
+    else:
+        head = _npz_head(path, rows)
+
+    columns = []
+    values = []
+    for column_name, column_values in head.items():
+        if column_values.dtype.kind in 'biuf':
+            inference = _DtypeInference()
+            inference.update(column_values)
+            columns.append({'name': column_name, 'dtype': inference.dtype().str, 'text': False})
+        else:
+            columns.append({'name': column_name, 'dtype': np.dtype(object).str, 'text': True})
+        values.append(_preview_values(column_values))
+    return {'columns': columns, 'rows': [list(row) for row in zip(*values)]}
+
+
+def remove_columnar(dataset: Dataset):
+    shutil.rmtree(columnar_path(dataset), ignore_errors=True)
@@ -0,0 +1,189 @@
+"""
+Reuse of everything that was derived from a dataset when the same content is uploaded again. Datasets are identified
+by the checksum of their content, the columnar files of a duplicate are linked and its features, histograms,
+spectrograms and the results and densities of its targets are copied instead of being calculated again.
+"""
+import os
+import shutil
+from typing import Dict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from hics.scored_slices import ScoredSlices
+
+from features.bulk import BULK_BATCH_SIZE
+from features.columnar import columnar_path, read_manifest, MANIFEST_NAME
+from features.models import Dataset, Feature, Histogram, Spectrogram, ResultCalculationMap, Calculation, Relevancy, \
+    Redundancy, Slice, Density
+
+
+def _link_or_copy(source_path: str, path: str):
+    # Hard links share the data and survive the removal of the source, copies are needed across file systems
+    try:
+        os.link(source_path, path)
+    except OSError:
+        shutil.copyfile(source_path, path)
+
+
+def find_duplicate(dataset: Dataset) -> Dataset:
+    """
+    :param dataset: The dataset
+    :return: A completely processed dataset with the same content and columnar files or None if there is none
+    """
+    if not dataset.checksum:
+        return None
+
+    duplicates = Dataset.objects.filter(checksum=dataset.checksum, status=Dataset.DONE).exclude(id=dataset.id)
+    for duplicate in duplicates:
+        if read_manifest(duplicate) is not None:
+            return duplicate
+    return None
+
+
+def copy_columnar(source: Dataset, dataset: Dataset):
+    """
+    Link the columnar files of a dataset with the same content, the manifest is linked last.
+    """
+    source_directory = columnar_path(source)
+    directory = columnar_path(dataset)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+    file_names = sorted(os.listdir(source_directory), key=lambda file_name: file_name == MANIFEST_NAME)
+    for file_name in file_names:
+        _link_or_copy(os.path.join(source_directory, file_name), os.path.join(directory, file_name))
+
+
+def copy_features(source: Dataset, dataset: Dataset) -> Dict[str, Feature]:
+    """
+    Copy the features of a dataset with the same content together with their statistics, histograms and spectrograms.
+
+    :return: Mapping from the name of every feature to its copy
+    """
+    source_features = list(Feature.objects.filter(dataset=source))
+    features = {}
+    for source_feature in source_features:
+        features[source_feature.name] = Feature(name=source_feature.name, dataset=dataset, mean=source_feature.mean,
+                                                variance=source_feature.variance, min=source_feature.min,
+                                                max=source_feature.max, is_categorical=source_feature.is_categorical,
+                                                categories=source_feature.categories, dtype=source_feature.dtype,
+                                                labels=source_feature.labels,
+                                                missing_count=source_feature.missing_count,
+                                                distinct_count=source_feature.distinct_count,
+                                                skewness=source_feature.skewness, kurtosis=source_feature.kurtosis,
+                                                quantiles=source_feature.quantiles, stage=source_feature.stage)
+
+    with transaction.atomic():
+        Feature.objects.bulk_create(features.values(), batch_size=BULK_BATCH_SIZE)
+        feature_ids = {source_feature.id: features[source_feature.name] for source_feature in source_features}
+
+        Histogram.objects.bulk_create([Histogram(
+            feature=feature_ids[histogram.feature_id], bin_edges=histogram.bin_edges, counts=histogram.counts,
+            levels=histogram.levels) for histogram in Histogram.objects.filter(feature__dataset=source)],
+            batch_size=BULK_BATCH_SIZE)
+
+        # Images are looked up by the feature id, so they need their own name
+        os.makedirs('{0}/spectrograms'.format(settings.MEDIA_ROOT), exist_ok=True)
+        spectrograms = []
+        for spectrogram in Spectrogram.objects.filter(feature__dataset=source):
+            feature = feature_ids[spectrogram.feature_id]
+            filename = '{0}/spectrograms/{1}.png'.format(settings.MEDIA_ROOT, feature.id)
+            _link_or_copy(spectrogram.image.path, filename)
+            spectrograms.append(Spectrogram(feature=feature, width=spectrogram.width, height=spectrogram.height,
+                                            image=filename))
+        Spectrogram.objects.bulk_create(spectrograms, batch_size=BULK_BATCH_SIZE)
+
+    return features
+
+
+def copy_results(result_calculation_map: ResultCalculationMap) -> bool:
+    """
+    Copy the latest results of the same target in a dataset with the same content, if its default HiCS calculation is
+    complete.
+
+    :param result_calculation_map: The empty result calculation map of a target
+    :return: Whether results were copied
+    """
+    target = result_calculation_map.target
+    if not target.dataset.checksum:
+        return False
+
+    source_map = ResultCalculationMap.objects.filter(
+        target__name=target.name, target__dataset__checksum=target.dataset.checksum,
+        calculation__type=Calculation.DEFAULT_HICS,
+        calculation__current_iteration=F('calculation__max_iteration')).exclude(
+        id=result_calculation_map.id).order_by('created_at').last()
+    if source_map is None:
+        return False
+
+    features = {feature.name: feature for feature in Feature.objects.filter(dataset=target.dataset)}
+
+    def copy_features_of(source_features):
+        return [features[source_feature.name] for source_feature in source_features.all()]
+
+    def name_mapping(name):
+        return str(features[name].id)
+
+    with transaction.atomic():
+        # Calculations that are still running would never complete for the copy
+        for calculation in Calculation.objects.filter(result_calculation_map=source_map,
+                                                      current_iteration=F('max_iteration')):
+            calculation_features = copy_features_of(calculation.features)
+            calculation.pk = None
+            calculation.result_calculation_map = result_calculation_map
+            calculation.save()
+            calculation.features.set(calculation_features)
+
+        for relevancy in Relevancy.objects.filter(result_calculation_map=source_map):
+            relevancy_features = copy_features_of(relevancy.features)
+            relevancy.pk = None
+            relevancy.result_calculation_map = result_calculation_map
+            relevancy.save()
+            relevancy.features.set(relevancy_features)
+
+        for slice in Slice.objects.filter(result_calculation_map=source_map):
+            slice_features = copy_features_of(slice.features)
+            slice.pk = None
+            slice.result_calculation_map = result_calculation_map
+            # The output refers to features by id, so it is rebuilt for the features of the copy
+            slice.output_definition = ScoredSlices.from_dict(slice.object_definition).to_output(name_mapping)
+            slice.save()
+            slice.features.set(slice_features)
+
+        Redundancy.objects.bulk_create([Redundancy(
+            result_calculation_map=result_calculation_map, first_feature=features[redundancy.first_feature.name],
+            second_feature=features[redundancy.second_feature.name], redundancy=redundancy.redundancy,
+            weight=redundancy.weight) for redundancy in Redundancy.objects.filter(
+            result_calculation_map=source_map).select_related('first_feature', 'second_feature')],
+            batch_size=BULK_BATCH_SIZE)
+
+    return True
+
+
+def copy_densities(target: Feature) -> bool:
+    """
+    Copy the densities of the same target in a dataset with the same content. Densities that the source did not
+    calculate yet are left to be calculated on selection.
+
+    :param target: A target without densities
+    :return: Whether densities were copied
+    """
+    if not target.dataset.checksum:
+        return False
+
+    source_target = Feature.objects.filter(
+        name=target.name, dataset__checksum=target.dataset.checksum, target_densities__isnull=False).exclude(
+        id=target.id).distinct().first()
+    if source_target is None:
+        return False
+
+    features = {feature.name: feature for feature in Feature.objects.filter(dataset=target.dataset)}
+    with transaction.atomic():
+        Density.objects.filter(target=target).delete()
+        Density.objects.bulk_create([Density(
+            target=target, feature=features[density.feature.name], target_classes=density.target_classes,
+            values=density.values) for density in Density.objects.filter(target=source_target).select_related(
+            'feature')], batch_size=BULK_BATCH_SIZE)
+
+    return True
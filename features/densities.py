@@ -0,0 +1,152 @@
+"""
+Gaussian kernel density estimates of features conditioned on every class of a target. The values of all classes are
+linearly binned onto a fine grid at once and convolved with their kernels in the frequency domain, so the cost depends
+on the number of rows only through a single binning pass per feature.
+"""
+from typing import List, Tuple, Dict
+
+import numpy as np
+
+# Points at which densities are evaluated, evenly spaced from the feature's minimum to its maximum
+DENSITY_POINTS = 100
+
+# Grid points the values are binned onto, bandwidths are never finer than the grid
+GRID_SIZE = 1024
+
+# Kernels are cut off after this many bandwidths
+KERNEL_WIDTH = 4
+
+# Persisted densities are only displayed, single precision is plenty
+_DENSITY_DTYPE = np.dtype('<f4')
+
+
+def pack_densities(densities: np.ndarray) -> bytes:
+    return np.asarray(densities, dtype=_DENSITY_DTYPE).tobytes()
+
+
+def unpack_densities(data, categories: int) -> np.ndarray:
+    """
+    :return: Density of every category at every point
+    """
+    return np.frombuffer(data, dtype=_DENSITY_DTYPE).reshape(categories, -1)
+
+
+def density_list(categories: List, densities: np.ndarray) -> List[Dict]:
+    """
+    :return: Target class and density values of every category
+    """
+    return [{'target_class': category, 'density_values': density_values.tolist()}
+            for category, density_values in zip(categories, densities)]
+
+
+def silverman_bandwidth(values: np.ndarray) -> float:
+    """
+    :return: Bandwidth after Silverman's rule of thumb or 0 if the values don't spread
+    """
+    if values.size < 2:
+        return 0.0
+    lower_quartile, upper_quartile = np.percentile(values, [25, 75])
+    spread = np.std(values, ddof=1)
+    if upper_quartile > lower_quartile:
+        spread = min(spread, (upper_quartile - lower_quartile) / 1.34)
+    return float(0.9 * spread * values.size ** -0.2)
+
+
+def class_codes(classes: np.ndarray, categories: List) -> np.ndarray:
+    """
+    :param classes: Target class of every row
+    :param categories: Target classes to estimate densities for
+    :return: Index of every row's class in categories or -1 if it is none of them
+    """
+    classes = np.asarray(classes, dtype=float)
+    categories = np.asarray(categories, dtype=float)
+    if categories.size == 0:
+        return np.full(classes.size, -1, dtype=int)
+    order = np.argsort(categories)
+    positions = np.minimum(np.searchsorted(categories[order], classes), categories.size - 1)
+    return np.where(categories[order][positions] == classes, order[positions], -1)
+
+
+def feature_densities(columns: List[np.ndarray], codes: np.ndarray, category_count: int,
+                      ranges: List[Tuple[float, float]], points: int=DENSITY_POINTS) -> np.ndarray:
+    """
+    Densities of several features at once. Every feature is binned onto its own grid, the kernels of all features and
+    classes are applied in a single batch of transforms.
+
+    :param columns: Values of every feature, missing values are ignored
+    :param codes: Class of every row as returned by class_codes
+    :param category_count: Number of target classes
+    :param ranges: First and last point of the densities of every feature
+    :param points: Number of points of the densities
+    :return: Density of every feature and class at every point, zero for classes without values
+    """
+    feature_count = len(columns)
+    if feature_count == 0 or category_count == 0:
+        return np.zeros((feature_count, category_count, points))
+
+    # Rows are grouped by class once, so that every feature's classes are contiguous slices
+    order = np.argsort(codes, kind='mergesort')
+    order = order[codes[order] >= 0]
+    codes = codes[order]
+
+    bandwidths = np.empty((feature_count, category_count))
+    grid_starts = np.empty(feature_count)
+    grid_steps = np.empty(feature_count)
+    weights = np.empty((feature_count, category_count, GRID_SIZE))
+    for index, column in enumerate(columns):
+        values = np.asarray(column, dtype=float)[order]
+        is_finite = np.isfinite(values)
+        values, value_codes = values[is_finite], codes[is_finite]
+        class_counts = np.bincount(value_codes, minlength=category_count)
+        class_values = np.split(values, np.cumsum(class_counts)[:-1])
+
+        from_value, to_value = ranges[index]
+        value_range = max(to_value - from_value, 0.0)
+        fallback_bandwidth = silverman_bandwidth(values) or value_range / 10 or 1.0
+        bandwidths[index] = [silverman_bandwidth(category_values) or fallback_bandwidth
+                             for category_values in class_values]
+
+        # Grid padded by the widest kernel, so that mass near the bounds is not lost
+        padding = KERNEL_WIDTH * bandwidths[index].max()
+        grid_starts[index] = min(from_value, to_value) - padding
+        grid_steps[index] = (value_range + 2 * padding) / (GRID_SIZE - 1)
+
+        # Linear binning spreads every value over its two neighbouring grid points
+        grid_positions = np.clip((values - grid_starts[index]) / grid_steps[index], 0, GRID_SIZE - 1)
+        left = np.minimum(np.floor(grid_positions).astype(int), GRID_SIZE - 2)
+        right_weights = grid_positions - left
+        bins = value_codes * GRID_SIZE + left
+        counts = np.bincount(bins, weights=1 - right_weights, minlength=category_count * GRID_SIZE) + \
+            np.bincount(bins + 1, weights=right_weights, minlength=category_count * GRID_SIZE)
+        weights[index] = counts.reshape(category_count, GRID_SIZE) / np.maximum(class_counts, 1)[:, np.newaxis]
+    bandwidths = np.maximum(bandwidths, grid_steps[:, np.newaxis])
+
+    # Zero padding to twice the grid keeps the circular convolution from wrapping around
+    frequencies = np.fft.rfftfreq(2 * GRID_SIZE)[np.newaxis, np.newaxis, :] / grid_steps[:, np.newaxis, np.newaxis]
+    kernels = np.exp(-2 * (np.pi * frequencies * bandwidths[:, :, np.newaxis]) ** 2)
+    grid_densities = np.fft.irfft(np.fft.rfft(weights, n=2 * GRID_SIZE) * kernels, n=2 * GRID_SIZE)[:, :, :GRID_SIZE]
+    grid_densities = np.maximum(grid_densities / grid_steps[:, np.newaxis, np.newaxis], 0)
+
+    evaluation_points = np.array([np.linspace(from_value, to_value, points) for from_value, to_value in ranges])
+    evaluation_positions = (evaluation_points - grid_starts[:, np.newaxis]) / grid_steps[:, np.newaxis]
+    evaluation_left = np.minimum(np.floor(evaluation_positions).astype(int), GRID_SIZE - 2)[:, np.newaxis, :]
+    evaluation_weights = (evaluation_positions[:, np.newaxis, :] - evaluation_left)
+    feature_indices = np.arange(feature_count)[:, np.newaxis, np.newaxis]
+    category_indices = np.arange(category_count)[np.newaxis, :, np.newaxis]
+    return grid_densities[feature_indices, category_indices, evaluation_left] * (1 - evaluation_weights) + \
+        grid_densities[feature_indices, category_indices, evaluation_left + 1] * evaluation_weights
+
+
+def class_densities(values: np.ndarray, classes: np.ndarray, categories: List, from_value: float, to_value: float,
+                    points: int=DENSITY_POINTS) -> np.ndarray:
+    """
+    :param values: Values of the feature, missing values are ignored
+    :param classes: Target class of every value
+    :param categories: Target classes to estimate densities for
+    :param from_value: First point of the densities
+    :param to_value: Last point of the densities
+    :param points: Number of points of the densities
+    :return: Density of every category at every point, zero for categories without values
+    """
+    return feature_densities([values], class_codes(classes, categories), len(categories), [(from_value, to_value)],
+                             points=points)[0]
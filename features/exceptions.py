@@ -11,3 +11,15 @@ class NotZIPFileError(APIException):
     status_code = 400
     default_detail = 'Uploaded file is not a zip file.'
     default_code = 'bad_request'
+
+
+class UploadOffsetError(APIException):
+    status_code = 409
+    default_detail = 'Chunk does not continue the upload.'
+    default_code = 'conflict'
+
+
+class UploadNotReceivingError(APIException):
+    status_code = 400
+    default_detail = 'Upload was already committed.'
+    default_code = 'bad_request'
@@ -0,0 +1,132 @@
+"""
+Histogram pyramids hold the counts of a fine base histogram together with its coarsenings, every level merges pairs of
+bins of the level before. Histograms of other resolutions or of a part of the value range are answered by slicing and
+merging these counts, without reading the column again.
+
+Histograms are stored as one record per feature, whose edges and counts are packed into binary arrays.
+"""
+from typing import List, Tuple, Dict
+
+import numpy as np
+
+# Bins of a histogram unless requested otherwise, the coarsest level of a pyramid has exactly this many
+DEFAULT_BINS = 50
+
+# Levels of a pyramid, the base has DEFAULT_BINS * 2 ** (PYRAMID_LEVELS - 1) bins
+PYRAMID_LEVELS = 6
+BASE_BINS = DEFAULT_BINS * 2 ** (PYRAMID_LEVELS - 1)
+
+# Packed arrays are little endian, independent of the platform that wrote them
+_EDGE_DTYPE = np.dtype('<f8')
+_COUNT_DTYPE = np.dtype('<i8')
+
+
+def pack_edges(bin_edges: np.ndarray) -> bytes:
+    return np.asarray(bin_edges, dtype=_EDGE_DTYPE).tobytes()
+
+
+def pack_counts(counts: np.ndarray) -> bytes:
+    return np.asarray(counts, dtype=_COUNT_DTYPE).tobytes()
+
+
+def pack_levels(levels: List[np.ndarray]) -> bytes:
+    # Levels are stored one after another, their sizes follow from the total
+    return pack_counts(np.concatenate(levels))
+
+
+def unpack_edges(data) -> np.ndarray:
+    return np.frombuffer(data, dtype=_EDGE_DTYPE)
+
+
+def unpack_counts(data) -> np.ndarray:
+    return np.frombuffer(data, dtype=_COUNT_DTYPE)
+
+
+def unpack_levels(data) -> List[np.ndarray]:
+    counts = unpack_counts(data)
+    # Every level halves the one before, so the base holds 2 ** (PYRAMID_LEVELS - 1) of 2 ** PYRAMID_LEVELS - 1 parts
+    base_bins = len(counts) * 2 ** (PYRAMID_LEVELS - 1) // (2 ** PYRAMID_LEVELS - 1)
+    levels = []
+    offset = 0
+    for level in range(PYRAMID_LEVELS):
+        levels.append(counts[offset:offset + (base_bins >> level)])
+        offset += base_bins >> level
+    return levels
+
+
+def bin_list(counts: np.ndarray, bin_edges: np.ndarray) -> List[Dict]:
+    """
+    :return: From value, to value and count of every bin
+    """
+    return [{'from_value': from_value, 'to_value': to_value, 'count': count} for from_value, to_value, count in
+            zip(bin_edges[:-1].tolist(), bin_edges[1:].tolist(), np.asarray(counts).tolist())]
+
+
+def build_pyramid(counts: np.ndarray) -> List[np.ndarray]:
+    """
+    :param counts: Counts of the BASE_BINS bins of the base histogram
+    :return: Counts of every level, beginning with the base
+    """
+    levels = [np.asarray(counts)]
+    while len(levels) < PYRAMID_LEVELS:
+        levels.append(levels[-1].reshape(-1, 2).sum(axis=1))
+    return levels
+
+
+def merge_bins(counts: np.ndarray, bin_edges: np.ndarray, bins: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge groups of adjacent bins into exactly the given number of bins, or leave fewer bins as they are. Groups are
+    spread evenly, so their sizes differ by at most one bin.
+
+    :return: Counts and edges of the merged bins
+    """
+    if len(counts) <= bins:
+        return np.asarray(counts), np.asarray(bin_edges)
+    starts = np.round(np.linspace(0, len(counts), bins + 1)[:-1]).astype(int)
+    return np.add.reduceat(counts, starts), np.append(bin_edges[starts], bin_edges[-1])
+
+
+def slice_bins(counts: np.ndarray, bin_edges: np.ndarray, start: float=None,
+               stop: float=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: Counts and edges of the bins that overlap the range from start to stop, which are open if None
+    """
+    first = 0 if start is None else int(np.searchsorted(bin_edges[1:], start, side='left'))
+    last = len(counts) if stop is None else int(np.searchsorted(bin_edges[:-1], stop, side='right'))
+    if first >= last:
+        return np.array([], dtype=int), np.array([])
+    return counts[first:last], bin_edges[first:last + 1]
+
+
+def query_pyramid(levels: List[np.ndarray], from_value: float, to_value: float, bins: int, start: float=None,
+                  stop: float=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Answer a histogram from the coarsest level whose bins in the range split evenly into the requested number of bins.
+    If there is none, the base is merged, so that the widths of the bins differ by at most one bin of the base.
+
+    :param levels: Counts of every level of the pyramid, beginning with the base
+    :param from_value: Left edge of the pyramid's first bin
+    :param to_value: Right edge of the pyramid's last bin
+    :param bins: Number of bins, ranges that hold fewer bins of the base return those
+    :param start: Value whose bin is the first one or None for the whole range
+    :param stop: Value whose bin is the last one or None for the whole range
+    :return: Counts and edges of the bins, which are aligned to the bins of a level
+    """
+    base_bins = len(levels[0])
+    base_edges = np.linspace(from_value, to_value, base_bins + 1)
+    first = 0 if start is None else int(np.clip(np.searchsorted(base_edges, start, side='right') - 1, 0, base_bins))
+    last = base_bins if stop is None else int(np.clip(np.searchsorted(base_edges, stop, side='left'), 0, base_bins))
+    if first >= last:
+        return np.array([], dtype=int), np.array([])
+
+    level_index = 0
+    for index in range(1, len(levels)):
+        # Bins of the level that overlap the requested range
+        level_bins = -(-last // 2 ** index) - first // 2 ** index
+        if level_bins >= bins and level_bins % bins == 0:
+            level_index = index
+    level_size = 2 ** level_index
+    level_first, level_last = first // level_size, -(-last // level_size)
+
+    level_edges = np.linspace(from_value, to_value, len(levels[level_index]) + 1)
+    return merge_bins(levels[level_index][level_first:level_last], level_edges[level_first:level_last + 1], bins)
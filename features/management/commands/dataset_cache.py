@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from features.models import Dataset
+from features.tasks import get_cache_statistics, prewarm_dataset, evict_dataset
+
+
+class Command(BaseCommand):
+    help = 'Inspect the dataset cache of the workers, load a dataset into it or evict a dataset from it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['stats', 'prewarm', 'evict'])
+        parser.add_argument('dataset_id', nargs='?', help='Uuid of the dataset to load or evict')
+        parser.add_argument('--columns', nargs='+', help='Names of the columns to load, defaults to all columns')
+
+    def handle(self, *args, **options):
+        # The cache lives in the workers' /dev/shm, so every action runs as task on a worker
+        if options['action'] == 'stats':
+            statistics = get_cache_statistics.apply_async().get()
+            self.stdout.write(json.dumps(statistics, indent=2))
+            return
+
+        dataset_id = options['dataset_id']
+        if dataset_id is None:
+            raise CommandError('The {0} action requires a dataset id'.format(options['action']))
+        if not Dataset.objects.filter(pk=dataset_id).exists():
+            raise CommandError('Dataset {0} does not exist'.format(dataset_id))
+
+        if options['action'] == 'prewarm':
+            prewarm_dataset.apply_async(kwargs={'dataset_id': dataset_id, 'columns': options['columns']}).get()
+            self.stdout.write('Loaded dataset {0}'.format(dataset_id))
+        else:
+            evict_dataset.apply_async(kwargs={'dataset_id': dataset_id}).get()
+            self.stdout.write('Evicted dataset {0}'.format(dataset_id))
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0011_merge_20170706_1239'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feature',
+            name='dtype',
+            field=models.CharField(default='<f8', max_length=10),
+        ),
+    ]
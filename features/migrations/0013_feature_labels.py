@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0012_feature_dtype'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feature',
+            name='labels',
+            field=jsonfield.fields.JSONField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0013_feature_labels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='checksum',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
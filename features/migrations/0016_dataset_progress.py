@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0015_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='progress',
+            field=models.FloatField(default=0),
+        ),
+    ]
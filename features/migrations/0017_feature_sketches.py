@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0016_dataset_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feature',
+            name='missing_count',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feature',
+            name='distinct_count',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feature',
+            name='skewness',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feature',
+            name='kurtosis',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feature',
+            name='quantiles',
+            field=jsonfield.fields.JSONField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0017_feature_sketches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='available_features',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        # Features that exist already went through every stage
+        migrations.AddField(
+            model_name='feature',
+            name='stage',
+            field=models.CharField(choices=[('pending', 'Pending'), ('statistics', 'Statistics'),
+                                            ('histogram', 'Histogram'), ('done', 'Done')], default='done',
+                                   max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='feature',
+            name='stage',
+            field=models.CharField(choices=[('pending', 'Pending'), ('statistics', 'Statistics'),
+                                            ('histogram', 'Histogram'), ('done', 'Done')], default='pending',
+                                   max_length=10),
+        ),
+        migrations.RunSQL(
+            "UPDATE features_dataset SET available_features = (SELECT COUNT(*) FROM features_feature "
+            "WHERE features_feature.dataset_id = features_dataset.id)",
+            reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import jsonfield.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0018_initialization_stages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistogramPyramid',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('from_value', models.FloatField()),
+                ('to_value', models.FloatField()),
+                ('levels', jsonfield.fields.JSONField(default=[])),
+                ('feature', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE,
+                                                 to='features.Feature')),
+            ],
+        ),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import numpy as np
+import uuid
+
+
+def pack_histograms(apps, schema_editor):
+    Bin = apps.get_model('features', 'Bin')
+    HistogramPyramid = apps.get_model('features', 'HistogramPyramid')
+    Histogram = apps.get_model('features', 'Histogram')
+
+    bins = {}
+    for feature_id, from_value, to_value, count in Bin.objects.order_by('feature_id', 'from_value').values_list(
+            'feature_id', 'from_value', 'to_value', 'count').iterator():
+        bins.setdefault(feature_id, []).append((from_value, to_value, count))
+    levels = dict(HistogramPyramid.objects.values_list('feature_id', 'levels'))
+
+    histograms = []
+    for feature_id, feature_bins in bins.items():
+        bin_edges = [from_value for from_value, _, _ in feature_bins] + [feature_bins[-1][1]]
+        feature_levels = levels.get(feature_id)
+        histograms.append(Histogram(
+            feature_id=feature_id, bin_edges=np.asarray(bin_edges, dtype='<f8').tobytes(),
+            counts=np.asarray([count for _, _, count in feature_bins], dtype='<i8').tobytes(),
+            levels=np.concatenate(feature_levels).astype('<i8').tobytes() if feature_levels else None))
+    Histogram.objects.bulk_create(histograms, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0019_histogrampyramid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Histogram',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('bin_edges', models.BinaryField()),
+                ('counts', models.BinaryField()),
+                ('levels', models.BinaryField(blank=True, null=True)),
+                ('feature', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE,
+                                                 to='features.Feature')),
+            ],
+        ),
+        migrations.RunPython(pack_histograms, reverse_code=migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='Bin',
+        ),
+        migrations.DeleteModel(
+            name='HistogramPyramid',
+        ),
+    ]
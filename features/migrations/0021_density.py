@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import jsonfield.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0020_histogram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Density',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target_classes', jsonfield.fields.JSONField(default=[])),
+                ('values', models.BinaryField()),
+                ('feature', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='densities',
+                                              to='features.Feature')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                             related_name='target_densities', to='features.Feature')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='density',
+            unique_together=set([('target', 'feature')]),
+        ),
+    ]
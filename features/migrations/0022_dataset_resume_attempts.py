@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0021_density'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='resume_attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -33,11 +33,39 @@ class Dataset(models.Model):
     content = models.FileField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PROCESSING)  # TODO: Use status appriatly
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True)
+    checksum = models.CharField(max_length=64, blank=True, default='', db_index=True)  # SHA-256 of the content
+    progress = models.FloatField(default=0)  # Fraction of the content that was parsed while processing
+    available_features = models.IntegerField(default=0)  # Features whose statistics are ready
+    updated_at = models.DateTimeField(default=now)  # Last progress of the initialization, stalled ones are resumed
+    resume_attempts = models.IntegerField(default=0)  # Times the stalled initialization was resumed
+    content_format = models.CharField(max_length=10, blank=True, default='')  # Detected on upload, empty if unknown
 
     def __str__(self):
         return self.name
 
 
+class Upload(models.Model):
+    RECEIVING = 'receiving'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    ERROR = 'error'
+
+    STATUS_CHOICES = (
+        (RECEIVING, 'Receiving'),
+        (PROCESSING, 'Processing'),
+        (ERROR, 'Error'),
+        (DONE, 'Done')
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(editable=False, default=now)
+    offset = models.BigIntegerField(default=0)  # Bytes received so far
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RECEIVING)
+    error = models.CharField(max_length=255, default='', blank=True)
+    dataset = models.ForeignKey('Dataset', on_delete=models.SET_NULL, blank=True, null=True)
+
+
 class CurrentExperiment(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, unique=True)
     experiment = models.ForeignKey('Experiment', on_delete=models.CASCADE, null=True, blank=True)
@@ -94,6 +122,19 @@ class Redundancy(models.Model):
 
 
 class Feature(models.Model):
+    PENDING = 'pending'
+    STATISTICS = 'statistics'
+    HISTOGRAM = 'histogram'
+    DONE = 'done'
+
+    # Initialization stages in the order they are completed, cheap ones first
+    STAGE_CHOICES = (
+        (PENDING, 'Pending'),
+        (STATISTICS, 'Statistics'),
+        (HISTOGRAM, 'Histogram'),
+        (DONE, 'Done')
+    )
+
     class Meta:
         ordering = ('name', )
         unique_together = (('name', 'dataset'),)
@@ -107,15 +148,35 @@ class Feature(models.Model):
     max = models.FloatField(blank=True, null=True)
     is_categorical = models.NullBooleanField()
     categories = JSONField(default=None, blank=True, null=True)
+    dtype = models.CharField(max_length=10, default='<f8')  # Numpy dtype of the column's storage
+    labels = JSONField(default=None, blank=True, null=True)  # Text of dictionary encoded columns by code
+    # Sketched while parsing, see features.sketches
+    missing_count = models.BigIntegerField(blank=True, null=True)
+    distinct_count = models.BigIntegerField(blank=True, null=True)  # Estimated beyond a few distinct values
+    skewness = models.FloatField(blank=True, null=True)
+    kurtosis = models.FloatField(blank=True, null=True)
+    quantiles = JSONField(default=None, blank=True, null=True)  # Approximate values by percentile
+    stage = models.CharField(max_length=10, choices=STAGE_CHOICES, default=PENDING)  # Last completed stage
+
+
+class Histogram(models.Model):
+    # Arrays are packed by features.histograms
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    feature = models.OneToOneField(Feature, on_delete=models.CASCADE)
+    bin_edges = models.BinaryField()  # float64 edges, one more than bins
+    counts = models.BinaryField()  # int64 count of every bin
+    levels = models.BinaryField(blank=True, null=True)  # int64 counts of the pyramid levels unless categorical
 
 
-class Bin(models.Model):
+class Density(models.Model):
+    class Meta:
+        unique_together = ('target', 'feature')
+
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
-    feature = models.ForeignKey(Feature, on_delete=models.CASCADE)
-    # TODO: Make sure from_value < to_value
-    from_value = models.FloatField()
-    to_value = models.FloatField()
-    count = models.IntegerField()
+    target = models.ForeignKey(Feature, on_delete=models.CASCADE, related_name='target_densities')
+    feature = models.ForeignKey(Feature, on_delete=models.CASCADE, related_name='densities')
+    target_classes = JSONField(default=[])  # Categories of the target when the densities were calculated
+    values = models.BinaryField()  # float32 densities by target class, packed by features.densities
 
 
 class Slice(models.Model):
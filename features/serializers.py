@@ -1,23 +1,38 @@
 from rest_framework.serializers import ModelSerializer, JSONField, PrimaryKeyRelatedField, \
-    SerializerMethodField, Serializer, ListField, FloatField, IntegerField
+    SerializerMethodField, Serializer, ListField, FloatField, IntegerField, RegexField, UUIDField
 from rest_framework.validators import ValidationError
 
-from features.models import Feature, Bin, Slice, Experiment, Dataset, Redundancy, \
-    Relevancy, Spectrogram, Calculation
+from features.models import Feature, Slice, Experiment, Dataset, Redundancy, \
+    Relevancy, Spectrogram, Calculation, Upload
+from features.histograms import BASE_BINS
 
 
 class FeatureSerializer(ModelSerializer):
     class Meta:
         model = Feature
-        fields = ('id', 'name', 'mean', 'variance', 'min', 'max', 'is_categorical', 'categories')
+        fields = ('id', 'name', 'mean', 'variance', 'min', 'max', 'is_categorical', 'categories', 'dtype', 'labels',
+                  'missing_count', 'distinct_count', 'skewness', 'kurtosis', 'quantiles', 'stage')
 
     categories = JSONField()
+    quantiles = JSONField()
 
 
-class BinSerializer(ModelSerializer):
-    class Meta:
-        model = Bin
-        fields = ('from_value', 'to_value', 'count')
+class BinSerializer(Serializer):
+    from_value = FloatField()
+    to_value = FloatField()
+    count = IntegerField()
+
+
+class HistogramRequestSerializer(Serializer):
+    def get_fields(self):
+        # From and to are keywords, so the fields can't be declared as attributes
+        return {'bins': IntegerField(min_value=1, max_value=BASE_BINS, required=False),
+                'from': FloatField(required=False), 'to': FloatField(required=False)}
+
+    def validate(self, attrs):
+        if 'from' in attrs and 'to' in attrs and attrs['from'] > attrs['to']:
+            raise ValidationError('from has to be smaller than to')
+        return attrs
 
 
 class FeatureSliceSerializer(ModelSerializer):
@@ -45,6 +60,21 @@ class DatasetSerializer(ModelSerializer):
         fields = ('id', 'name', 'status')
 
 
+class UploadSerializer(ModelSerializer):
+    class Meta:
+        model = Upload
+        fields = ('id', 'offset', 'status', 'error', 'dataset', 'created_at')
+        read_only_fields = fields
+
+
+class UploadChunkSerializer(Serializer):
+    offset = IntegerField(min_value=0)
+
+
+class UploadCommitSerializer(Serializer):
+    checksum = RegexField(regex=r'^[0-9a-f]{64}$')
+
+
 class ExperimentSerializer(ModelSerializer):
     target = PrimaryKeyRelatedField(many=False, read_only=True)
     dataset = PrimaryKeyRelatedField(many=False, read_only=False, queryset=Dataset.objects.all())
@@ -132,6 +162,15 @@ class DensitySerializer(Serializer):
     density_values = ListField(required=True)
 
 
+class FeatureDensitiesRequestSerializer(Serializer):
+    features = PrimaryKeyRelatedField(many=True, queryset=Feature.objects.all())
+
+
+class FeatureDensitiesSerializer(Serializer):
+    feature = UUIDField()
+    densities = DensitySerializer(many=True)
+
+
 class SpectrogramSerializer(ModelSerializer):
     image_url = SerializerMethodField()
 
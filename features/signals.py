@@ -1,8 +1,18 @@
+from celery.signals import worker_ready
 from django.db.models.signals import post_delete
 from django.dispatch.dispatcher import receiver
+from features.cache import reattach_datasets
+from features.columnar import remove_columnar
 from features.models import Dataset
 
 
 @receiver(post_delete, sender=Dataset)
 def dataset_delete(sender, instance, **kwargs):
+    remove_columnar(instance)
     instance.content.delete(False)
+
+
+@worker_ready.connect
+def worker_ready_reattach_datasets(sender, **kwargs):
+    # Keep the cache hot across restarts of the worker
+    reattach_datasets()
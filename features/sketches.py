@@ -0,0 +1,250 @@
+"""
+Mergeable summaries of columns that are updated chunk by chunk while a dataset is parsed. Sketches of different
+chunks or parsing threads are merged into the sketch of the whole column, so statistics, quantiles and the number of
+distinct values are known after a single pass without keeping the column in memory.
+"""
+from typing import Dict, List
+
+import numpy as np
+
+# Items per level of a quantile sketch, the rank error shrinks with the capacity
+QUANTILE_CAPACITY = 1024
+
+# Percentiles of the summaries, 0 and 100 are the exact bounds
+PERCENTILES = (0, 1, 5, 25, 50, 75, 95, 99, 100)
+
+# Registers of the distinct count sketch are addressed by this many bits of a value's hash
+DISTINCT_PRECISION = 12
+
+# Distinct values that are collected exactly, enough to tell whether a column is categorical
+MAX_UNIQUE = 10
+
+
+def _finite_or_none(value) -> float:
+    return float(value) if value is not None and np.isfinite(value) else None
+
+
+class Moments(object):
+    """
+    Count, bounds and central moments up to the fourth of the finite values, merged as described by Pebay.
+    """
+    def __init__(self):
+        self.count = 0
+        self.missing_count = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+
+    def update(self, values: np.ndarray):
+        is_missing = np.isnan(values)
+        finite_values = values[~is_missing]
+        chunk = Moments()
+        chunk.missing_count = int(np.count_nonzero(is_missing))
+        if finite_values.size > 0:
+            deviations = finite_values - np.mean(finite_values)
+            chunk.count = finite_values.size
+            chunk.min = float(np.amin(finite_values))
+            chunk.max = float(np.amax(finite_values))
+            chunk.mean = float(np.mean(finite_values))
+            chunk.m2 = float(np.sum(deviations ** 2))
+            chunk.m3 = float(np.sum(deviations ** 3))
+            chunk.m4 = float(np.sum(deviations ** 4))
+        self.merge(chunk)
+
+    def merge(self, other: 'Moments'):
+        self.missing_count += other.missing_count
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.min, self.max = other.count, other.min, other.max
+            self.mean, self.m2, self.m3, self.m4 = other.mean, other.m2, other.m3, other.m4
+            return
+
+        count_a, count_b = self.count, other.count
+        count = count_a + count_b
+        delta = other.mean - self.mean
+        m2 = self.m2 + other.m2 + delta ** 2 * count_a * count_b / count
+        m3 = self.m3 + other.m3 + delta ** 3 * count_a * count_b * (count_a - count_b) / count ** 2 + \
+            3 * delta * (count_a * other.m2 - count_b * self.m2) / count
+        m4 = self.m4 + other.m4 + \
+            delta ** 4 * count_a * count_b * (count_a ** 2 - count_a * count_b + count_b ** 2) / count ** 3 + \
+            6 * delta ** 2 * (count_a ** 2 * other.m2 + count_b ** 2 * self.m2) / count ** 2 + \
+            4 * delta * (count_a * other.m3 - count_b * self.m3) / count
+
+        self.mean += delta * count_b / count
+        self.m2, self.m3, self.m4 = m2, m3, m4
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count > 0 else None
+
+    def skewness(self) -> float:
+        # Biased estimate like scipy.stats.skew
+        return np.sqrt(self.count) * self.m3 / self.m2 ** 1.5 if self.m2 > 0 else None
+
+    def kurtosis(self) -> float:
+        # Biased excess kurtosis like scipy.stats.kurtosis
+        return self.count * self.m4 / self.m2 ** 2 - 3 if self.m2 > 0 else None
+
+
+class QuantileSketch(object):
+    """
+    Levels of sorted samples like in the KLL sketch, an item on level i stands for 2 ** i values. A full level is
+    compacted by promoting every other item to the next level, alternating between the even and odd items so that the
+    rank errors cancel out without randomness.
+    """
+    def __init__(self, capacity: int=None):
+        self.capacity = capacity or QUANTILE_CAPACITY
+        self.levels = [np.array([])]
+        self.offsets = [0]
+
+    def update(self, values: np.ndarray):
+        self.levels[0] = np.concatenate([self.levels[0], values[np.isfinite(values)]])
+        self._compact()
+
+    def merge(self, other: 'QuantileSketch'):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.array([]))
+                self.offsets.append(0)
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compact()
+
+    def _compact(self):
+        level = 0
+        while level < len(self.levels):
+            if self.levels[level].size > self.capacity:
+                items = np.sort(self.levels[level])
+                # An odd item stays, so that the total weight is kept
+                kept_items = items[items.size - items.size % 2:]
+                items = items[:items.size - items.size % 2]
+
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.array([]))
+                    self.offsets.append(0)
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[self.offsets[level]::2]])
+                self.levels[level] = kept_items
+                self.offsets[level] ^= 1
+            level += 1
+
+    def quantiles(self, fractions: List[float]) -> List[float]:
+        """
+        :param fractions: Fractions between 0 and 1
+        :return: Approximate quantile of every fraction or None for every fraction if there were no finite values
+        """
+        items = np.concatenate(self.levels)
+        if items.size == 0:
+            return [None] * len(fractions)
+        weights = np.concatenate([np.full(level_items.size, 2.0 ** level)
+                                  for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind='mergesort')
+        items, cumulative_weights = items[order], np.cumsum(weights[order])
+
+        indices = np.searchsorted(cumulative_weights, np.asarray(fractions) * cumulative_weights[-1])
+        return items[np.minimum(indices, items.size - 1)].tolist()
+
+
+def _hash(values: np.ndarray) -> np.ndarray:
+    # SplitMix64 finalizer on the bits of the float64 values
+    hashes = values.astype(float).view(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+class DistinctSketch(object):
+    """
+    Distinct values are counted exactly until there are more than max_unique of them and estimated by HyperLogLog
+    afterwards, so columns with a high cardinality stop collecting their values early.
+    """
+    def __init__(self, max_unique: int=None):
+        self.max_unique = max_unique
+        self.unique = np.array([])
+        self.registers = np.zeros(2 ** DISTINCT_PRECISION, dtype=np.uint8)
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        if self.unique is not None:
+            self.unique = np.union1d(self.unique, values)
+            if self.max_unique is not None and self.unique.size > self.max_unique:
+                self.unique = None
+
+        hashes = _hash(values)
+        suffix_bits = 64 - DISTINCT_PRECISION
+        indices = (hashes >> np.uint64(suffix_bits)).astype(np.intp)
+        suffixes = hashes & np.uint64(2 ** suffix_bits - 1)
+        # Position of the leftmost one bit of the suffix, the exponent of frexp is the suffix' bit length
+        ranks = (suffix_bits + 1 - np.frexp(suffixes.astype(float))[1]).astype(np.uint8)
+        np.maximum.at(self.registers, indices, ranks)
+
+    def merge(self, other: 'DistinctSketch'):
+        if self.unique is not None and other.unique is not None:
+            self.unique = np.union1d(self.unique, other.unique)
+            if self.max_unique is not None and self.unique.size > self.max_unique:
+                self.unique = None
+        else:
+            self.unique = None
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        if self.unique is not None:
+            return int(self.unique.size)
+
+        register_count = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / register_count)
+        estimate = alpha * register_count ** 2 / np.sum(2.0 ** -self.registers.astype(float))
+        empty_registers = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * register_count and empty_registers > 0:
+            # Linear counting is more accurate for small cardinalities
+            estimate = register_count * np.log(register_count / empty_registers)
+        return int(round(estimate))
+
+
+class ColumnSketch(object):
+    """
+    Everything that is known about a column after a single pass.
+    """
+    def __init__(self, max_unique: int=None):
+        self.moments = Moments()
+        self.quantiles = QuantileSketch()
+        self.distinct = DistinctSketch(max_unique=max_unique)
+
+    def update(self, values: np.ndarray):
+        # Adding zero turns -0.0 into 0.0
+        values = np.asarray(values, dtype=float) + 0.0
+        self.moments.update(values)
+        self.quantiles.update(values)
+        self.distinct.update(values)
+
+    def merge(self, other: 'ColumnSketch'):
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+        self.distinct.merge(other.distinct)
+
+    def summary(self) -> Dict:
+        """
+        :return: JSON serializable statistics of the finite values together with the number of missing values. The
+            percentiles 0 and 100 are the exact minimum and maximum, unique holds the sorted distinct values unless
+            there were more than max_unique of them.
+        """
+        quantiles = self.quantiles.quantiles([percentile / 100 for percentile in PERCENTILES])
+        if self.moments.count > 0:
+            quantiles[0], quantiles[-1] = self.moments.min, self.moments.max
+        return {
+            'count': self.moments.count,
+            'missing_count': self.moments.missing_count,
+            'min': self.moments.min,
+            'max': self.moments.max,
+            'mean': self.moments.mean if self.moments.count > 0 else None,
+            'variance': _finite_or_none(self.moments.variance()),
+            'skewness': _finite_or_none(self.moments.skewness()),
+            'kurtosis': _finite_or_none(self.moments.kurtosis()),
+            'distinct_count': self.distinct.count(),
+            'unique': self.distinct.unique.tolist() if self.distinct.unique is not None else None,
+            'quantiles': {str(percentile): quantile for percentile, quantile in zip(PERCENTILES, quantiles)}
+        }
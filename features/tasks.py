@@ -1,19 +1,29 @@
 from __future__ import absolute_import, unicode_literals
 from celery import shared_task
-from sklearn.neighbors import KernelDensity
-from features.models import Feature, Bin, Slice, Dataset, ResultCalculationMap, \
-    Redundancy, Relevancy, Spectrogram, Calculation
+from features.models import Feature, Histogram, Density, Slice, Dataset, ResultCalculationMap, \
+    Redundancy, Relevancy, Spectrogram, Calculation, Upload
 from celery.task import chord
 from celery.utils.log import get_task_logger
-from multiprocessing import Manager
-import SharedArray as sa
-from pandas import DataFrame, read_csv
+from pandas import DataFrame
 import numpy as np
 from hics.incremental_correlation import IncrementalCorrelation
 from hics.result_storage import AbstractResultStorage
 from hics.scored_slices import ScoredSlices
 from features.bindings import CalculationBinding, DatasetBinding
-from time import time
+from features import chunked
+from features.cache import get_column, get_columns, get_dataframe, make_room, pin_dataset, cache_statistics, \
+    remove_dataset, ingestion_lock, is_ingesting
+from features.columnar import write_columnar, read_manifest, read_labels, column_values, SparseColumn
+from features.deduplication import find_duplicate, copy_columnar, copy_features
+from features.bulk import bulk_update, BULK_BATCH_SIZE
+from features.densities import class_densities, class_codes, feature_densities, density_list, pack_densities
+from features.histograms import build_pyramid, merge_bins, pack_edges, pack_counts, pack_levels, BASE_BINS, \
+    DEFAULT_BINS
+from django.db import transaction
+from features.uploads import create_dataset_from_upload, file_checksum, staging_path, remove_staging
+from rest_framework.exceptions import APIException
+from datetime import timedelta
+from django.utils.timezone import now
 from celery.schedules import crontab
 from celery.decorators import periodic_task
 from scipy.stats import zscore
@@ -21,87 +31,209 @@ from django.conf import settings
 import os
 from math import log
 from ccwt import fft, frequency_band, render_png, EQUIPOTENTIAL
-from django.db.models import Count, F
+from django.db.models import Count, F, Q
 from features.serializers import FeatureSerializer
 
 logger = get_task_logger(__name__)
 
-# Locking of shared memory
-_manager = Manager()
-_dataframe_columns = _manager.dict()
-_dataframe_lock = _manager.Lock()
-_dataframe_last_access = _manager.dict()
+# Features whose statistics and histograms are calculated together by one task
+STATISTICS_BLOCK_SIZE = 256
+
+# Text with more distinct labels is not categorical, it gets neither categories nor a histogram with a bin per label
+MAX_TEXT_CATEGORIES = 1000
+
+# Initializations without any progress for this long are considered crashed and resumed
+INITIALIZATION_TIMEOUT = timedelta(hours=1)
+
+# Initializations that stalled again after this many resumes are considered failed for good
+MAX_RESUME_ATTEMPTS = 3
 
 # Fix bindings in celery context
 DatasetBinding.register()
 CalculationBinding.register()
 
 
-# TODO: Write test
-def _get_dataframe(dataset_id: str) -> DataFrame:
-    """
-    Get a dataset from the system's shared memory (/dev/shm). If it can't be found, it blocks all access to load it.
+def _is_categorical_text(feature: Feature) -> bool:
+    return feature.labels is not None and len(feature.labels) <= MAX_TEXT_CATEGORIES
 
-    IMPORTANT NOTE: Datasets get removed after 1 hour if they are not used. This means that if you use a really long running
-    task, you have to update dataframe_last_access manually!
 
-    :param dataset_id: The uuid of a dataset
-    :return: Pandas Dataframe containing the whole dataset
-    """
+def _has_histogram(feature: Feature) -> bool:
+    # Codes of high cardinality text have no order, so binning them would not mean anything
+    return feature.labels is None or _is_categorical_text(feature)
 
-    _dataframe_lock.acquire()
 
-    dataset_id = str(dataset_id)
+def _max_unique(feature: Feature):
+    # Categorical text needs all of its codes, the values of other features only tell whether they are categorical
+    return None if _is_categorical_text(feature) else 10
 
-    # Update last_access time with UNIX timestamp
-    _dataframe_last_access[dataset_id] = time()
 
-    # Either fetch RAM or load the dataset from disk
-    try:
-        shared_array = sa.attach('shm://{0}'.format(dataset_id))
-        columns = _dataframe_columns[dataset_id]
+def _sparse_statistics(column: SparseColumn) -> dict:
+    # Only the non zero values are read, the zeros are accounted for by count
+    return {'min': column.min(), 'max': column.max(), 'mean': column.mean(), 'variance': column.nanvar(),
+            'unique': column.unique()}
 
-        logger.info('Cache hit for dataset {0}'.format(dataset_id))
-    except FileNotFoundError:
-        logger.info('Cache miss for dataset {0}'.format(dataset_id))
 
-        # Fetch dataset from disk and put it into RAM
-        dataset = Dataset.objects.get(pk=dataset_id)
-        filename = dataset.content.path
-        dataframe = read_csv(filename)
-        shared_array = sa.create('shm://{0}'.format(dataset_id), dataframe.shape)
-        shared_array[:] = dataframe.values
-        columns = dataframe.columns
-        _dataframe_columns[dataset_id] = columns
-        del dataframe
+def _set_statistics(feature: Feature, column_statistics: dict):
+    feature.min = column_statistics['min'].item()
+    feature.max = column_statistics['max'].item()
+    feature.mean = column_statistics['mean'].item()
+    feature.variance = column_statistics['variance'].item()
+    unique_values = column_statistics['unique']
 
-        logger.info('Cache save for dataset {0}'.format(dataset_id))
+    if feature.labels is not None:
+        # Dictionary encoded text with few labels is categorical, its categories are the codes without missing values
+        feature.is_categorical = _is_categorical_text(feature)
+        if feature.is_categorical:
+            unique_values = unique_values[unique_values >= 0]
+    else:
+        feature.is_categorical = unique_values is not None and (unique_values.size < 10) and \
+            bool((np.mod(unique_values, 1) == 0).all())
+    feature.categories = unique_values.tolist() if feature.is_categorical else None
+
+
+def _set_sketched_statistics(feature: Feature, column_statistics: dict):
+    # Summaries of features.sketches only describe the finite values, missing values propagate like in numpy
+    has_missing_values = column_statistics['missing_count'] > 0 or column_statistics['count'] == 0
+    feature.min = np.nan if has_missing_values else column_statistics['min']
+    feature.max = np.nan if has_missing_values else column_statistics['max']
+    feature.mean = np.nan if has_missing_values else column_statistics['mean']
+    feature.variance = np.nan if column_statistics['variance'] is None else column_statistics['variance']
+    feature.missing_count = column_statistics['missing_count']
+    feature.distinct_count = column_statistics['distinct_count']
+    feature.skewness = column_statistics['skewness']
+    feature.kurtosis = column_statistics['kurtosis']
+    feature.quantiles = column_statistics['quantiles']
+    unique_values = column_statistics['unique']
+
+    if feature.labels is not None:
+        # Every label was seen, so the codes without missing values are the categories
+        feature.is_categorical = _is_categorical_text(feature)
+        feature.categories = list(range(len(feature.labels))) if feature.is_categorical else None
+    else:
+        feature.is_categorical = unique_values is not None and len(unique_values) < 10 and \
+            all(value % 1 == 0 for value in unique_values)
+        feature.categories = unique_values if feature.is_categorical else None
 
-    dataframe = DataFrame(shared_array, columns=columns)
 
-    _dataframe_lock.release()
-    return dataframe
+def _histogram_range(feature: Feature) -> tuple:
+    # Sketched features know the bounds of their finite values without reading their column
+    if feature.quantiles is not None and feature.quantiles['0'] is not None:
+        return feature.quantiles['0'], feature.quantiles['100']
+    return 0, 1
 
 
-@shared_task
-def calculate_feature_statistics(feature_id):
-    feature = Feature.objects.get(pk=feature_id)
+def _density_range(feature: Feature) -> tuple:
+    """
+    :return: Finite bounds of the feature's values or None if they are not known yet
+    """
+    # Bounds of features with missing values are NaN, their sketch still knows the bounds of the finite values
+    if feature.min is not None and feature.max is not None and np.isfinite(feature.min) and np.isfinite(feature.max):
+        return feature.min, feature.max
+    if feature.quantiles is not None and feature.quantiles['0'] is not None:
+        return feature.quantiles['0'], feature.quantiles['100']
+    return None
+
+
+def _update_available_features(dataset_id):
+    # The dataset is touched so that running initializations can be told apart from stalled ones, it is only saved
+    # and thereby broadcast when more features became available
+    dataset = Dataset.objects.get(id=dataset_id)
+    available_features = Feature.objects.filter(dataset=dataset).exclude(stage=Feature.PENDING).count()
+    if available_features != dataset.available_features:
+        dataset.available_features = available_features
+        dataset.updated_at = now()
+        dataset.save(update_fields=['available_features', 'updated_at'])
+    else:
+        Dataset.objects.filter(id=dataset_id).update(updated_at=now())
+
+
+def _advance_stage(dataset_id, feature_ids, stage: str):
+    # Features never go back to an earlier stage, e.g. when a resumed task finishes after the original one
+    stages = [choice for choice, _ in Feature.STAGE_CHOICES]
+    Feature.objects.filter(id__in=feature_ids, stage__in=stages[:stages.index(stage)]).update(stage=stage)
+    _update_available_features(dataset_id)
+
+
+def _bin_count(feature: Feature) -> int:
+    # Categorical features get a bin per category, the others are counted at the resolution of a pyramid's base
+    return len(feature.categories) if feature.is_categorical and feature.categories else BASE_BINS
+
+
+def _histogram(feature: Feature, counts: np.ndarray, bin_edges: np.ndarray, bins: int) -> Histogram:
+    """
+    :return: Histogram of the feature, features that are not categorical get the levels of a pyramid and bins that are
+        merged from the pyramid's base
+    """
+    levels = None
+    if not (feature.is_categorical and feature.categories):
+        levels = pack_levels(build_pyramid(counts))
+        counts, bin_edges = merge_bins(counts, bin_edges, bins)
+    return Histogram(feature=feature, bin_edges=pack_edges(bin_edges), counts=pack_counts(counts), levels=levels)
 
-    dataframe = _get_dataframe(feature.dataset.id)
-    feature_col = dataframe[feature.name]
 
-    feature.min = np.amin(feature_col).item()
-    feature.max = np.amax(feature_col).item()
-    feature.mean = np.mean(feature_col).item()
-    feature.variance = np.nanvar(feature_col).item()
-    unique_values = np.unique(feature_col)
-    integer_check = (np.mod(unique_values, 1) == 0).all()
-    feature.is_categorical = integer_check and (unique_values.size < 10)
-    if feature.is_categorical:
-        feature.categories = list(unique_values)
-    feature.save(update_fields=['min', 'max', 'variance', 'mean', 'is_categorical', 'categories'])
+@shared_task
+def calculate_block_statistics(feature_ids, bins=DEFAULT_BINS):
+    """
+    Calculate the statistics and histograms of a block of features of the same dataset in a single pass over their
+    columns and write them back with one query per model. Features whose statistics were sketched while parsing only
+    get their histograms. The statistics are written before the histograms are calculated, so that the features
+    become available early.
 
-    del unique_values, feature
+    :param feature_ids: The feature uuids
+    :param bins: Number of histogram bins of features that are not categorical, which additionally get a pyramid
+    """
+    features = list(Feature.objects.filter(id__in=feature_ids))
+    if len(features) == 0:
+        return
+    dataset_id = features[0].dataset_id
+
+    unsketched_features = [feature for feature in features if feature.quantiles is None]
+
+    histogram_set = []
+    with pin_dataset(dataset_id):
+        columns = get_columns(dataset_id, [feature.name for feature in features])
+        sparse_features = [feature for feature in features if isinstance(columns[feature.name], SparseColumn)]
+        dense_features = [feature for feature in features if not isinstance(columns[feature.name], SparseColumn)]
+
+        # Sparse columns only read their non zero values, they are not worth stacking
+        for feature in sparse_features:
+            if feature.quantiles is None:
+                _set_statistics(feature, _sparse_statistics(columns[feature.name]))
+
+        unsketched_dense_features = [feature for feature in dense_features if feature.quantiles is None]
+        block_statistics = chunked.block_statistics(
+            [columns[feature.name] for feature in unsketched_dense_features],
+            max_unique=[_max_unique(feature) for feature in unsketched_dense_features])
+        ranges = {}
+        for feature, column_statistics in zip(unsketched_dense_features, block_statistics):
+            _set_statistics(feature, column_statistics)
+            ranges[feature.id] = column_statistics['range'] or (0, 1)
+
+        if len(unsketched_features) > 0:
+            with transaction.atomic():
+                bulk_update(unsketched_features, ['min', 'max', 'variance', 'mean', 'is_categorical', 'categories'])
+            _advance_stage(dataset_id, [feature.id for feature in unsketched_features], Feature.STATISTICS)
+
+        # Sketched bounds leave out missing values, which dictionary encoded text stores as -1
+        histograms = [(feature, columns[feature.name].histogram(
+            bins=_bin_count(feature), value_range=_histogram_range(feature) if feature.quantiles is not None else None))
+            for feature in sparse_features if _has_histogram(feature)]
+
+        # Histograms need the range of every column, so they take a second pass
+        histogram_features = [feature for feature in dense_features if _has_histogram(feature)]
+        histograms += zip(histogram_features, chunked.block_histograms(
+            [columns[feature.name] for feature in histogram_features],
+            bins=[_bin_count(feature) for feature in histogram_features],
+            ranges=[ranges.get(feature.id) or _histogram_range(feature) for feature in histogram_features]))
+
+        for feature, (counts, bin_edges) in histograms:
+            histogram_set.append(_histogram(feature, counts, bin_edges, bins))
+
+    with transaction.atomic():
+        # Histograms of an interrupted run of the same block are replaced
+        Histogram.objects.filter(feature__in=features).delete()
+        Histogram.objects.bulk_create(histogram_set, batch_size=BULK_BATCH_SIZE)
+    _advance_stage(dataset_id, [feature.id for feature in features], Feature.HISTOGRAM)
 
 
 @shared_task
@@ -109,24 +241,95 @@ def calculate_densities(target_feature_id, feature_id):
     feature = Feature.objects.get(pk=feature_id)
     target_feature = Feature.objects.get(pk=target_feature_id)
 
-    df = _get_dataframe(feature.dataset.id)
-    target_col = df[target_feature.name]
-    categories = target_feature.categories
+    categories = target_feature.categories or []
+    density_range = _density_range(feature)
+    if density_range is None:
+        return []
+
+    with pin_dataset(feature.dataset.id):
+        columns = get_columns(feature.dataset.id, [target_feature.name, feature.name])
+        densities = class_densities(np.asarray(columns[feature.name], dtype=float),
+                                    np.asarray(columns[target_feature.name], dtype=float), categories,
+                                    *density_range)
+
+    # Densities are kept, so that they are only calculated once per target
+    Density.objects.update_or_create(target=target_feature, feature=feature, defaults={
+        'target_classes': categories, 'values': pack_densities(densities)})
 
-    def calc_density(category):
-        kde = KernelDensity(kernel='gaussian', bandwidth=0.75)
-        X = df[target_col == category][feature.name]
-        # Fitting requires expanding dimensions
-        X = np.expand_dims(X, axis=1)
-        kde.fit(X)
-        # We'd like to sample 100 values
-        X_plot = np.linspace(feature.min, feature.max, 100)
-        # We need the last dimension again
-        X_plot = np.expand_dims(X_plot, axis=1)
-        log_dens = kde.score_samples(X_plot)
-        return np.exp(log_dens).tolist()
+    return density_list(categories, densities)
 
-    return [{'target_class': category, 'density_values': calc_density(category)} for category in categories]
+
+@shared_task
+def calculate_feature_densities(target_id, feature_ids):
+    """
+    Calculate the densities of several features by class of the target in a single pass. The classes of the target's
+    rows are determined once for all features.
+
+    :param target_id: The uuid of the target
+    :param feature_ids: The uuids of features of the target's dataset
+    :return: Densities of every feature by its uuid
+    """
+    target = Feature.objects.get(pk=target_id)
+    categories = target.categories or []
+    features = list(Feature.objects.filter(id__in=feature_ids, dataset_id=target.dataset_id))
+
+    # Features without finite bounds have no range to evaluate their densities on yet
+    ranges = {feature.id: _density_range(feature) for feature in features}
+    features_with_range = [feature for feature in features if ranges[feature.id] is not None]
+
+    with pin_dataset(target.dataset_id):
+        columns = get_columns(target.dataset_id, [target.name] + [feature.name for feature in features_with_range
+                                                                  if feature.name != target.name])
+        densities = feature_densities([columns[feature.name] for feature in features_with_range],
+                                      class_codes(columns[target.name], categories), len(categories),
+                                      [ranges[feature.id] for feature in features_with_range])
+        del columns
+
+    with transaction.atomic():
+        Density.objects.filter(target=target, feature__in=features_with_range).delete()
+        Density.objects.bulk_create([Density(target=target, feature=feature, target_classes=categories,
+                                             values=pack_densities(feature_density_values))
+                                     for feature, feature_density_values in zip(features_with_range, densities)],
+                                    batch_size=BULK_BATCH_SIZE)
+
+    feature_densities_by_id = {str(feature.id): [] for feature in features}
+    feature_densities_by_id.update({str(feature.id): density_list(categories, feature_density_values)
+                                    for feature, feature_density_values in zip(features_with_range, densities)})
+    return feature_densities_by_id
+
+
+@shared_task
+def calculate_target_densities(target_id):
+    """
+    Calculate and persist the densities of all features of the target's dataset by class of the target. The target's
+    column is read once, the other columns are read in blocks.
+
+    :param target_id: The uuid of a categorical target
+    """
+    target = Feature.objects.get(pk=target_id)
+    categories = target.categories
+    if not categories:
+        return
+
+    # Features without statistics have no range to evaluate their densities on yet
+    features = [feature for feature in Feature.objects.filter(dataset_id=target.dataset_id)
+                if _density_range(feature) is not None]
+    densities = []
+    with pin_dataset(target.dataset_id):
+        codes = class_codes(get_column(target.dataset_id, target.name), categories)
+        for block_start in range(0, len(features), STATISTICS_BLOCK_SIZE):
+            block = features[block_start:block_start + STATISTICS_BLOCK_SIZE]
+            columns = get_columns(target.dataset_id, [feature.name for feature in block])
+            block_densities = feature_densities([columns[feature.name] for feature in block], codes, len(categories),
+                                                [_density_range(feature) for feature in block])
+            densities += [Density(target=target, feature=feature, target_classes=categories,
+                                  values=pack_densities(class_density_values))
+                          for feature, class_density_values in zip(block, block_densities)]
+            del columns
+
+    with transaction.atomic():
+        Density.objects.filter(target=target).delete()
+        Density.objects.bulk_create(densities, batch_size=BULK_BATCH_SIZE)
 
 
 @shared_task
@@ -140,9 +343,8 @@ def build_spectrogram(feature_id, width=256, height=128, frequency_base=1.0):
     :param frequency_base: Base for exponential frequency scales or 1.0 for linear scale
     """
     feature = Feature.objects.get(pk=feature_id)
-    df = _get_dataframe(feature.dataset.id)
-
-    feature_column = zscore(df[feature.name].values)
+    with pin_dataset(feature.dataset.id):
+        feature_column = zscore(np.asarray(get_column(feature.dataset.id, feature.name)))
     fourier_transformed_signal = fft(feature_column)
 
     minimum_frequency = 0.001 * len(feature_column)
@@ -162,39 +364,16 @@ def build_spectrogram(feature_id, width=256, height=128, frequency_base=1.0):
     with open(filename, 'w') as output_file:
         render_png(output_file, EQUIPOTENTIAL, 0.0, fourier_transformed_signal, frequency_band_result, width)
 
-    Spectrogram.objects.create(
-        feature=feature,
-        width=width,
-        height=height,
-        image=filename
-    )
-
-
-@shared_task
-def build_histogram(feature_id, bins=50):
-    feature = Feature.objects.get(pk=feature_id)
-
-    if feature.is_categorical:
-        bins = len(feature.categories)
-
-    # Only read column with that name
-    dataframe = _get_dataframe(feature.dataset.id)
-
-    bin_set = []
-    bins, bin_edges = np.histogram(dataframe[feature.name], bins=bins)
-    for bin_index, bin_value in enumerate(bins):
-        from_value = bin_edges[bin_index]
-        to_value = bin_edges[bin_index + 1]
-        bin = Bin(
+    with transaction.atomic():
+        # A resumed initialization might render the spectrogram again
+        Spectrogram.objects.filter(feature=feature).delete()
+        Spectrogram.objects.create(
             feature=feature,
-            from_value=from_value,
-            to_value=to_value,
-            count=bin_value
+            width=width,
+            height=height,
+            image=filename
         )
-        bin_set.append(bin)
-    Bin.objects.bulk_create(bin_set)
-
-    del bins, bin_edges, bin_set
+    _advance_stage(feature.dataset_id, [feature.id], Feature.DONE)
 
 
 @shared_task
@@ -202,9 +381,10 @@ def get_samples(feature_id, max_samples=None):
     if not max_samples:
         max_samples = 10000
     feature = Feature.objects.get(pk=feature_id)
-    df = _get_dataframe(feature.dataset.id)
-    samples = df.loc[:, feature.name][::np.int(np.ceil(len(df) / max_samples))]
-    return {str(feature_id): list(samples)}
+    with pin_dataset(feature.dataset.id):
+        feature_col = get_column(feature.dataset.id, feature.name)
+        samples = feature_col[::np.int(np.ceil(len(feature_col) / max_samples))]
+        return {str(feature_id): column_values(samples, feature.labels)}
 
 
 @shared_task
@@ -324,32 +504,34 @@ def calculate_hics(calculation_id, feature_ids={}, bivariate=True, calculate_sup
     calculation = Calculation.objects.get(id=calculation_id)
     result_calculation_map = calculation.result_calculation_map
     target = result_calculation_map.target
-    dataframe = _get_dataframe(target.dataset.id)
-    features = Feature.objects.filter(dataset=target.dataset).exclude(id=target.id).all()
-    categorical_features = Feature.objects.filter(dataset=target.dataset, is_categorical=True).all()
-    categorical_feature_names = [feature.name for feature in categorical_features if feature.is_categorical]
-
-    result_storage = DjangoHICSResultStorage(result_calculation_map=result_calculation_map, features=features)
-    correlation = IncrementalCorrelation(data=dataframe, target=target.name, result_storage=result_storage,
-                                         iterations=10, alpha=0.1, categorical_features=categorical_feature_names)
-
-    # Calculate relevancies
-    if bivariate:
-        correlation.update_bivariate_relevancies(runs=5)
-    elif not bivariate and len(feature_ids) == 0:
-        correlation.update_multivariate_relevancies(k=5, runs=50)
-    elif not bivariate and len(feature_ids) > 0:
-        feature_names = [feature.name for feature in Feature.objects.filter(id__in=feature_ids).all()]
-        if calculate_supersets:
-            correlation.update_multivariate_relevancies(feature_names, k=5, runs=10)
+    # The dataframe wraps the shared segments of the dataset, they must not be evicted while HiCS reads them
+    with pin_dataset(target.dataset.id):
+        dataframe = get_dataframe(target.dataset.id)
+        features = Feature.objects.filter(dataset=target.dataset).exclude(id=target.id).all()
+        categorical_features = Feature.objects.filter(dataset=target.dataset, is_categorical=True).all()
+        categorical_feature_names = [feature.name for feature in categorical_features if feature.is_categorical]
+
+        result_storage = DjangoHICSResultStorage(result_calculation_map=result_calculation_map, features=features)
+        correlation = IncrementalCorrelation(data=dataframe, target=target.name, result_storage=result_storage,
+                                             iterations=10, alpha=0.1, categorical_features=categorical_feature_names)
+
+        # Calculate relevancies
+        if bivariate:
+            correlation.update_bivariate_relevancies(runs=5)
+        elif not bivariate and len(feature_ids) == 0:
+            correlation.update_multivariate_relevancies(k=5, runs=50)
+        elif not bivariate and len(feature_ids) > 0:
+            feature_names = [feature.name for feature in Feature.objects.filter(id__in=feature_ids).all()]
+            if calculate_supersets:
+                correlation.update_multivariate_relevancies(feature_names, k=5, runs=10)
+            else:
+                correlation.update_multivariate_relevancies(feature_names, k=len(feature_names), runs=5)
         else:
-            correlation.update_multivariate_relevancies(feature_names, k=len(feature_names), runs=5)
-    else:
-        raise AssertionError('Should not reach this condition')
+            raise AssertionError('Should not reach this condition')
 
-    # Calculate redundancies
-    if bivariate and calculate_redundancies:
-        correlation.update_redundancies(k=5, runs=20)
+        # Calculate redundancies
+        if bivariate and calculate_redundancies:
+            correlation.update_redundancies(k=5, runs=20)
 
     calculation.current_iteration += 1
     calculation.save()
@@ -358,28 +540,167 @@ def calculate_hics(calculation_id, feature_ids={}, bivariate=True, calculate_sup
 
 @shared_task
 def initialize_from_dataset(dataset_id):
+    # A resumed initialization must not replace the columnar files that a running one is still writing
+    with ingestion_lock(dataset_id) as acquired:
+        if not acquired:
+            logger.info('Dataset {0} is being parsed already'.format(dataset_id))
+            return
+        _ingest_dataset(dataset_id)
+
+    resume_initialization(dataset_id=dataset_id)
+
+
+def _ingest_dataset(dataset_id):
     dataset = Dataset.objects.get(id=dataset_id)
     dataset.status = Dataset.PROCESSING  # TODO: Test
-    dataset.save(update_fields=['status'])
+    dataset.updated_at = now()
+    dataset.save(update_fields=['status', 'updated_at'])
+
+    # Everything that was derived from the same content is reused
+    duplicate = find_duplicate(dataset)
+    if duplicate is not None:
+        logger.info('Dataset {0} has the same content as {1}, copying its features'.format(dataset_id, duplicate.id))
+        copy_columnar(duplicate, dataset)
+        copy_features(duplicate, dataset)
+        dataset.progress = 1
+        dataset.save(update_fields=['progress'])
+        _update_available_features(dataset_id)
+        return
+
+    def save_progress(progress):
+        dataset.progress = progress
+        dataset.updated_at = now()
+        dataset.save(update_fields=['progress', 'updated_at'])
+
+    # Parse the CSV once, every later load of a column reads its binary file
+    manifest = write_columnar(dataset, progress=save_progress)
+    # Wide datasets have thousands of features, they are inserted in batches
+    features = [Feature(name=column['name'], dtype=column['dtype'], dataset=dataset,
+                        labels=read_labels(dataset, manifest, column['name'])) for column in manifest['columns']]
+    # Statistics were sketched while parsing, so only the histograms need another pass
+    for feature, column in zip(features, manifest['columns']):
+        if column.get('statistics') is not None:
+            _set_sketched_statistics(feature, column['statistics'])
+            feature.stage = Feature.STATISTICS
+    with transaction.atomic():
+        Feature.objects.bulk_create(features, batch_size=BULK_BATCH_SIZE)
+    _update_available_features(dataset_id)
 
-    dataframe = _get_dataframe(dataset_id)
 
-    # Only read first row for header
-    headers = list(dataframe.columns.values)
-    feature_ids = [Feature.objects.create(name=header, dataset=dataset).id for header in headers]
+@shared_task
+def resume_initialization(dataset_id):
+    """
+    Schedule the stages that the features of a dataset did not complete yet. Statistics and histograms of every feature
+    are calculated before any spectrogram is rendered, the dataset is done as soon as they are ready.
+
+    :param dataset_id: The dataset uuid
+    """
+    dataset = Dataset.objects.get(id=dataset_id)
+    features = Feature.objects.filter(dataset=dataset)
+    if not features.exists():
+        if read_manifest(dataset) is not None:
+            # Parsing completed without finding a single column, there is nothing to initialize
+            logger.error('Dataset {0} has no columns'.format(dataset_id))
+            dataset.status = Dataset.ERROR
+            dataset.updated_at = now()
+            dataset.save(update_fields=['status', 'updated_at'])
+            return
+        # The features are registered at once after parsing, so parsing did not complete
+        initialize_from_dataset.delay(dataset_id=dataset_id)
+        return
+
+    dataset.updated_at = now()
+    dataset.save(update_fields=['updated_at'])
+
+    feature_ids = list(features.filter(stage__in=[Feature.PENDING, Feature.STATISTICS]).values_list('id', flat=True))
+    if len(feature_ids) == 0:
+        initialize_from_dataset_processing_callback(dataset_id=dataset_id)
+        return
+
+    calculate_block_statistics_subtasks = [
+        calculate_block_statistics.subtask(immutable=True, kwargs={
+            'feature_ids': feature_ids[block_start:block_start + STATISTICS_BLOCK_SIZE]})
+        for block_start in range(0, len(feature_ids), STATISTICS_BLOCK_SIZE)]
+
+    chord(calculate_block_statistics_subtasks)(initialize_from_dataset_processing_callback.subtask(
+        kwargs={'dataset_id': dataset_id}))
 
-    # Chaining with Celery would be more beautiful...
-    calculate_feature_statistics_subtasks = [
-        calculate_feature_statistics.subtask(immutable=True, kwargs={'feature_id': feature_id}) for feature_id in
-        feature_ids]
-    build_spectrogram_subtasks = [build_spectrogram.subtask(immutable=True, kwargs={'feature_id': feature_id}) for
-                                  feature_id in feature_ids]
-    build_histogram_subtasks = [build_histogram.subtask(immutable=True, kwargs={'feature_id': feature_id}) for
-                                feature_id in feature_ids]
 
-    subtasks = calculate_feature_statistics_subtasks + build_spectrogram_subtasks + build_histogram_subtasks
+@shared_task
+def commit_upload(upload_id, checksum):
+    """
+    Verify the staging file of a chunked upload against the checksum the client calculated and create its dataset.
+    Uploads whose checksum does not match receive chunks again, the staging file is kept so that only the chunks that
+    differ have to be sent again.
 
-    chord(subtasks)(initialize_from_dataset_processing_callback.subtask(kwargs={'dataset_id': dataset_id}))
+    :param upload_id: The upload uuid
+    :param checksum: SHA-256 of the whole archive
+    """
+    upload = Upload.objects.get(pk=upload_id)
+
+    if file_checksum(staging_path(upload)) != checksum:
+        upload.status = Upload.RECEIVING
+        upload.error = 'Checksum of the uploaded archive does not match.'
+        upload.save(update_fields=['status', 'error'])
+        return
+
+    try:
+        with open(staging_path(upload), 'rb') as upload_file:
+            dataset = create_dataset_from_upload(upload_file, uploaded_by=upload.uploaded_by)
+    except Exception as exception:
+        # Broken archives fail while they are extracted, e.g. with a CRC error, the upload must not stay processing
+        logger.exception('Upload {0} could not be extracted'.format(upload_id))
+        upload.status = Upload.ERROR
+        upload.error = str(exception.detail if isinstance(exception, APIException) else exception)[:255]
+        upload.save(update_fields=['status', 'error'])
+        return
+    finally:
+        remove_staging(upload)
+
+    upload.status = Upload.DONE
+    upload.dataset = dataset
+    upload.save(update_fields=['status', 'dataset'])
+
+    initialize_from_dataset.delay(dataset_id=dataset.id)
+
+
+@periodic_task(run_every=(crontab(minute=0)), ignore_result=True)
+def remove_abandoned_uploads():
+    """
+    Remove uploads that did not receive all of their chunks within a day.
+    """
+    for upload in Upload.objects.filter(status=Upload.RECEIVING, created_at__lt=now() - timedelta(days=1)):
+        remove_staging(upload)
+        upload.delete()
+
+
+@periodic_task(run_every=(crontab(minute='*/15')), ignore_result=True)
+def resume_stalled_initializations():
+    """
+    Resume initializations that did not make any progress for a while, e.g. because their worker died. Datasets whose
+    initialization keeps stalling are given up on after MAX_RESUME_ATTEMPTS resumes.
+    """
+    # Datasets that can be used already only miss spectrograms, giving up on them just stops resuming them
+    stalled_datasets = Dataset.objects.filter(updated_at__lt=now() - INITIALIZATION_TIMEOUT).exclude(
+        status=Dataset.ERROR).exclude(status=Dataset.DONE, resume_attempts__gte=MAX_RESUME_ATTEMPTS).filter(
+        Q(status=Dataset.PROCESSING) | Q(
+            feature__stage__in=[Feature.PENDING, Feature.STATISTICS, Feature.HISTOGRAM])).distinct()
+    for dataset in stalled_datasets:
+        # Parsing a large file reports no progress for a long time, its lock tells it apart from a crashed one
+        if is_ingesting(dataset.id):
+            continue
+
+        if dataset.resume_attempts >= MAX_RESUME_ATTEMPTS:
+            logger.error('Initialization of dataset {0} stalled {1} times, giving up'.format(
+                dataset.id, dataset.resume_attempts + 1))
+            dataset.status = Dataset.ERROR
+            dataset.save(update_fields=['status'])
+            continue
+
+        logger.info('Resuming the initialization of dataset {0}'.format(dataset.id))
+        dataset.resume_attempts += 1
+        dataset.save(update_fields=['resume_attempts'])
+        resume_initialization.delay(dataset_id=dataset.id)
 
 
 @shared_task
@@ -387,7 +708,12 @@ def initialize_from_dataset_processing_callback(*args, **kwargs):
     dataset_id = kwargs['dataset_id']
     dataset = Dataset.objects.get(id=dataset_id)
     dataset.status = Dataset.DONE
-    dataset.save(update_fields=['status'])
+    dataset.updated_at = now()
+    dataset.save(update_fields=['status', 'updated_at'])
+
+    # Spectrograms are the expensive stage, they are rendered while the dataset can be used already
+    for feature_id in Feature.objects.filter(dataset=dataset, stage=Feature.HISTOGRAM).values_list('id', flat=True):
+        build_spectrogram.delay(feature_id=feature_id)
 
 
 @shared_task
@@ -397,44 +723,90 @@ def calculate_conditional_distributions(target_id, feature_constraints, max_samp
     logger.info(
         'Started for target {0} and features ranges/categories {1}'.format(target_id, feature_constraints))
 
-    df = _get_dataframe(dataset_id=target.dataset.id)
-
     # Convert feature ids to feature name for using it in dataframe and store feature ids in dict
     feature_ids = {target.name: str(target_id)}
+    feature_labels = {target.name: target.labels}
     for feature_constraint in feature_constraints:
-        feature_name = Feature.objects.get(dataset_id=target.dataset.id,
-                                           id=feature_constraint['feature']).name
-        feature_ids[feature_name] = str(feature_constraint['feature'])
-        feature_constraint['feature'] = feature_name
+        feature = Feature.objects.get(dataset_id=target.dataset.id, id=feature_constraint['feature'])
+        feature_ids[feature.name] = str(feature_constraint['feature'])
+        feature_labels[feature.name] = feature.labels
+        feature_constraint['feature'] = feature.name
+
+        # Text categories are filtered on their codes
+        if 'categories' in feature_constraint and feature.labels is not None:
+            codes = {label: code for code, label in enumerate(feature.labels)}
+            feature_constraint['categories'] = [codes.get(category, category)
+                                                for category in feature_constraint['categories']]
 
     logger.info('Changed feature range to {0}'.format(feature_constraints))
 
-    # Make filtering based on category or range
-    filter_list = np.array([True] * len(df))
-    for ftr in feature_constraints:
-        if 'range' in ftr:
-            filter_list = np.logical_and(df[ftr['feature']] >= ftr['range']['from_value'], filter_list)
-            filter_list = np.logical_and(df[ftr['feature']] <= ftr['range']['to_value'], filter_list)
-
-        elif 'categories' in ftr:
-            filter_list = np.logical_and(df[ftr['feature']].isin(ftr['categories']), filter_list)
-
-    # Calculate conditional probabilites based on filtering
-    sliced_df = df.loc[filter_list, :]
-    values, counts = np.unique(sliced_df.loc[:, target.name], return_counts=True)
-    probabilities = counts / filter_list.sum()
-
-    # Convert to result dict
-    result = {
-        'distribution':
-            [{'value': float(probs[0]), 'probability': probs[1]} for probs in zip(values, probabilities)],
-    }
+    def range_filter(ftr):
+        return lambda values: (values >= ftr['range']['from_value']) & (values <= ftr['range']['to_value'])
+
+    def categories_filter(ftr):
+        return lambda values: np.isin(values, ftr['categories'])
+
+    with pin_dataset(target.dataset.id):
+        # Only load the columns that are constrained or needed for the distribution
+        columns = get_columns(target.dataset.id, list(feature_ids.keys()))
+        row_count = len(columns[target.name])
+
+        def filtered_rows(start, stop):
+            # Make filtering based on category or range, sparse columns only test their non zero values
+            filter_list = np.ones(stop - start, dtype=bool)
+            for ftr in feature_constraints:
+                if 'range' in ftr:
+                    predicate = range_filter(ftr)
+                elif 'categories' in ftr:
+                    predicate = categories_filter(ftr)
+                else:
+                    continue
+
+                column = columns[ftr['feature']]
+                if isinstance(column, SparseColumn):
+                    filter_list &= column.mask(predicate, start, stop)
+                else:
+                    filter_list &= predicate(column[start:stop])
+            return start + np.flatnonzero(filter_list)
+
+        # Columns might be memory mapped from disk, so the rows are filtered chunk by chunk
+        chunks = [(start, min(start + chunked.CHUNK_SIZE, row_count))
+                  for start in range(0, row_count, chunked.CHUNK_SIZE)]
+
+        # Calculate conditional probabilites based on filtering
+        filtered_count = 0
+        value_counts = {}
+        for start, stop in chunks:
+            rows = filtered_rows(start, stop)
+            filtered_count += len(rows)
+            values, counts = np.unique(columns[target.name][rows], return_counts=True)
+            for value, count in zip(values.tolist(), counts.tolist()):
+                value_counts[value] = value_counts.get(value, 0) + count
+
+        # Convert to result dict, text targets are counted on their codes but return their labels
+        result = {
+            'distribution':
+                [{'value': float(value) if target.labels is None else column_values([value], target.labels)[0],
+                  'probability': count / filtered_count}
+                 for value, count in sorted(value_counts.items())],
+        }
 
-    # Subsample dataframe
-    if max_samples:
-        feature_names = [str(ftr['feature']) for ftr in feature_constraints] + [target.name]
-        samples = DataFrame(sliced_df.loc[:, feature_names][::max(np.int(np.ceil(len(sliced_df) / max_samples)), 1)])
-        result['samples'] = {feature_ids[column]: list(samples.loc[:, column]) for column in samples.columns}
+        # Subsample the filtered rows
+        if max_samples:
+            feature_names = [str(ftr['feature']) for ftr in feature_constraints] + [target.name]
+            step = max(np.int(np.ceil(filtered_count / max_samples)), 1)
+            sample_rows = []
+            offset = 0
+            for start, stop in chunks:
+                rows = filtered_rows(start, stop)
+                # Every step-th filtered row counted over all chunks
+                sample_rows.append(rows[-offset % step::step])
+                offset += len(rows)
+            sample_rows = np.concatenate(sample_rows) if sample_rows else np.array([], dtype=int)
+            result['samples'] = {
+                feature_ids[column]: column_values(columns[column][sample_rows], feature_labels[column])
+                for column in feature_names
+            }
 
     logger.info('Result: {0}'.format(result))
 
@@ -452,20 +824,34 @@ def calculate_conditional_distributions(target_id, feature_constraints, max_samp
     return result
 
 
-@periodic_task(run_every=(crontab(minute=15)), ignore_result=True)
-def remove_unused_dataframes(max_delta=3600):
+@periodic_task(run_every=(crontab(minute='*/5')), ignore_result=True)
+def enforce_dataframe_budget():
     """
-    Delete all in-memory information of a dataset if it wasn't accessed in the last max_delta seconds
+    Evict least recently used columns if the dataset cache grew above its high watermark, e.g. after its budget was
+    lowered. Loads evict on their own, so this is only a safety net.
+    """
+    make_room(0)
+
 
-    :param max_delta: Maximum delta in seconds
+@shared_task
+def get_cache_statistics() -> dict:
     """
-    _dataframe_lock.acquire()
+    Report the dataset cache of the worker, the web containers don't share its /dev/shm.
+    """
+    return cache_statistics()
 
-    min_time = time() - max_delta
-    for dataset_id, timestamp in _dataframe_last_access.items():
-        if timestamp < min_time:
-            del _dataframe_last_access[dataset_id]
-            del _dataframe_columns[dataset_id]
-            sa.delete(dataset_id)
 
-    _dataframe_lock.release()
+@shared_task
+def prewarm_dataset(dataset_id, columns=None):
+    """
+    Load columns of a dataset into the cache before they are requested.
+
+    :param dataset_id: The dataset uuid
+    :param columns: Names of the columns to load or None for all columns
+    """
+    get_columns(dataset_id, columns)
+
+
+@shared_task
+def evict_dataset(dataset_id):
+    remove_dataset(dataset_id)
@@ -1,8 +1,9 @@
 from factory import DjangoModelFactory, Sequence, SubFactory
-from features.models import Feature, Bin, Slice, Dataset, Experiment, ResultCalculationMap, Redundancy, \
-    Relevancy, Spectrogram, Calculation, CurrentExperiment
+from features.models import Feature, Histogram, Slice, Dataset, Experiment, ResultCalculationMap, Redundancy, \
+    Relevancy, Spectrogram, Calculation, CurrentExperiment, Upload
 from factory.fuzzy import FuzzyFloat, FuzzyInteger, FuzzyText
 from factory.django import FileField, ImageField
+from features.histograms import pack_edges, pack_counts
 from users.tests.factories import UserFactory
 from factory import post_generation
 
@@ -27,6 +28,7 @@ class FeatureFactory(DjangoModelFactory):
     mean = FuzzyFloat(0, 1)
     variance = FuzzyFloat(0, 1)
     is_categorical = False
+    stage = Feature.DONE
 
 
 class ExperimentFactory(DjangoModelFactory):
@@ -57,14 +59,13 @@ class ExperimentFactory(DjangoModelFactory):
                 self.visibility_blacklist.add(feature)
 
 
-class BinFactory(DjangoModelFactory):
+class HistogramFactory(DjangoModelFactory):
     class Meta:
-        model = Bin
+        model = Histogram
 
     feature = SubFactory(FeatureFactory)
-    from_value = FuzzyFloat(-200.0, 0)
-    to_value = FuzzyFloat(0, 200)
-    count = FuzzyInteger(1, 1000)
+    bin_edges = pack_edges([-1.0, 0.0, 2.5])
+    counts = pack_counts([4, 7])
 
 
 class ResultCalculationMapFactory(DjangoModelFactory):
@@ -140,4 +141,10 @@ class CurrentExperimentFactory(DjangoModelFactory):
         model = CurrentExperiment
 
     user = SubFactory(UserFactory)
-    experiment = SubFactory(ExperimentFactory)
\ No newline at end of file
+    experiment = SubFactory(ExperimentFactory)
+
+class UploadFactory(DjangoModelFactory):
+    class Meta:
+        model = Upload
+
+    uploaded_by = SubFactory(UserFactory)
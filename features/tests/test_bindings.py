@@ -29,6 +29,8 @@ class TestDatasetBinding(ChannelTestCase):
 
         self.assertEqual(received['payload']['data'].pop('name'), dataset.name)
         self.assertEqual(received['payload']['data'].pop('status'), dataset.status)
+        self.assertEqual(received['payload']['data'].pop('progress'), dataset.progress)
+        self.assertEqual(received['payload']['data'].pop('available_features'), dataset.available_features)
         self.assertEqual(received['payload'].pop('data'), {})
 
         self.assertEqual(received['payload'].pop('action'), 'update')
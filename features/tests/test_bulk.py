@@ -0,0 +1,40 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from features.bulk import bulk_update
+from features.models import Feature
+from features.tests.factories import FeatureFactory
+
+
+class TestBulkUpdate(TestCase):
+    def test_bulk_update(self):
+        features = [FeatureFactory(), FeatureFactory()]
+        features[0].mean = 0.5
+        features[0].categories = [1, 2]
+        features[1].mean = None
+        features[1].is_categorical = False
+
+        with self.assertNumQueries(1):
+            bulk_update(features, ['mean', 'categories', 'is_categorical'])
+
+        first_feature = Feature.objects.get(id=features[0].id)
+        self.assertEqual(first_feature.mean, 0.5)
+        self.assertEqual(first_feature.categories, [1, 2])
+        second_feature = Feature.objects.get(id=features[1].id)
+        self.assertIsNone(second_feature.mean)
+        self.assertEqual(second_feature.is_categorical, False)
+
+    def test_bulk_update_nothing(self):
+        with self.assertNumQueries(0):
+            bulk_update([], ['mean'])
+
+    def test_bulk_update_batches(self):
+        features = [FeatureFactory(), FeatureFactory(), FeatureFactory()]
+        for feature in features:
+            feature.min = 1.0
+
+        with patch('features.bulk.BULK_BATCH_SIZE', 2), self.assertNumQueries(2):
+            bulk_update(features, ['min'])
+
+        self.assertEqual(Feature.objects.filter(min=1.0).count(), 3)
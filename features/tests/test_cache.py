@@ -0,0 +1,328 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from time import time, sleep
+from unittest.mock import patch
+from uuid import uuid4
+
+import SharedArray as sa
+import numpy as np
+from django.test import TestCase, override_settings
+
+from features.cache import get_column, get_columns, get_column_names, get_dataframe, dataset_lock, last_access, \
+    remove_dataset, make_room, pin_dataset, is_pinned, cache_usage, is_out_of_core, reattach_datasets, cache_statistics, _load_columns, \
+    _read_header, _write_header, _headers, ingestion_lock, is_ingesting, _read_stats
+from features.columnar import write_columnar, remove_columnar, SparseColumn
+from features.tests.factories import DatasetFactory
+
+
+def _segment_names():
+    return [segment.name.decode('ascii') for segment in sa.list()]
+
+
+def _clear_cache():
+    with override_settings(DATASET_CACHE_BUDGET=0):
+        make_room(0)
+
+
+class TestGetColumns(TestCase):
+    def setUp(self):
+        _clear_cache()
+
+    def tearDown(self):
+        _clear_cache()
+
+    def test_get_column_names(self):
+        dataset = DatasetFactory()
+
+        self.assertEqual(get_column_names(dataset.id), ['Col1', 'Col2', 'Col3'])
+        self.assertEqual([name for name in _segment_names() if name.startswith(str(dataset.id))], [])
+
+    def test_get_column_loads_only_requested_column(self):
+        dataset = DatasetFactory()
+
+        column = get_column(dataset.id, 'Col2')
+
+        self.assertEqual(column.shape, (20,))
+        self.assertEqual(column[0], -0.24040447)
+        self.assertTrue(column.flags['C_CONTIGUOUS'])
+        self.assertIn('{0}.1'.format(dataset.id), _segment_names())
+        self.assertNotIn('{0}.0'.format(dataset.id), _segment_names())
+        self.assertNotIn('{0}.2'.format(dataset.id), _segment_names())
+
+    def test_get_columns_keeps_requested_order(self):
+        dataset = DatasetFactory()
+
+        columns = get_columns(dataset.id, ['Col3', 'Col1'])
+
+        self.assertEqual(list(columns.keys()), ['Col3', 'Col1'])
+        self.assertEqual(columns['Col3'][2], 2)
+        self.assertEqual(columns['Col1'][1], 3)
+
+    def test_get_dataframe(self):
+        dataset = DatasetFactory()
+        get_column(dataset.id, 'Col2')
+
+        dataframe = get_dataframe(dataset.id)
+
+        self.assertEqual(list(dataframe.columns), ['Col1', 'Col2', 'Col3'])
+        self.assertEqual(dataframe.shape, (20, 3))
+        self.assertEqual(dataframe['Col2'][0], -0.24040447)
+
+        # Columns wrap their shared memory segments instead of copies
+        columns = get_columns(dataset.id)
+        for column_name in ['Col1', 'Col2', 'Col3']:
+            self.assertTrue(np.shares_memory(dataframe[column_name].values, columns[column_name]))
+
+    def test_get_columns_from_columnar_files(self):
+        dataset = DatasetFactory()
+        write_columnar(dataset)
+
+        with patch('features.cache.read_csv') as read_csv_mock:
+            columns = get_columns(dataset.id, ['Col2'])
+
+        read_csv_mock.assert_not_called()
+        self.assertEqual(columns['Col2'][0], -0.24040447)
+        remove_columnar(dataset)
+
+    def test_get_sparse_column(self):
+        dataset = DatasetFactory(content__filename='sparse.csv',
+                                 content__data=b'\n'.join([b'a,b', b'3,1'] + [b'0,1'] * 39))
+        write_columnar(dataset)
+
+        column = get_column(dataset.id, 'a')
+
+        self.assertIsInstance(column, SparseColumn)
+        self.assertEqual(column.values.tolist(), [3])
+        self.assertIn('{0}.0.indices'.format(dataset.id), _segment_names())
+        self.assertEqual(get_dataframe(dataset.id)['a'].tolist(), [3] + [0] * 39)
+
+        # Both segments are reloaded if only one of them was evicted
+        sa.delete('shm://{0}.0.indices'.format(dataset.id))
+        self.assertEqual(get_column(dataset.id, 'a').indices.tolist(), [0])
+        remove_columnar(dataset)
+
+    def test_get_columns_out_of_core(self):
+        dataset = DatasetFactory()
+        write_columnar(dataset)
+
+        with self.settings(DATASET_CACHE_BUDGET=1):
+            self.assertTrue(is_out_of_core(dataset.id))
+            columns = get_columns(dataset.id, ['Col2'])
+
+        self.assertIsInstance(columns['Col2'], np.memmap)
+        self.assertEqual(columns['Col2'][0], -0.24040447)
+        self.assertNotIn('{0}.1'.format(dataset.id), _segment_names())
+        self.assertFalse(is_out_of_core(dataset.id))
+
+        # Reads from disk are counted like hits, without touching the shared counters on every read
+        disk_reads = _read_stats(str(dataset.id))['disk_reads']
+        with self.settings(DATASET_CACHE_BUDGET=1), patch('features.cache.FLUSH_INTERVAL', float('inf')):
+            get_columns(dataset.id, ['Col2'])
+        self.assertEqual(_read_stats(str(dataset.id))['disk_reads'], disk_reads)
+        dataset_statistics = next(dataset_statistics for dataset_statistics in cache_statistics()['datasets']
+                                  if dataset_statistics['id'] == str(dataset.id))
+        self.assertEqual(dataset_statistics['disk_reads'], 2)
+        remove_columnar(dataset)
+
+    def test_concurrent_miss_loads_once(self):
+        dataset = DatasetFactory()
+
+        # Threads use their own database connection and would not see the dataset of this test's transaction
+        with patch('features.cache._load_columns', wraps=_load_columns) as load_columns_mock, \
+                patch('features.cache.Dataset.objects.get', return_value=dataset):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                columns = list(executor.map(lambda _: get_column(dataset.id, 'Col1'), range(4)))
+
+        load_columns_mock.assert_called_once()
+        for column in columns:
+            self.assertEqual(column.tolist(), columns[0].tolist())
+
+
+class TestDatasetLock(TestCase):
+    def test_dataset_lock_is_per_dataset(self):
+        first_dataset_id = str(uuid4())
+        second_dataset_id = str(uuid4())
+
+        def acquire(dataset_id):
+            with dataset_lock(dataset_id):
+                return True
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with dataset_lock(first_dataset_id):
+                # Different datasets never wait for each other
+                self.assertTrue(executor.submit(acquire, second_dataset_id).result(timeout=5))
+
+                # The same dataset has to wait until the lock is released
+                future = executor.submit(acquire, first_dataset_id)
+                self.assertRaises(TimeoutError, future.result, timeout=0.5)
+            self.assertTrue(future.result(timeout=5))
+
+    def test_ingestion_lock(self):
+        dataset_id = str(uuid4())
+        self.assertFalse(is_ingesting(dataset_id))
+
+        with ingestion_lock(dataset_id) as acquired:
+            self.assertTrue(acquired)
+            self.assertTrue(is_ingesting(dataset_id))
+
+            # A second ingestion of the same dataset does not wait for the first one
+            with ingestion_lock(dataset_id) as acquired_again:
+                self.assertFalse(acquired_again)
+        self.assertFalse(is_ingesting(dataset_id))
+
+    def test_last_access(self):
+        dataset = DatasetFactory()
+        self.assertIsNone(last_access(dataset.id))
+
+        get_column(dataset.id, 'Col1')
+        self.assertLessEqual(last_access(dataset.id), time())
+
+        remove_dataset(dataset.id)
+        self.assertIsNone(last_access(dataset.id))
+
+
+class TestMakeRoom(TestCase):
+    def setUp(self):
+        _clear_cache()
+
+    def tearDown(self):
+        _clear_cache()
+
+    def test_evicts_least_recently_used_columns(self):
+        dataset = DatasetFactory()
+        get_columns(dataset.id)
+        sleep(0.01)
+        get_column(dataset.id, 'Col2')
+
+        # Each column segment has 20 float64 values plus SharedArray's metadata
+        usage = cache_usage()
+        column_size = usage // 3
+        with self.settings(DATASET_CACHE_BUDGET=usage, DATASET_CACHE_HIGH_WATERMARK=1.0,
+                           DATASET_CACHE_LOW_WATERMARK=1.0):
+            make_room(2 * column_size)
+
+        self.assertEqual(cache_usage(), column_size)
+        self.assertIn('{0}.1'.format(dataset.id), _segment_names())
+
+    def test_does_not_evict_pinned_datasets(self):
+        pinned_dataset = DatasetFactory()
+        dataset = DatasetFactory()
+
+        with pin_dataset(pinned_dataset.id):
+            self.assertTrue(is_pinned(pinned_dataset.id))
+            self.assertFalse(is_pinned(dataset.id))
+
+            get_column(pinned_dataset.id, 'Col1')
+            get_column(dataset.id, 'Col1')
+
+            with self.settings(DATASET_CACHE_BUDGET=0):
+                make_room(0)
+
+            self.assertIn('{0}.0'.format(pinned_dataset.id), _segment_names())
+            self.assertNotIn('{0}.0'.format(dataset.id), _segment_names())
+
+        self.assertFalse(is_pinned(pinned_dataset.id))
+
+    def test_below_high_watermark(self):
+        dataset = DatasetFactory()
+        get_columns(dataset.id)
+        usage = cache_usage()
+
+        with self.settings(DATASET_CACHE_BUDGET=2 * usage, DATASET_CACHE_HIGH_WATERMARK=0.5,
+                           DATASET_CACHE_LOW_WATERMARK=0.1):
+            make_room(0)
+
+        self.assertEqual(cache_usage(), usage)
+
+
+class TestReattachDatasets(TestCase):
+    def setUp(self):
+        _clear_cache()
+        self.dataset = DatasetFactory()
+        write_columnar(self.dataset)
+        get_column(self.dataset.id, 'Col2')
+
+    def tearDown(self):
+        remove_dataset(self.dataset.id)
+        remove_columnar(self.dataset)
+        _clear_cache()
+
+    def test_header_describes_segments(self):
+        header = _read_header(str(self.dataset.id))
+
+        self.assertEqual(header['columns'], ['Col1', 'Col2', 'Col3'])
+        self.assertEqual(header['dtypes'], ['|u1', '<f8', '|u1'])
+        self.assertEqual(header['rows'], 20)
+        self.assertEqual(len(header['checksum']), 64)
+        self.assertLessEqual(header['created_at'], time())
+
+    def test_reattach_datasets(self):
+        # A restarted process knows nothing but /dev/shm
+        _headers.clear()
+
+        self.assertIn(str(self.dataset.id), reattach_datasets())
+        self.assertIn(str(self.dataset.id), _headers)
+
+        with patch('features.cache._load_columns') as load_columns_mock:
+            self.assertEqual(get_column(self.dataset.id, 'Col2')[0], -0.24040447)
+        load_columns_mock.assert_not_called()
+
+    def test_reattach_datasets_removes_stale_segments(self):
+        header = _read_header(str(self.dataset.id))
+        header['checksum'] = '0' * 64
+        _write_header(str(self.dataset.id), header)
+        sa.create('shm://{0}.0.loading'.format(self.dataset.id), (1,))
+
+        self.assertNotIn(str(self.dataset.id), reattach_datasets())
+
+        self.assertEqual([name for name in _segment_names() if name.startswith(str(self.dataset.id))], [])
+        self.assertIsNone(_read_header(str(self.dataset.id)))
+
+
+class TestCacheStatistics(TestCase):
+    def setUp(self):
+        _clear_cache()
+
+    def tearDown(self):
+        _clear_cache()
+
+    def test_cache_statistics(self):
+        dataset = DatasetFactory()
+        get_column(dataset.id, 'Col1')
+        get_column(dataset.id, 'Col1')
+        get_columns(dataset.id, ['Col1', 'Col2'])
+
+        statistics = cache_statistics()
+        dataset_statistics = next(dataset_statistics for dataset_statistics in statistics['datasets']
+                                  if dataset_statistics['id'] == str(dataset.id))
+
+        self.assertEqual(dataset_statistics['hits'], 1)
+        self.assertEqual(dataset_statistics['misses'], 2)
+        self.assertEqual(dataset_statistics['segments'], 2)
+        self.assertEqual(sum(dataset_statistics['load_seconds']['counts']), 2)
+        self.assertEqual(dataset_statistics['last_access'], last_access(dataset.id))
+        self.assertEqual(statistics['usage'], cache_usage())
+
+        remove_dataset(dataset.id)
+        dataset_statistics = next(dataset_statistics for dataset_statistics in cache_statistics()['datasets']
+                                  if dataset_statistics['id'] == str(dataset.id))
+        self.assertEqual(dataset_statistics['evictions'], 2)
+        self.assertEqual(dataset_statistics['resident_bytes'], 0)
+
+    def test_hits_are_flushed(self):
+        dataset = DatasetFactory()
+        get_column(dataset.id, 'Col1')
+
+        # Hits stay in memory until the interval passed
+        with patch('features.cache.FLUSH_INTERVAL', float('inf')):
+            get_column(dataset.id, 'Col1')
+        self.assertEqual(_read_stats(str(dataset.id))['hits'], 0)
+
+        with patch('features.cache.FLUSH_INTERVAL', 0):
+            get_column(dataset.id, 'Col1')
+        self.assertEqual(_read_stats(str(dataset.id))['hits'], 2)
+
+        # Misses and evictions take the hits along
+        with patch('features.cache.FLUSH_INTERVAL', float('inf')):
+            get_column(dataset.id, 'Col1')
+        remove_dataset(dataset.id)
+        self.assertEqual(_read_stats(str(dataset.id))['hits'], 3)
@@ -0,0 +1,76 @@
+from unittest.mock import patch
+
+import numpy as np
+from django.test import TestCase
+
+from features.chunked import statistics, histogram, iter_chunks, block_statistics, block_histograms
+
+
+class TestChunked(TestCase):
+    def setUp(self):
+        self.column = np.array([1.5, -2.0, np.nan, 4.0, 4.0, 0.25, 7.0, -3.5])
+
+    def test_iter_chunks(self):
+        chunks = list(iter_chunks(self.column, chunk_size=3))
+
+        self.assertEqual([start for start, _ in chunks], [0, 3, 6])
+        np.testing.assert_array_equal(np.concatenate([chunk for _, chunk in chunks]), self.column)
+
+    def test_statistics(self):
+        with patch('features.chunked.CHUNK_SIZE', 3):
+            column_statistics = statistics(self.column[~np.isnan(self.column)])
+
+        self.assertEqual(column_statistics['min'], -3.5)
+        self.assertEqual(column_statistics['max'], 7.0)
+        self.assertAlmostEqual(column_statistics['mean'], np.nanmean(self.column))
+        self.assertAlmostEqual(column_statistics['variance'], np.nanvar(self.column))
+        np.testing.assert_array_equal(column_statistics['unique'], np.unique(self.column[~np.isnan(self.column)]))
+
+    def test_statistics_missing_values(self):
+        with patch('features.chunked.CHUNK_SIZE', 3):
+            column_statistics = statistics(self.column, max_unique=5)
+
+        # Missing values propagate like in numpy, except for the variance
+        self.assertTrue(np.isnan(column_statistics['min']))
+        self.assertTrue(np.isnan(column_statistics['mean']))
+        self.assertAlmostEqual(column_statistics['variance'], np.nanvar(self.column))
+        self.assertIsNone(column_statistics['unique'])
+
+    def test_histogram(self):
+        column = self.column[~np.isnan(self.column)]
+        with patch('features.chunked.CHUNK_SIZE', 3):
+            counts, bin_edges = histogram(column, bins=4)
+
+        expected_counts, expected_bin_edges = np.histogram(column, bins=4)
+        np.testing.assert_array_equal(counts, expected_counts)
+        np.testing.assert_array_almost_equal(bin_edges, expected_bin_edges)
+
+    def test_block_statistics(self):
+        columns = [self.column, np.nan_to_num(self.column), np.arange(8, dtype=np.uint8)]
+
+        # Three rows per chunk
+        with patch('features.chunked.BLOCK_CHUNK_BYTES', 3 * 8 * len(columns)):
+            block = block_statistics(columns, max_unique=[None, 5, 10])
+
+        for column, column_statistics, max_unique in zip(columns, block, [None, 5, 10]):
+            expected_statistics = statistics(column, max_unique=max_unique)
+            np.testing.assert_equal(column_statistics['min'], expected_statistics['min'])
+            np.testing.assert_equal(column_statistics['max'], expected_statistics['max'])
+            np.testing.assert_almost_equal(column_statistics['mean'], expected_statistics['mean'])
+            np.testing.assert_almost_equal(column_statistics['variance'], expected_statistics['variance'])
+            np.testing.assert_array_equal(column_statistics['unique'], expected_statistics['unique'])
+        self.assertEqual(block[0]['range'], (-3.5, 7.0))
+        self.assertEqual(block[2]['min'].dtype, np.uint8)
+
+    def test_block_histograms(self):
+        columns = [self.column, np.array([2.0] * 8), np.arange(8, dtype=np.uint8)]
+
+        with patch('features.chunked.BLOCK_CHUNK_BYTES', 3 * 8 * len(columns)):
+            histograms = block_histograms(columns, bins=[4, 3, 8], ranges=[(-3.5, 7.0), (2.0, 2.0), (0, 7)])
+
+        for column, bins, (counts, bin_edges) in zip(columns, [4, 3, 8], histograms):
+            finite_column = column[~np.isnan(column)]
+            expected_counts, expected_bin_edges = np.histogram(finite_column, bins=bins,
+                                                               range=(finite_column.min(), finite_column.max()))
+            np.testing.assert_array_equal(counts, expected_counts)
+            np.testing.assert_array_almost_equal(bin_edges, expected_bin_edges)
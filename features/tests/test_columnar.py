@@ -0,0 +1,273 @@
+import gzip
+import os
+from unittest.mock import patch
+
+import numpy as np
+from django.test import TestCase
+from pandas import read_csv
+
+from features.columnar import write_columnar, read_manifest, open_columns, columnar_path, remove_columnar, \
+    read_labels, read_preview, SparseColumn, _DtypeInference, _line_aligned_ranges
+from features.tests.factories import DatasetFactory
+
+
+class TestWriteColumnar(TestCase):
+    def tearDown(self):
+        remove_columnar(self.dataset)
+
+    def test_write_columnar(self):
+        self.dataset = DatasetFactory()
+        self.assertIsNone(read_manifest(self.dataset))
+
+        # Make sure that more than one chunk gets written
+        with patch('features.columnar.CHUNK_SIZE', 7):
+            manifest = write_columnar(self.dataset)
+
+        self.assertEqual(manifest, read_manifest(self.dataset))
+        self.assertEqual(manifest['rows'], 20)
+        self.assertEqual([column['name'] for column in manifest['columns']], ['Col1', 'Col2', 'Col3'])
+        self.assertTrue(os.path.isfile(os.path.join(columnar_path(self.dataset), '1.npy')))
+
+        dataframe = read_csv(self.dataset.content.path)
+        columns = open_columns(self.dataset, manifest, ['Col2', 'Col3'])
+        self.assertEqual(list(columns.keys()), ['Col2', 'Col3'])
+        np.testing.assert_array_equal(columns['Col2'], dataframe['Col2'].values)
+        np.testing.assert_array_equal(columns['Col3'], dataframe['Col3'].values)
+
+        # Integer columns are narrowed, the floats have too many significant digits for float32
+        self.assertEqual([column['dtype'] for column in manifest['columns']], ['|u1', '<f8', '|u1'])
+        self.assertEqual(columns['Col3'].dtype, np.uint8)
+
+        # Statistics are sketched while parsing
+        statistics = manifest['columns'][1]['statistics']
+        self.assertEqual(statistics['count'], 20)
+        self.assertEqual(statistics['missing_count'], 0)
+        self.assertEqual(statistics['min'], dataframe['Col2'].min())
+        self.assertAlmostEqual(statistics['mean'], dataframe['Col2'].mean())
+        self.assertAlmostEqual(statistics['variance'], np.var(dataframe['Col2'].values))
+        self.assertEqual(statistics['quantiles']['100'], dataframe['Col2'].max())
+        self.assertIn(statistics['quantiles']['50'], dataframe['Col2'].values)
+        self.assertEqual(manifest['columns'][2]['statistics']['unique'], np.unique(dataframe['Col3']).tolist())
+
+    def test_write_columnar_text_columns(self):
+        self.dataset = DatasetFactory(content__filename='text.csv',
+                                      content__data=b'device,status,value\ndev-a,ok,1\ndev-b,fail,2\ndev-a,,3\n'
+                                                    b'dev-c,ok,4\ndev-b,ok,5\n')
+
+        with patch('features.columnar.CHUNK_SIZE', 2):
+            manifest = write_columnar(self.dataset)
+
+        # Text is stored as codes in order of appearance, missing text gets -1
+        columns = open_columns(self.dataset, manifest, ['device', 'status'])
+        self.assertEqual(columns['device'].tolist(), [0, 1, 0, 2, 1])
+        self.assertEqual(columns['status'].tolist(), [0, 1, -1, 0, 0])
+        self.assertEqual([column['dtype'] for column in manifest['columns']], ['|u1', '|i1', '|u1'])
+
+        self.assertEqual(read_labels(self.dataset, manifest, 'device'), ['dev-a', 'dev-b', 'dev-c'])
+        self.assertEqual(read_labels(self.dataset, manifest, 'status'), ['ok', 'fail'])
+        self.assertIsNone(read_labels(self.dataset, manifest, 'value'))
+
+        # Missing text is counted as missing, not as the code -1
+        statistics = manifest['columns'][1]['statistics']
+        self.assertEqual(statistics['missing_count'], 1)
+        self.assertEqual((statistics['quantiles']['0'], statistics['quantiles']['100']), (0, 1))
+        self.assertEqual(statistics['unique'], [0, 1])
+
+    def test_write_columnar_sparse_columns(self):
+        rows = [b'0,0.5', b'2.5,0.5'] + [b'0,0.5'] * 57 + [b'-1,0.5']
+        self.dataset = DatasetFactory(content__filename='sparse.csv', content__data=b'\n'.join([b'a,b'] + rows))
+
+        with patch('features.columnar.CHUNK_SIZE', 7):
+            manifest = write_columnar(self.dataset)
+
+        self.assertEqual(manifest['columns'][0]['indices'], '0.indices.npy')
+        self.assertNotIn('indices', manifest['columns'][1])
+
+        columns = open_columns(self.dataset, manifest, ['a', 'b'])
+        self.assertIsInstance(columns['a'], SparseColumn)
+        self.assertEqual(columns['a'].indices.tolist(), [1, 59])
+        self.assertEqual(columns['a'].values.tolist(), [2.5, -1])
+        self.assertEqual(len(columns['a']), 60)
+        np.testing.assert_array_equal(np.asarray(columns['a']), read_csv(self.dataset.content.path)['a'].values)
+
+    def test_write_columnar_ranges(self):
+        rows = [b'dev-a,1', b'dev-b,2', b'dev-a,3', b'dev-c,4', b'dev-b,5', b',6', b'dev-d,7', b'dev-a,8']
+        self.dataset = DatasetFactory(content__filename='ranges.csv',
+                                      content__data=b'\n'.join([b'device,value'] + rows))
+        progress = []
+
+        # Every range holds about two rows and is parsed in more than one chunk
+        with patch('features.columnar.MIN_RANGE_SIZE', 16), patch('features.columnar.PARSE_THREADS', 4), \
+                patch('features.columnar.CHUNK_SIZE', 1):
+            manifest = write_columnar(self.dataset, progress=progress.append)
+
+        self.assertEqual(manifest['rows'], 8)
+        self.assertGreater(len(progress), 1)
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], 1)
+        self.assertNotIn('part0.bin', os.listdir(columnar_path(self.dataset)))
+
+        # Codes of the ranges are merged in the order the labels appear in the file
+        columns = open_columns(self.dataset, manifest, ['device', 'value'])
+        self.assertEqual(columns['device'].tolist(), [0, 1, 0, 2, 1, -1, 3, 0])
+        self.assertEqual(read_labels(self.dataset, manifest, 'device'), ['dev-a', 'dev-b', 'dev-c', 'dev-d'])
+        self.assertEqual(columns['value'].tolist(), list(range(1, 9)))
+        self.assertEqual([column['dtype'] for column in manifest['columns']], ['|i1', '|u1'])
+
+    def test_write_columnar_gzip(self):
+        data = b'value,status\n1,ok\n2,fail\n3,ok\n4,\n'
+        self.dataset = DatasetFactory(content__filename='data.csv.gz', content__data=gzip.compress(data))
+
+        with patch('features.columnar.CHUNK_SIZE', 3):
+            manifest = write_columnar(self.dataset)
+
+        self.assertEqual(manifest['rows'], 4)
+        columns = open_columns(self.dataset, manifest, ['value', 'status'])
+        self.assertEqual(columns['value'].tolist(), [1, 2, 3, 4])
+        self.assertEqual(columns['status'].tolist(), [0, 1, 0, -1])
+
+    def test_write_columnar_npz(self):
+        self.dataset = DatasetFactory(content__filename='data.npz', content__data=b'')
+        with open(self.dataset.content.path, 'wb') as npz_file:
+            np.savez_compressed(npz_file, ints=np.arange(5, dtype=np.int64), flags=np.array([True, False] * 2 + [True]),
+                                floats=np.linspace(0, 1, 5, dtype=np.float32), text=np.array(list('abacb')))
+        progress = []
+
+        with patch('features.columnar.CHUNK_SIZE', 2):
+            manifest = write_columnar(self.dataset, progress=progress.append)
+
+        # Types are carried over and narrowed, arrays of strings are dictionary encoded
+        self.assertEqual(manifest['rows'], 5)
+        self.assertEqual([column['name'] for column in manifest['columns']], ['ints', 'flags', 'floats', 'text'])
+        self.assertEqual([column['dtype'] for column in manifest['columns']], ['|u1', '|b1', '<f4', '|u1'])
+        self.assertEqual(progress[-1], 1)
+
+        columns = open_columns(self.dataset, manifest, ['ints', 'floats', 'text'])
+        self.assertEqual(columns['ints'].tolist(), [0, 1, 2, 3, 4])
+        np.testing.assert_array_equal(columns['floats'], np.linspace(0, 1, 5, dtype=np.float32))
+        self.assertEqual(columns['text'].tolist(), [0, 1, 0, 2, 1])
+        self.assertEqual(read_labels(self.dataset, manifest, 'text'), ['a', 'b', 'c'])
+
+    def test_write_columnar_parquet(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.dataset = DatasetFactory(content__filename='data.parquet', content__data=b'')
+        table = pyarrow.table({'ints': pyarrow.array([1, None, 3], type=pyarrow.int32()),
+                               'text': pyarrow.array(['x', None, 'y']).dictionary_encode()})
+        pyarrow.parquet.write_table(table, self.dataset.content.path, row_group_size=2)
+
+        # Chunks of the columns alternate, so their files are closed and appended to again
+        with patch('features.columnar.MAX_OPEN_FILES', 1):
+            manifest = write_columnar(self.dataset)
+
+        # Integers with missing values are floats
+        self.assertEqual([column['dtype'] for column in manifest['columns']], ['<f4', '|i1'])
+        columns = open_columns(self.dataset, manifest, ['ints', 'text'])
+        np.testing.assert_array_equal(columns['ints'], [1, np.nan, 3])
+        self.assertEqual(columns['text'].tolist(), [0, -1, 1])
+
+    def test_read_preview(self):
+        self.dataset = DatasetFactory(content__filename='text.csv',
+                                      content__data=b'device,status,value\ndev-a,ok,1.5\ndev-b,,\ndev-a,fail,3\n')
+
+        # The head of the content is read before the columnar files are written
+        preview = read_preview(self.dataset, rows=2)
+        self.assertEqual(preview['columns'], [{'name': 'device', 'dtype': '|O', 'text': True},
+                                              {'name': 'status', 'dtype': '|O', 'text': True},
+                                              {'name': 'value', 'dtype': '<f4', 'text': False}])
+        self.assertEqual(preview['rows'], [['dev-a', 'ok', 1.5], ['dev-b', None, None]])
+
+        write_columnar(self.dataset)
+        preview = read_preview(self.dataset, rows=5)
+        self.assertEqual([column['text'] for column in preview['columns']], [True, True, False])
+        self.assertEqual(preview['rows'], [['dev-a', 'ok', 1.5], ['dev-b', None, None], ['dev-a', 'fail', 3.0]])
+
+    def test_read_preview_npz(self):
+        self.dataset = DatasetFactory(content__filename='data.npz', content__data=b'')
+        with open(self.dataset.content.path, 'wb') as npz_file:
+            np.savez_compressed(npz_file, ints=np.arange(1000), floats=np.linspace(0, 1, 1000, dtype=np.float32))
+
+        preview = read_preview(self.dataset, rows=2)
+        self.assertEqual(preview['columns'], [{'name': 'ints', 'dtype': '|u1', 'text': False},
+                                              {'name': 'floats', 'dtype': '<f4', 'text': False}])
+        self.assertEqual(preview['rows'], [[0, 0.0], [1, 0.001001001]])
+
+    def test_read_preview_float32(self):
+        self.dataset = DatasetFactory(content__filename='narrow.csv', content__data=b'a\n-0.845\n3.14159\n')
+        write_columnar(self.dataset)
+
+        # Narrowed columns show the values of the source, not the nearest float32
+        preview = read_preview(self.dataset, rows=2)
+        self.assertEqual(preview['columns'], [{'name': 'a', 'dtype': '<f4', 'text': False}])
+        self.assertEqual(preview['rows'], [[-0.845], [3.14159]])
+
+    def test_line_aligned_ranges(self):
+        self.dataset = DatasetFactory(content__filename='lines.csv', content__data=b'a\n1\n22\n333\n4444\n')
+
+        with patch('features.columnar.MIN_RANGE_SIZE', 1):
+            self.assertEqual(_line_aligned_ranges(self.dataset.content.path, 1), [(2, 16)])
+            self.assertEqual(_line_aligned_ranges(self.dataset.content.path, 2), [(2, 11), (11, 16)])
+            self.assertEqual(_line_aligned_ranges(self.dataset.content.path, 4), [(2, 7), (7, 11), (11, 16)])
+
+        # Small files are not split
+        self.assertEqual(_line_aligned_ranges(self.dataset.content.path, 4), [(2, 16)])
+
+    def test_remove_columnar(self):
+        self.dataset = DatasetFactory()
+        write_columnar(self.dataset)
+
+        remove_columnar(self.dataset)
+
+        self.assertFalse(os.path.exists(columnar_path(self.dataset)))
+        self.assertIsNone(read_manifest(self.dataset))
+
+
+class TestDtypeInference(TestCase):
+    def test_dtype(self):
+        def infer(*chunks):
+            inference = _DtypeInference()
+            for chunk in chunks:
+                inference.update(np.array(chunk))
+            return inference.dtype()
+
+        self.assertEqual(infer([True, False], [False]), np.bool_)
+        self.assertEqual(infer([0.0, 1.0], [2.0, 255.0]), np.uint8)
+        self.assertEqual(infer([-3.0, 1.0], [2.0, 255.0]), np.int16)
+        self.assertEqual(infer([0.0, 70000.0]), np.uint32)
+        self.assertEqual(infer([-1.0, 1.0]), np.int8)
+        self.assertEqual(infer([1.0, np.nan]), np.float32)
+        self.assertEqual(infer([0.5, 1.25], [1e-3]), np.float32)
+        self.assertEqual(infer([0.5, 1.25], [0.2011319]), np.float64)
+        self.assertEqual(infer(np.array([0.2011319], dtype=np.float32)), np.float32)
+        self.assertEqual(infer([]), np.float64)
+
+
+class TestSparseColumn(TestCase):
+    def setUp(self):
+        self.column = SparseColumn(np.array([1, 5]), np.array([2.0, -1.0]), 8)
+        self.dense = np.array([0, 2.0, 0, 0, 0, -1.0, 0, 0])
+
+    def test_indexing(self):
+        np.testing.assert_array_equal(np.asarray(self.column), self.dense)
+        np.testing.assert_array_equal(self.column[::3], self.dense[::3])
+        np.testing.assert_array_equal(self.column[np.array([5, 6])], self.dense[[5, 6]])
+        np.testing.assert_array_equal(self.column[self.dense > 1], self.dense[self.dense > 1])
+
+    def test_statistics(self):
+        self.assertEqual(self.column.min(), np.amin(self.dense))
+        self.assertEqual(self.column.max(), np.amax(self.dense))
+        self.assertAlmostEqual(self.column.mean(), np.mean(self.dense))
+        self.assertAlmostEqual(self.column.nanvar(), np.nanvar(self.dense))
+        np.testing.assert_array_equal(self.column.unique(), np.unique(self.dense))
+
+    def test_histogram(self):
+        counts, bin_edges = self.column.histogram(bins=3)
+        expected_counts, expected_bin_edges = np.histogram(self.dense, bins=3)
+
+        np.testing.assert_array_equal(counts, expected_counts)
+        np.testing.assert_array_equal(bin_edges, expected_bin_edges)
+
+    def test_mask(self):
+        np.testing.assert_array_equal(self.column.mask(lambda values: values <= 0), self.dense <= 0)
+        np.testing.assert_array_equal(self.column.mask(lambda values: values > 1), self.dense > 1)
@@ -0,0 +1,38 @@
+from io import StringIO
+from unittest.mock import patch
+from uuid import uuid4
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+
+from features.tests.factories import DatasetFactory
+
+
+class TestDatasetCacheCommand(TestCase):
+    def test_stats(self):
+        output = StringIO()
+        with patch('features.management.commands.dataset_cache.get_cache_statistics.apply_async') as task_mock:
+            task_mock.return_value.get.return_value = {'budget': 1024, 'usage': 0, 'datasets': []}
+            call_command('dataset_cache', 'stats', stdout=output)
+
+        self.assertIn('"budget": 1024', output.getvalue())
+
+    def test_prewarm(self):
+        dataset = DatasetFactory()
+
+        with patch('features.management.commands.dataset_cache.prewarm_dataset.apply_async') as task_mock:
+            call_command('dataset_cache', 'prewarm', str(dataset.id), '--columns', 'Col1', stdout=StringIO())
+
+        task_mock.assert_called_once_with(kwargs={'dataset_id': str(dataset.id), 'columns': ['Col1']})
+
+    def test_evict(self):
+        dataset = DatasetFactory()
+
+        with patch('features.management.commands.dataset_cache.evict_dataset.apply_async') as task_mock:
+            call_command('dataset_cache', 'evict', str(dataset.id), stdout=StringIO())
+
+        task_mock.assert_called_once_with(kwargs={'dataset_id': str(dataset.id)})
+
+    def test_unknown_dataset(self):
+        self.assertRaises(CommandError, call_command, 'dataset_cache', 'evict', str(uuid4()))
+        self.assertRaises(CommandError, call_command, 'dataset_cache', 'prewarm')
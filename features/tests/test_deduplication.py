@@ -0,0 +1,146 @@
+import os
+from unittest.mock import patch
+
+import numpy as np
+from django.test import TestCase
+
+from features.columnar import write_columnar, remove_columnar, read_manifest, open_columns
+from features.deduplication import find_duplicate, copy_columnar, copy_features, copy_results, copy_densities
+from features.histograms import unpack_edges, unpack_counts
+from features.models import Dataset, Feature, Histogram, Spectrogram, ResultCalculationMap, Calculation, Relevancy, \
+    Redundancy, Density, Slice
+from features.tests.factories import DatasetFactory, FeatureFactory, HistogramFactory, SpectrogramFactory, \
+    ResultCalculationMapFactory, CalculationFactory, RelevancyFactory, RedundancyFactory, SliceFactory
+
+
+class TestDeduplication(TestCase):
+    def setUp(self):
+        self.source = DatasetFactory(checksum='a' * 64, status=Dataset.DONE)
+        self.dataset = DatasetFactory(checksum='a' * 64)
+
+    def tearDown(self):
+        remove_columnar(self.source)
+        remove_columnar(self.dataset)
+
+    def test_find_duplicate(self):
+        # Datasets without columnar files or that are still processed are not reused
+        self.assertIsNone(find_duplicate(self.dataset))
+        write_columnar(self.source)
+        self.assertEqual(find_duplicate(self.dataset), self.source)
+
+        self.source.status = Dataset.PROCESSING
+        self.source.save()
+        self.assertIsNone(find_duplicate(self.dataset))
+        self.assertIsNone(find_duplicate(DatasetFactory()))
+
+    def test_copy_columnar(self):
+        manifest = write_columnar(self.source)
+
+        copy_columnar(self.source, self.dataset)
+
+        self.assertEqual(read_manifest(self.dataset), manifest)
+        np.testing.assert_array_equal(open_columns(self.dataset, manifest, ['Col1'])['Col1'],
+                                      open_columns(self.source, manifest, ['Col1'])['Col1'])
+
+    def test_copy_features(self):
+        source_feature = FeatureFactory(dataset=self.source, name='Col1', labels=['a', 'b'])
+        HistogramFactory(feature=source_feature)
+        SpectrogramFactory(feature=source_feature, width=20, height=10)
+
+        features = copy_features(self.source, self.dataset)
+
+        feature = Feature.objects.get(dataset=self.dataset)
+        self.assertEqual(features, {'Col1': feature})
+        self.assertNotEqual(feature.id, source_feature.id)
+        self.assertEqual((feature.mean, feature.variance, feature.min, feature.max, feature.labels),
+                         (source_feature.mean, source_feature.variance, source_feature.min, source_feature.max,
+                          source_feature.labels))
+        histogram = Histogram.objects.get(feature=feature)
+        self.assertEqual(unpack_edges(histogram.bin_edges).tolist(), [-1.0, 0.0, 2.5])
+        self.assertEqual(unpack_counts(histogram.counts).tolist(), [4, 7])
+        self.assertIsNone(histogram.levels)
+
+        spectrogram = Spectrogram.objects.get(feature=feature)
+        self.assertEqual((spectrogram.width, spectrogram.height), (20, 10))
+        self.assertTrue(os.path.isfile(spectrogram.image.name))
+        self.assertIn(str(feature.id), spectrogram.image.name)
+        os.remove(spectrogram.image.name)
+
+    def test_copy_results(self):
+        source_target = FeatureFactory(dataset=self.source, name='target')
+        source_feature = FeatureFactory(dataset=self.source, name='feature')
+        source_map = ResultCalculationMapFactory(target=source_target)
+        source_calculation = CalculationFactory(result_calculation_map=source_map, type=Calculation.DEFAULT_HICS,
+                                                max_iteration=30, current_iteration=30)
+        source_calculation.features.set([source_feature])
+        RelevancyFactory(result_calculation_map=source_map, features=[source_feature], relevancy=0.5)
+        RedundancyFactory(result_calculation_map=source_map, first_feature=source_target,
+                          second_feature=source_feature, redundancy=0.25)
+
+        target = FeatureFactory(dataset=self.dataset, name='target')
+        feature = FeatureFactory(dataset=self.dataset, name='feature')
+        result_calculation_map = ResultCalculationMap.objects.create(target=target)
+
+        self.assertTrue(copy_results(result_calculation_map))
+
+        calculation = Calculation.objects.get(result_calculation_map=result_calculation_map)
+        self.assertEqual((calculation.type, calculation.current_iteration), (Calculation.DEFAULT_HICS, 30))
+        self.assertEqual(list(calculation.features.all()), [feature])
+        relevancy = Relevancy.objects.get(result_calculation_map=result_calculation_map)
+        self.assertEqual(relevancy.relevancy, 0.5)
+        self.assertEqual(list(relevancy.features.all()), [feature])
+        redundancy = Redundancy.objects.get(result_calculation_map=result_calculation_map)
+        self.assertEqual((redundancy.first_feature, redundancy.second_feature, redundancy.redundancy),
+                         (target, feature, 0.25))
+
+    def test_copy_results_slices(self):
+        source_target = FeatureFactory(dataset=self.source, name='target')
+        source_feature = FeatureFactory(dataset=self.source, name='feature')
+        source_map = ResultCalculationMapFactory(target=source_target)
+        CalculationFactory(result_calculation_map=source_map, type=Calculation.DEFAULT_HICS, max_iteration=30,
+                           current_iteration=30)
+        SliceFactory(result_calculation_map=source_map, features=[source_feature], object_definition={'key': 'value'},
+                     output_definition={'features': [str(source_feature.id)]})
+
+        target = FeatureFactory(dataset=self.dataset, name='target')
+        feature = FeatureFactory(dataset=self.dataset, name='feature')
+        result_calculation_map = ResultCalculationMap.objects.create(target=target)
+
+        with patch('features.deduplication.ScoredSlices.from_dict') as from_dict_mock:
+            from_dict_mock.return_value.to_output.side_effect = lambda name_mapping: {
+                'features': [name_mapping('feature')]}
+            self.assertTrue(copy_results(result_calculation_map))
+
+        # The output is rebuilt from the definition with the ids of the copied features
+        from_dict_mock.assert_called_once_with({'key': 'value'})
+        copied_slice = Slice.objects.get(result_calculation_map=result_calculation_map)
+        self.assertEqual(copied_slice.output_definition, {'features': [str(feature.id)]})
+        self.assertEqual(list(copied_slice.features.all()), [feature])
+
+    def test_copy_results_incomplete(self):
+        source_map = ResultCalculationMapFactory(target=FeatureFactory(dataset=self.source, name='target'))
+        CalculationFactory(result_calculation_map=source_map, type=Calculation.DEFAULT_HICS, max_iteration=30,
+                           current_iteration=10)
+        result_calculation_map = ResultCalculationMap.objects.create(
+            target=FeatureFactory(dataset=self.dataset, name='target'))
+
+        self.assertFalse(copy_results(result_calculation_map))
+        self.assertFalse(Calculation.objects.filter(result_calculation_map=result_calculation_map).exists())
+
+    def test_copy_densities(self):
+        source_target = FeatureFactory(dataset=self.source, name='target')
+        source_feature = FeatureFactory(dataset=self.source, name='feature')
+        Density.objects.create(target=source_target, feature=source_feature, target_classes=[0, 1],
+                               values=b'\x00' * 8)
+
+        target = FeatureFactory(dataset=self.dataset, name='target')
+        feature = FeatureFactory(dataset=self.dataset, name='feature')
+
+        self.assertTrue(copy_densities(target))
+
+        density = Density.objects.get(target=target)
+        self.assertEqual((density.feature, density.target_classes, bytes(density.values)),
+                         (feature, [0, 1], b'\x00' * 8))
+
+        # Targets without densities in any duplicate are calculated
+        self.assertFalse(copy_densities(FeatureFactory(dataset=self.dataset, name='other')))
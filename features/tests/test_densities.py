@@ -0,0 +1,52 @@
+import numpy as np
+from django.test import TestCase
+
+from features.densities import class_densities, class_codes, feature_densities, silverman_bandwidth, DENSITY_POINTS
+
+
+class TestDensities(TestCase):
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.classes = random_state.randint(0, 3, size=3000).astype(float)
+        self.values = random_state.normal(size=3000) + 2 * self.classes
+
+    def test_silverman_bandwidth(self):
+        self.assertAlmostEqual(silverman_bandwidth(self.values[self.classes == 0]), 0.9 * 1000 ** -0.2, delta=0.03)
+        self.assertEqual(silverman_bandwidth(np.array([1.0, 1.0])), 0)
+        self.assertEqual(silverman_bandwidth(np.array([1.0])), 0)
+
+    def test_class_densities(self):
+        densities = class_densities(self.values, self.classes, [0, 1, 2], -4, 8)
+        self.assertEqual(densities.shape, (3, DENSITY_POINTS))
+
+        # Every class matches a direct evaluation of its Gaussian kernels
+        points = np.linspace(-4, 8, DENSITY_POINTS)
+        for category in range(3):
+            values = self.values[self.classes == category]
+            bandwidth = silverman_bandwidth(values)
+            expected_densities = np.mean(np.exp(-0.5 * ((points[:, np.newaxis] - values) / bandwidth) ** 2), axis=1) / \
+                (bandwidth * np.sqrt(2 * np.pi))
+            np.testing.assert_allclose(densities[category], expected_densities, atol=1e-3)
+
+    def test_class_densities_missing(self):
+        values = np.append(self.values, np.nan)
+        classes = np.append(self.classes, 0)
+        densities = class_densities(values, classes, [1, 5], -4, 8)
+
+        # Classes without values have no density
+        self.assertGreater(densities[0].max(), 0)
+        np.testing.assert_array_equal(densities[1], np.zeros(DENSITY_POINTS))
+
+    def test_class_codes(self):
+        codes = class_codes(np.array([2.0, 0.0, 1.0, 5.0, np.nan]), [2, 0])
+        np.testing.assert_array_equal(codes, [0, 1, -1, -1, -1])
+
+    def test_feature_densities(self):
+        columns = [self.values, self.values * 2 + np.where(self.classes == 1, np.nan, 0)]
+        densities = feature_densities(columns, class_codes(self.classes, [0, 1, 2]), 3, [(-4, 8), (-8, 16)])
+        self.assertEqual(densities.shape, (2, 3, DENSITY_POINTS))
+
+        # Every feature gets the densities it would get on its own
+        np.testing.assert_array_almost_equal(densities[0], class_densities(self.values, self.classes, [0, 1, 2], -4, 8))
+        np.testing.assert_array_almost_equal(densities[1], class_densities(columns[1], self.classes, [0, 1, 2], -8, 16))
+        np.testing.assert_array_equal(densities[1][1], np.zeros(DENSITY_POINTS))
@@ -0,0 +1,74 @@
+import numpy as np
+from django.test import TestCase
+
+from features.histograms import build_pyramid, merge_bins, query_pyramid, slice_bins, pack_edges, pack_counts, \
+    pack_levels, unpack_edges, unpack_counts, unpack_levels, BASE_BINS, PYRAMID_LEVELS, DEFAULT_BINS
+
+
+class TestHistograms(TestCase):
+    def setUp(self):
+        self.values = np.random.RandomState(0).normal(size=1000)
+        self.range = (self.values.min(), self.values.max())
+        self.counts, self.bin_edges = np.histogram(self.values, bins=BASE_BINS, range=self.range)
+        self.levels = build_pyramid(self.counts)
+
+    def test_build_pyramid(self):
+        self.assertEqual([len(level) for level in self.levels],
+                         [BASE_BINS // 2 ** level for level in range(PYRAMID_LEVELS)])
+        self.assertEqual(len(self.levels[-1]), DEFAULT_BINS)
+        np.testing.assert_array_equal(self.levels[1], self.counts[::2] + self.counts[1::2])
+
+    def test_merge_bins(self):
+        counts, bin_edges = merge_bins(self.counts, self.bin_edges, bins=5)
+
+        expected_counts, expected_bin_edges = np.histogram(self.values, bins=5, range=self.range)
+        np.testing.assert_array_equal(counts, expected_counts)
+        np.testing.assert_array_almost_equal(bin_edges, expected_bin_edges)
+
+    def test_query_pyramid(self):
+        counts, bin_edges = query_pyramid(self.levels, *self.range, bins=DEFAULT_BINS)
+
+        expected_counts, expected_bin_edges = np.histogram(self.values, bins=DEFAULT_BINS, range=self.range)
+        np.testing.assert_array_equal(counts, expected_counts)
+        np.testing.assert_array_almost_equal(bin_edges, expected_bin_edges)
+
+    def test_query_pyramid_range(self):
+        counts, bin_edges = query_pyramid(self.levels, *self.range, bins=20, start=-0.5, stop=0.5)
+
+        # The bins of a level that contain the range are merged into the requested number of almost equal widths
+        self.assertEqual(len(counts), 20)
+        widths = np.diff(bin_edges)
+        self.assertLessEqual(widths.max() - widths.min(), (self.range[1] - self.range[0]) / BASE_BINS + 1e-9)
+        self.assertLessEqual(bin_edges[0], -0.5)
+        self.assertGreaterEqual(bin_edges[-1], 0.5)
+        self.assertEqual(counts.sum(), np.count_nonzero((self.values >= bin_edges[0]) & (self.values < bin_edges[-1])))
+
+    def test_merge_bins_uneven(self):
+        counts, bin_edges = merge_bins(np.ones(7, dtype=int), np.arange(8.0), bins=3)
+
+        # Groups differ by at most one bin instead of leaving a narrow last bin
+        np.testing.assert_array_equal(counts, [2, 3, 2])
+        np.testing.assert_array_equal(bin_edges, [0.0, 2.0, 5.0, 7.0])
+
+    def test_query_pyramid_outside(self):
+        counts, bin_edges = query_pyramid(self.levels, *self.range, bins=10, start=self.range[1] + 1)
+
+        self.assertEqual(len(counts), 0)
+        self.assertEqual(len(bin_edges), 0)
+
+    def test_slice_bins(self):
+        counts, bin_edges = slice_bins(np.array([1, 2, 3]), np.array([0.0, 1.0, 2.0, 3.0]), start=1.5, stop=2.0)
+
+        # Bins that touch the range are included
+        np.testing.assert_array_equal(counts, [2, 3])
+        np.testing.assert_array_equal(bin_edges, [1.0, 2.0, 3.0])
+
+    def test_pack(self):
+        np.testing.assert_array_equal(unpack_edges(pack_edges(self.bin_edges)), self.bin_edges)
+        np.testing.assert_array_equal(unpack_counts(pack_counts(self.counts)), self.counts)
+        self.assertEqual(len(pack_counts(self.counts)), 8 * BASE_BINS)
+
+        levels = unpack_levels(pack_levels(self.levels))
+        self.assertEqual(len(levels), PYRAMID_LEVELS)
+        for level, expected_level in zip(levels, self.levels):
+            np.testing.assert_array_equal(level, expected_level)
@@ -2,6 +2,7 @@ from django.test import TestCase
 from features.tests.factories import DatasetFactory
 import os
 from features.models import Dataset
+from features.columnar import write_columnar, columnar_path
 
 
 class TestDatasetModel(TestCase):
@@ -13,7 +14,11 @@ class TestDatasetModel(TestCase):
         dataset = DatasetFactory()
 
         file_path = dataset.content.path
+        write_columnar(dataset)
+        directory = columnar_path(dataset)
 
         self.assertTrue(os.path.isfile(file_path))
+        self.assertTrue(os.path.isdir(directory))
         Dataset.objects.all().delete()
         self.assertFalse(os.path.isfile(file_path))
+        self.assertFalse(os.path.isdir(directory))
@@ -1,5 +1,3 @@
-from decimal import Decimal
-
 from django.test import TestCase
 from rest_framework.validators import ValidationError
 
@@ -8,7 +6,7 @@ from features.serializers import FeatureSerializer, BinSerializer, ExperimentTar
     DatasetSerializer, ExperimentSerializer, RedundancySerializer, RelevancySerializer, \
     ConditionalDistributionRequestSerializer, \
     SpectrogramSerializer, CalculationSerializer
-from features.tests.factories import FeatureFactory, BinFactory, DatasetFactory, ExperimentFactory, \
+from features.tests.factories import FeatureFactory, DatasetFactory, ExperimentFactory, \
     RelevancyFactory, RedundancyFactory, SpectrogramFactory, \
     CalculationFactory, ResultCalculationMapFactory
 from users.tests.factories import UserFactory
@@ -28,18 +26,26 @@ class TestFeatureSerializer(TestCase):
         self.assertEqual(data.pop('variance'), feature.variance)
         self.assertEqual(data.pop('is_categorical'), feature.is_categorical)
         self.assertEqual(data.pop('categories'), feature.categories)
+        self.assertEqual(data.pop('dtype'), feature.dtype)
+        self.assertEqual(data.pop('labels'), feature.labels)
+        self.assertEqual(data.pop('missing_count'), feature.missing_count)
+        self.assertEqual(data.pop('distinct_count'), feature.distinct_count)
+        self.assertEqual(data.pop('skewness'), feature.skewness)
+        self.assertEqual(data.pop('kurtosis'), feature.kurtosis)
+        self.assertEqual(data.pop('quantiles'), feature.quantiles)
+        self.assertEqual(data.pop('stage'), feature.stage)
         self.assertEqual(len(data), 0)
 
 
 class TestBinSerializer(TestCase):
     def test_serialize_one(self):
-        bin = BinFactory()
+        bin = {'from_value': -1.5, 'to_value': 2.0, 'count': 12}
         serializer = BinSerializer(instance=bin)
         data = serializer.data
 
-        self.assertEqual(Decimal(data.pop('from_value')), bin.from_value)
-        self.assertEqual(Decimal(data.pop('to_value')), bin.to_value)
-        self.assertEqual(data.pop('count'), bin.count)
+        self.assertEqual(data.pop('from_value'), bin['from_value'])
+        self.assertEqual(data.pop('to_value'), bin['to_value'])
+        self.assertEqual(data.pop('count'), bin['count'])
         self.assertEqual(len(data), 0)
 
 
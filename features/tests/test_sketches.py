@@ -0,0 +1,77 @@
+import numpy as np
+from django.test import TestCase
+from scipy.stats import skew, kurtosis
+
+from features.sketches import Moments, QuantileSketch, DistinctSketch, ColumnSketch
+
+
+class TestSketches(TestCase):
+    def setUp(self):
+        self.values = np.random.RandomState(0).lognormal(size=10000)
+
+    def test_moments(self):
+        moments = Moments()
+        for chunk in np.array_split(self.values, 7):
+            moments.update(chunk)
+
+        self.assertEqual(moments.count, self.values.size)
+        self.assertEqual(moments.min, self.values.min())
+        self.assertAlmostEqual(moments.mean, np.mean(self.values))
+        self.assertAlmostEqual(moments.variance(), np.var(self.values))
+        self.assertAlmostEqual(moments.skewness(), skew(self.values))
+        self.assertAlmostEqual(moments.kurtosis(), kurtosis(self.values), places=5)
+
+    def test_moments_missing_values(self):
+        moments = Moments()
+        moments.update(np.array([1.0, np.nan, 3.0]))
+        moments.update(np.array([np.nan]))
+
+        self.assertEqual(moments.count, 2)
+        self.assertEqual(moments.missing_count, 2)
+        self.assertEqual(moments.mean, 2.0)
+
+    def test_quantiles(self):
+        sketch = QuantileSketch(capacity=128)
+        for chunk in np.array_split(self.values, 50):
+            sketch.update(chunk)
+
+        # Ranks of the approximate quantiles are close to the requested ones
+        fractions = [0.01, 0.25, 0.5, 0.75, 0.99]
+        ranks = np.searchsorted(np.sort(self.values), sketch.quantiles(fractions)) / self.values.size
+        np.testing.assert_allclose(ranks, fractions, atol=0.03)
+
+    def test_quantiles_merge(self):
+        sketches = [QuantileSketch(capacity=128) for _ in range(4)]
+        for sketch, chunk in zip(sketches, np.array_split(self.values, len(sketches))):
+            sketch.update(chunk)
+        for sketch in sketches[1:]:
+            sketches[0].merge(sketch)
+
+        ranks = np.searchsorted(np.sort(self.values), sketches[0].quantiles([0.5])) / self.values.size
+        np.testing.assert_allclose(ranks, [0.5], atol=0.03)
+        self.assertEqual(QuantileSketch().quantiles([0.5]), [None])
+
+    def test_distinct(self):
+        sketch = DistinctSketch(max_unique=10)
+        sketch.update(np.array([3.0, 1.0, np.nan, 3.0]))
+        self.assertEqual(sketch.count(), 2)
+        np.testing.assert_array_equal(sketch.unique, [1.0, 3.0])
+
+        # Too many distinct values are only estimated
+        sketch.update(np.arange(100000, dtype=float))
+        self.assertIsNone(sketch.unique)
+        self.assertAlmostEqual(sketch.count() / 100000, 1, delta=0.05)
+
+    def test_column_sketch_merge(self):
+        first, second = ColumnSketch(max_unique=10), ColumnSketch(max_unique=10)
+        first.update(np.array([0.0, 1.0, np.nan]))
+        second.update(np.array([-0.0, 2.0]))
+        first.merge(second)
+
+        summary = first.summary()
+        self.assertEqual(summary['count'], 4)
+        self.assertEqual(summary['missing_count'], 1)
+        self.assertEqual(summary['unique'], [0.0, 1.0, 2.0])
+        self.assertEqual(summary['distinct_count'], 3)
+        self.assertEqual(summary['quantiles']['0'], 0.0)
+        self.assertEqual(summary['quantiles']['100'], 2.0)
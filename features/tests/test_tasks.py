@@ -1,18 +1,29 @@
+import hashlib
+import os
+import zipfile
+from io import BytesIO
 from os import stat
-from time import time
+from datetime import timedelta
 from unittest.mock import patch, call
 
 import SharedArray as sa
+import numpy as np
 from django.test import TestCase
-from features.models import Feature, Bin, Dataset, Slice, Redundancy, Relevancy, \
+from django.utils.timezone import now
+from features.models import Feature, Histogram, Dataset, Slice, Redundancy, Relevancy, \
     Spectrogram
-from features.models import ResultCalculationMap, Calculation
-from features.tasks import _dataframe_columns, _dataframe_last_access, _get_dataframe
-from features.tasks import initialize_from_dataset, build_histogram, \
-    calculate_feature_statistics, calculate_hics, calculate_densities, remove_unused_dataframes, \
-    build_spectrogram
-from features.tasks import get_samples, calculate_conditional_distributions
-from features.tests.factories import FeatureFactory, DatasetFactory, ResultCalculationMapFactory, CalculationFactory
+from features.models import ResultCalculationMap, Calculation, Upload, Density
+from features.cache import get_dataframe, ingestion_lock
+from features.densities import unpack_densities
+from features.histograms import unpack_edges, unpack_counts, unpack_levels, BASE_BINS
+from features.columnar import write_columnar, remove_columnar, read_manifest, read_labels
+from features.tasks import initialize_from_dataset, calculate_hics, calculate_densities, enforce_dataframe_budget, \
+    build_spectrogram, commit_upload, calculate_block_statistics, resume_initialization, resume_stalled_initializations
+from features.tasks import get_samples, calculate_conditional_distributions, calculate_target_densities, \
+    calculate_feature_densities, _set_sketched_statistics, MAX_RESUME_ATTEMPTS
+from features.tests.factories import FeatureFactory, DatasetFactory, ResultCalculationMapFactory, CalculationFactory, \
+    UploadFactory
+from features.uploads import append_chunk, staging_path, remove_staging
 
 
 # TODO: test for results
@@ -31,10 +42,10 @@ class TestInitializeFromDatasetTask(TestCase):
         feature_names = ['Col1', 'Col2', 'Col3']
 
         # TODO: Fuck nesting
-        with patch('features.tasks.build_histogram.subtask') as build_histogram_mock:
-            with patch('features.tasks.calculate_feature_statistics.subtask') \
-                    as calculate_feature_statistics_mock:
-                with patch('features.tasks.build_spectrogram.subtask') \
+        with patch('features.tasks.STATISTICS_BLOCK_SIZE', 2):
+            with patch('features.tasks.calculate_block_statistics.subtask') \
+                    as calculate_block_statistics_mock:
+                with patch('features.tasks.build_spectrogram.delay') \
                         as build_spectrogram_mock:
                     with patch('features.tasks.initialize_from_dataset_processing_callback.subtask') \
                             as initialize_from_dataset_processing_callback_mock:
@@ -43,36 +54,224 @@ class TestInitializeFromDatasetTask(TestCase):
 
                             initialize_from_dataset(dataset_id=dataset.id)
 
-                            # Make sure that we call the preprocessing task for each feature
+                            # Spectrograms are only rendered after the histograms
                             features = Feature.objects.filter(name__in=feature_names).all()
-                            kalls = [call(immutable=True, kwargs={'feature_id': feature.id}) for feature in features]
+                            build_spectrogram_mock.assert_not_called()
 
-                            build_histogram_mock.assert_has_calls(kalls, any_order=True)
-                            calculate_feature_statistics_mock.assert_has_calls(kalls, any_order=True)
-                            build_spectrogram_mock.assert_has_calls(kalls, any_order=True)
+                            # Statistics and histograms are calculated by blocks of features
+                            feature_ids = [feature.id for feature in features]
+                            calculate_block_statistics_mock.assert_has_calls([
+                                call(immutable=True, kwargs={'feature_ids': feature_ids[:2]}),
+                                call(immutable=True, kwargs={'feature_ids': feature_ids[2:]})])
 
                             initialize_from_dataset_processing_callback_mock.assert_called_once_with(
                                 kwargs={'dataset_id': dataset.id})
                             chord_mock.assert_called_once()
 
         self.assertEqual(feature_names, [feature.name for feature in Feature.objects.all()])
+        self.assertEqual([feature.dtype for feature in Feature.objects.all()], ['|u1', '<f8', '|u1'])
+        self.assertEqual([feature.stage for feature in Feature.objects.all()], [Feature.STATISTICS] * 3)
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.progress, 1)
+        self.assertEqual(dataset.available_features, 3)
+        self.assertEqual(dataset.status, Dataset.PROCESSING)
+
+        # Statistics are sketched while parsing
+        feature = Feature.objects.get(dataset=dataset, name='Col2')
+        self.assertAlmostEqual(feature.mean, -0.2838365385)
+        self.assertAlmostEqual(feature.variance, 0.406014248150876)
+        self.assertEqual(feature.min, -1.3975821)
+        self.assertEqual(feature.quantiles['0'], feature.min)
+        self.assertEqual(feature.quantiles['100'], 0.74163977)
+        self.assertEqual(feature.missing_count, 0)
+        self.assertEqual(feature.is_categorical, False)
+        feature = Feature.objects.get(dataset=dataset, name='Col3')
+        self.assertEqual(feature.categories, [0, 1, 2])
+        self.assertEqual(feature.distinct_count, 3)
+        self.assertEqual(feature.is_categorical, True)
+
+    def test_initialize_from_duplicate_dataset(self):
+        source = _build_test_dataset()
+        source.checksum = 'a' * 64
+        source.status = Dataset.DONE
+        source.save()
+        write_columnar(source)
+        dataset = DatasetFactory(checksum=source.checksum)
+
+        with patch('features.tasks.chord') as chord_mock, \
+                patch('features.tasks.write_columnar') as write_columnar_mock:
+            initialize_from_dataset(dataset_id=dataset.id)
+
+        # Nothing is calculated again
+        self.assertFalse(chord_mock.called)
+        self.assertFalse(write_columnar_mock.called)
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.status, Dataset.DONE)
+        self.assertEqual(read_manifest(dataset), read_manifest(source))
+        self.assertEqual(sorted(Feature.objects.filter(dataset=dataset).values_list('name', flat=True)),
+                         ['Col1', 'Col2', 'Col3'])
+        remove_columnar(source)
+        remove_columnar(dataset)
+
+    def test_initialize_from_dataset_ingesting(self):
+        dataset = DatasetFactory()
 
+        with ingestion_lock(dataset.id), \
+                patch('features.tasks.write_columnar') as write_columnar_mock, \
+                patch('features.tasks.resume_initialization') as resume_initialization_mock:
+            initialize_from_dataset(dataset_id=dataset.id)
 
-class TestBuildHistogramTask(TestCase):
-    def test_build_histogram(self):
+        # The running ingestion keeps its files
+        self.assertFalse(write_columnar_mock.called)
+        self.assertFalse(resume_initialization_mock.called)
+
+    def test_resume_initialization(self):
         dataset = _build_test_dataset()
-        feature = Feature.objects.get(dataset=dataset, name='Col2')
+        features = list(Feature.objects.filter(dataset=dataset))
+        features[0].stage = Feature.PENDING
+        features[0].save()
+        features[1].stage = Feature.HISTOGRAM
+        features[1].save()
+
+        with patch('features.tasks.calculate_block_statistics.subtask') as calculate_block_statistics_mock, \
+                patch('features.tasks.chord') as chord_mock:
+            resume_initialization(dataset_id=dataset.id)
+
+        # Only the missing stages are scheduled
+        calculate_block_statistics_mock.assert_called_once_with(immutable=True,
+                                                                kwargs={'feature_ids': [features[0].id]})
+        chord_mock.assert_called_once()
+
+    def test_resume_initialization_histograms_ready(self):
+        dataset = _build_test_dataset()
+        feature = Feature.objects.get(dataset=dataset, name='Col1')
+        feature.stage = Feature.HISTOGRAM
+        feature.save()
 
-        bin_values = [6, 1, 4, 0, 2]
-        bin_count = len(bin_values)
+        with patch('features.tasks.build_spectrogram.delay') as build_spectrogram_mock, \
+                patch('features.tasks.chord') as chord_mock:
+            resume_initialization(dataset_id=dataset.id)
 
-        build_histogram(feature_id=feature.id, bins=bin_count)
+        self.assertFalse(chord_mock.called)
+        build_spectrogram_mock.assert_called_once_with(feature_id=feature.id)
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.status, Dataset.DONE)
 
-        # Rudementary check bins only for its values
-        self.assertEqual(Bin.objects.count(), bin_count)
-        for bin_obj in Bin.objects.all():
-            self.assertEqual(bin_obj.feature, feature)
-            self.assertIn(bin_obj.count, bin_values)
+    def test_resume_initialization_not_parsed(self):
+        dataset = DatasetFactory()
+
+        with patch('features.tasks.initialize_from_dataset.delay') as initialize_from_dataset_mock:
+            resume_initialization(dataset_id=dataset.id)
+
+        initialize_from_dataset_mock.assert_called_once_with(dataset_id=dataset.id)
+
+    def test_resume_initialization_no_columns(self):
+        dataset = DatasetFactory(content__filename='empty.npz', content__data=b'')
+        with open(dataset.content.path, 'wb') as npz_file:
+            np.savez(npz_file)
+        write_columnar(dataset)
+
+        with patch('features.tasks.initialize_from_dataset.delay') as initialize_from_dataset_mock:
+            resume_initialization(dataset_id=dataset.id)
+
+        # Parsed datasets without columns are not parsed again
+        initialize_from_dataset_mock.assert_not_called()
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.status, Dataset.ERROR)
+        remove_columnar(dataset)
+
+    def test_resume_stalled_initializations(self):
+        stalled_dataset = DatasetFactory(status=Dataset.PROCESSING, updated_at=now() - timedelta(days=1))
+        DatasetFactory(status=Dataset.PROCESSING)
+        DatasetFactory(status=Dataset.DONE, updated_at=now() - timedelta(days=1))
+        rendering_dataset = DatasetFactory(status=Dataset.DONE, updated_at=now() - timedelta(days=1))
+        FeatureFactory(dataset=rendering_dataset, stage=Feature.HISTOGRAM)
+
+        with patch('features.tasks.resume_initialization.delay') as resume_initialization_mock:
+            resume_stalled_initializations()
+
+        resume_initialization_mock.assert_has_calls([call(dataset_id=stalled_dataset.id),
+                                                     call(dataset_id=rendering_dataset.id)], any_order=True)
+        self.assertEqual(resume_initialization_mock.call_count, 2)
+        stalled_dataset.refresh_from_db()
+        self.assertEqual(stalled_dataset.resume_attempts, 1)
+
+    def test_resume_stalled_initializations_ingesting(self):
+        dataset = DatasetFactory(status=Dataset.PROCESSING, updated_at=now() - timedelta(days=1))
+
+        with ingestion_lock(dataset.id), \
+                patch('features.tasks.resume_initialization.delay') as resume_initialization_mock:
+            resume_stalled_initializations()
+
+        self.assertFalse(resume_initialization_mock.called)
+        dataset.refresh_from_db()
+        self.assertEqual(dataset.resume_attempts, 0)
+
+    def test_resume_stalled_initializations_failed(self):
+        failed_dataset = DatasetFactory(status=Dataset.PROCESSING, updated_at=now() - timedelta(days=1),
+                                        resume_attempts=MAX_RESUME_ATTEMPTS)
+        rendering_dataset = DatasetFactory(status=Dataset.DONE, updated_at=now() - timedelta(days=1),
+                                           resume_attempts=MAX_RESUME_ATTEMPTS)
+        FeatureFactory(dataset=rendering_dataset, stage=Feature.HISTOGRAM)
+
+        with patch('features.tasks.resume_initialization.delay') as resume_initialization_mock:
+            resume_stalled_initializations()
+
+        # Datasets that are ready already stay usable
+        self.assertFalse(resume_initialization_mock.called)
+        failed_dataset.refresh_from_db()
+        self.assertEqual(failed_dataset.status, Dataset.ERROR)
+        rendering_dataset.refresh_from_db()
+        self.assertEqual(rendering_dataset.status, Dataset.DONE)
+
+
+class TestCommitUpload(TestCase):
+    def setUp(self):
+        self.zip_file = BytesIO()
+        with zipfile.ZipFile(self.zip_file, 'w') as archive:
+            archive.write('features/tests/assets/test_file.csv')
+        self.upload = UploadFactory()
+        self.zip_file.seek(0)
+        append_chunk(self.upload, 0, self.zip_file)
+
+    def test_commit_upload(self):
+        checksum = hashlib.sha256(self.zip_file.getvalue()).hexdigest()
+
+        with patch('features.tasks.initialize_from_dataset.delay') as initialize_from_dataset_mock:
+            commit_upload(upload_id=self.upload.id, checksum=checksum)
+
+        upload = Upload.objects.get(pk=self.upload.id)
+        self.assertEqual(upload.status, Upload.DONE)
+        self.assertEqual(upload.dataset.name, 'features/tests/assets/test_file.csv')
+        self.assertEqual(upload.dataset.uploaded_by, upload.uploaded_by)
+        self.assertFalse(os.path.isfile(staging_path(upload)))
+        initialize_from_dataset_mock.assert_called_once_with(dataset_id=upload.dataset.id)
+
+    def test_commit_upload_checksum_mismatch(self):
+        with patch('features.tasks.initialize_from_dataset.delay') as initialize_from_dataset_mock:
+            commit_upload(upload_id=self.upload.id, checksum='0' * 64)
+
+        # The chunks are kept, so that the client can resend the ones that differ and commit again
+        upload = Upload.objects.get(pk=self.upload.id)
+        self.assertEqual(upload.status, Upload.RECEIVING)
+        self.assertEqual(upload.error, 'Checksum of the uploaded archive does not match.')
+        self.assertIsNone(upload.dataset)
+        self.assertTrue(os.path.isfile(staging_path(upload)))
+        initialize_from_dataset_mock.assert_not_called()
+        remove_staging(upload)
+
+    def test_commit_upload_broken_archive(self):
+        checksum = hashlib.sha256(self.zip_file.getvalue()).hexdigest()
+
+        with patch('features.tasks.create_dataset_from_upload', side_effect=zipfile.BadZipFile('Bad CRC-32')), \
+                patch('features.tasks.initialize_from_dataset.delay') as initialize_from_dataset_mock:
+            commit_upload(upload_id=self.upload.id, checksum=checksum)
+
+        upload = Upload.objects.get(pk=self.upload.id)
+        self.assertEqual(upload.status, Upload.ERROR)
+        self.assertEqual(upload.error, 'Bad CRC-32')
+        self.assertFalse(os.path.isfile(staging_path(upload)))
+        initialize_from_dataset_mock.assert_not_called()
 
 
 class TestCalculateDensities(TestCase):
@@ -83,6 +282,8 @@ class TestCalculateDensities(TestCase):
 
         target_feature.categories = [0, 1, 2]
         target_feature.save()
+        feature.min, feature.max = -1.3975821, 0.74163977
+        feature.save()
         count_categories = len(target_feature.categories)
         validation_category = 1.0
 
@@ -94,11 +295,94 @@ class TestCalculateDensities(TestCase):
         validation_category_density = next(d for d in densities if d['target_class'] == validation_category)
         validation_category_density_values = validation_category_density['density_values']
 
-        # Kernel density is not deterministic, therefore we only check result length and valid range
+        # Densities are evaluated from the feature's minimum to its maximum, which holds nearly all of their mass
         self.assertEqual(len(validation_category_density_values), 100)
         for y in validation_category_density_values:
-            self.assertGreater(y, 0.15)
-            self.assertLess(y, 0.6)
+            self.assertGreaterEqual(y, 0)
+        mass = sum(validation_category_density_values) * (feature.max - feature.min) / 99
+        self.assertGreater(mass, 0.9)
+        self.assertLess(mass, 1.05)
+
+        # The densities are kept for the next request
+        density = Density.objects.get(target=target_feature, feature=feature)
+        self.assertEqual(density.target_classes, [0, 1, 2])
+        np.testing.assert_array_almost_equal(unpack_densities(density.values, 3)[1],
+                                             validation_category_density_values)
+
+    def test_calculate_target_densities(self):
+        dataset = _build_test_dataset()
+        target = Feature.objects.get(dataset=dataset, name='Col3')
+        target.categories = [0, 1, 2]
+        target.save()
+        Feature.objects.filter(dataset=dataset, name='Col1').update(min=None, max=None)
+
+        # Calculating them again replaces the densities
+        calculate_target_densities(str(target.id))
+        calculate_target_densities(str(target.id))
+
+        # Features without a range are left to be calculated on request
+        densities = Density.objects.filter(target=target)
+        self.assertEqual(sorted(density.feature.name for density in densities), ['Col2', 'Col3'])
+        for density in densities:
+            self.assertEqual(density.target_classes, [0, 1, 2])
+            self.assertEqual(unpack_densities(density.values, 3).shape, (3, 100))
+
+        feature = Feature.objects.get(dataset=dataset, name='Col2')
+        expected_densities = calculate_densities(str(target.id), str(feature.id))
+        np.testing.assert_array_almost_equal(unpack_densities(Density.objects.get(feature=feature).values, 3),
+                                             [density['density_values'] for density in expected_densities])
+
+    def test_calculate_feature_densities(self):
+        dataset = _build_test_dataset()
+        target = Feature.objects.get(dataset=dataset, name='Col3')
+        target.categories = [0, 1, 2]
+        target.save()
+        features = list(Feature.objects.filter(dataset=dataset, name__in=['Col1', 'Col2']))
+        Feature.objects.filter(dataset=dataset, name='Col1').update(min=None, max=None)
+
+        densities = calculate_feature_densities(str(target.id), [str(feature.id) for feature in features])
+
+        self.assertEqual(set(densities), {str(feature.id) for feature in features})
+        feature = Feature.objects.get(dataset=dataset, name='Col2')
+
+        # Features without statistics get no densities until their bounds are known
+        self.assertEqual(densities[str(Feature.objects.get(dataset=dataset, name='Col1').id)], [])
+        self.assertEqual([density.feature for density in Density.objects.filter(target=target)], [feature])
+
+        self.assertEqual([density['target_class'] for density in densities[str(feature.id)]], [0, 1, 2])
+        expected_densities = calculate_densities(str(target.id), str(feature.id))
+        for density, expected_density in zip(densities[str(feature.id)], expected_densities):
+            np.testing.assert_array_almost_equal(density['density_values'], expected_density['density_values'])
+
+    def test_calculate_target_densities_missing_values(self):
+        dataset = DatasetFactory(content__filename='missing.csv',
+                                 content__data=b'\n'.join([b'a,b,t', b'1,,0', b'2,5,1', b',3,0', b'4,2,1', b'3,1,0']))
+        write_columnar(dataset)
+        target = FeatureFactory(dataset=dataset, name='t', is_categorical=True, categories=[0, 1])
+        # Missing values turn the bounds into NaN, sketched features still know the bounds of their finite values
+        sketched_feature = FeatureFactory(dataset=dataset, name='a', min=np.nan, max=np.nan,
+                                          quantiles={'0': 1.0, '100': 4.0})
+        unsketched_feature = FeatureFactory(dataset=dataset, name='b', min=np.nan, max=np.nan, quantiles=None)
+
+        calculate_target_densities(str(target.id))
+
+        # Features without finite bounds are left out instead of failing the whole target
+        densities = Density.objects.filter(target=target)
+        self.assertEqual(sorted(density.feature.name for density in densities), ['a', 't'])
+        values = unpack_densities(densities.get(feature=sketched_feature).values, 2)
+        self.assertTrue(np.isfinite(values).all())
+        self.assertGreater(values[0].max(), 0)
+        self.assertEqual(calculate_densities(str(target.id), str(sketched_feature.id))[1]['target_class'], 1)
+        self.assertEqual(calculate_densities(str(target.id), str(unsketched_feature.id)), [])
+        remove_columnar(dataset)
+
+    def test_calculate_target_densities_not_categorical(self):
+        dataset = _build_test_dataset()
+        target = Feature.objects.get(dataset=dataset, name='Col3')
+
+        calculate_target_densities(str(target.id))
+
+        self.assertFalse(Density.objects.filter(target=target).exists())
 
 
 class TestGetSamples(TestCase):
@@ -114,36 +398,143 @@ class TestGetSamples(TestCase):
                           -1.3395821000000001, -0.30984600000000001]})
 
 
-class TestCalculateFeatureStatistics(TestCase):
-    def test_calculate_feature_statistics(self):
-        dataset = _build_test_dataset()
-        feature = Feature.objects.get(dataset=dataset, name='Col2')
+    def test_get_samples_float32(self):
+        dataset = DatasetFactory(content__filename='narrow.csv', content__data=b'a\n-0.845\n3.14159\n2.5\n')
+        write_columnar(dataset)
+        feature = FeatureFactory(dataset=dataset, name='a')
+        self.assertEqual(read_manifest(dataset)['columns'][0]['dtype'], '<f4')
 
-        calculate_feature_statistics(feature_id=feature.id)
+        # Narrowed columns return the values of the source, not the nearest float32
+        self.assertEqual(get_samples(feature.id), {str(feature.id): [-0.845, 3.14159, 2.5]})
+        remove_columnar(dataset)
 
-        feature = Feature.objects.get(id=feature.id)
+    def test_get_samples_text(self):
+        dataset = DatasetFactory(content__filename='text.csv', content__data=b'status\nok\nfail\n\nok\nlate\n')
+        manifest = write_columnar(dataset)
+        feature = FeatureFactory(dataset=dataset, name='status', labels=read_labels(dataset, manifest, 'status'))
+
+        # Text returns its labels instead of their codes
+        self.assertEqual(get_samples(feature.id), {str(feature.id): ['ok', 'fail', None, 'ok', 'late']})
+        remove_columnar(dataset)
 
-        self.assertEqual(feature.mean, -0.2838365385)
-        self.assertEqual(feature.variance, 0.406014248150876)
+
+class TestCalculateBlockStatistics(TestCase):
+    def test_calculate_block_statistics(self):
+        dataset = _build_test_dataset()
+        features = list(Feature.objects.filter(dataset=dataset))
+
+        calculate_block_statistics(feature_ids=[feature.id for feature in features], bins=5)
+
+        feature = Feature.objects.get(dataset=dataset, name='Col2')
+        self.assertAlmostEqual(feature.mean, -0.2838365385)
+        self.assertAlmostEqual(feature.variance, 0.406014248150876)
         self.assertEqual(feature.min, -1.3975821)
         self.assertEqual(feature.max, 0.74163977)
         self.assertEqual(feature.is_categorical, False)
-        self.assertEqual(feature.categories, None)
+        histogram = Histogram.objects.get(feature=feature)
+        self.assertEqual(unpack_counts(histogram.counts).tolist(), [4, 2, 6, 4, 4])
 
-    def test_calculate_feature_statistics_is_categorical(self):
-        dataset = _build_test_dataset()
+        # The bins are merged from the base of the feature's pyramid
+        levels = unpack_levels(histogram.levels)
+        self.assertEqual(len(levels[0]), BASE_BINS)
+        self.assertEqual(sum(levels[-1]), 20)
+        bin_edges = unpack_edges(histogram.bin_edges)
+        self.assertEqual((bin_edges[0], bin_edges[-1]), (-1.3975821, 0.74163977))
+
+        # Categorical features get a bin per category
         feature = Feature.objects.get(dataset=dataset, name='Col3')
+        self.assertEqual(feature.categories, [0, 1, 2])
+        self.assertEqual(feature.is_categorical, True)
+        histogram = Histogram.objects.get(feature=feature)
+        self.assertEqual(len(unpack_counts(histogram.counts)), 3)
+        self.assertIsNone(histogram.levels)
+
+    def test_calculate_block_statistics_text_column(self):
+        dataset = DatasetFactory()
+        feature = FeatureFactory(dataset=dataset, name='Col3', labels=['low', 'medium', 'high'])
 
-        calculate_feature_statistics(feature_id=feature.id)
+        calculate_block_statistics(feature_ids=[feature.id])
 
         feature = Feature.objects.get(id=feature.id)
-        self.assertEqual(feature.mean, 0.9)
-        self.assertEqual(feature.variance, 0.69)
-        self.assertEqual(feature.min, 0)
-        self.assertEqual(feature.max, 2.0)
         self.assertEqual(feature.categories, [0, 1, 2])
         self.assertEqual(feature.is_categorical, True)
 
+    def test_calculate_block_statistics_sparse_column(self):
+        dataset = DatasetFactory(content__filename='sparse.csv',
+                                 content__data=b'\n'.join([b'a,b', b'4,1'] + [b'0,1'] * 39))
+        write_columnar(dataset)
+        feature = FeatureFactory(dataset=dataset, name='a')
+
+        calculate_block_statistics(feature_ids=[feature.id])
+
+        feature = Feature.objects.get(id=feature.id)
+        self.assertEqual(feature.min, 0)
+        self.assertEqual(feature.max, 4)
+        self.assertEqual(feature.mean, 0.1)
+        self.assertAlmostEqual(feature.variance, 0.39)
+        self.assertEqual(feature.categories, [0, 4])
+        self.assertEqual(feature.is_categorical, True)
+        self.assertEqual(unpack_counts(Histogram.objects.get(feature=feature).counts).tolist(), [39, 1])
+        remove_columnar(dataset)
+
+    def test_calculate_block_statistics_missing_text(self):
+        dataset = DatasetFactory(content__filename='text.csv',
+                                 content__data=b'status\nok\nfail\n\nok\nlate\n\nok\n')
+        manifest = write_columnar(dataset)
+        feature = FeatureFactory(dataset=dataset, name='status', labels=read_labels(dataset, manifest, 'status'))
+        _set_sketched_statistics(feature, manifest['columns'][0]['statistics'])
+        feature.save()
+        self.assertEqual(feature.missing_count, 2)
+
+        calculate_block_statistics(feature_ids=[feature.id])
+
+        # Every label gets its own bin, missing text is in none of them
+        histogram = Histogram.objects.get(feature=feature)
+        self.assertEqual(unpack_counts(histogram.counts).tolist(), [3, 1, 1])
+        np.testing.assert_array_almost_equal(unpack_edges(histogram.bin_edges), [0, 2 / 3, 4 / 3, 2])
+        remove_columnar(dataset)
+
+    def test_calculate_block_statistics_high_cardinality_text(self):
+        dataset = DatasetFactory(content__filename='text.csv',
+                                 content__data=b'status\nok\nfail\n\nok\nlate\n\nok\n')
+        manifest = write_columnar(dataset)
+        feature = FeatureFactory(dataset=dataset, name='status', labels=read_labels(dataset, manifest, 'status'),
+                                 stage=Feature.STATISTICS)
+
+        with patch('features.tasks.MAX_TEXT_CATEGORIES', 2):
+            _set_sketched_statistics(feature, manifest['columns'][0]['statistics'])
+            feature.save()
+            calculate_block_statistics(feature_ids=[feature.id])
+
+        # Text with too many labels keeps its labels but is neither categorical nor binned
+        feature.refresh_from_db()
+        self.assertFalse(feature.is_categorical)
+        self.assertIsNone(feature.categories)
+        self.assertEqual(feature.labels, ['ok', 'fail', 'late'])
+        self.assertEqual(feature.stage, Feature.HISTOGRAM)
+        self.assertFalse(Histogram.objects.filter(feature=feature).exists())
+        remove_columnar(dataset)
+
+    def test_calculate_block_statistics_sketched(self):
+        dataset = _build_test_dataset()
+        feature = Feature.objects.get(dataset=dataset, name='Col2')
+        feature.mean = 0.5
+        feature.quantiles = {'0': -1.3975821, '100': 0.74163977}
+        feature.stage = Feature.STATISTICS
+        feature.save()
+
+        # Running a block again replaces its histograms
+        calculate_block_statistics(feature_ids=[feature.id], bins=5)
+        calculate_block_statistics(feature_ids=[feature.id], bins=5)
+
+        # Only the histogram is calculated, within the sketched bounds
+        feature.refresh_from_db()
+        self.assertEqual(feature.mean, 0.5)
+        self.assertEqual(feature.stage, Feature.HISTOGRAM)
+        histogram = Histogram.objects.get(feature=feature)
+        self.assertEqual(unpack_counts(histogram.counts).tolist(), [4, 2, 6, 4, 4])
+        self.assertEqual(unpack_edges(histogram.bin_edges)[0], -1.3975821)
+
 
 class TestCalculateHics(TestCase):
     def test_calculate_incremental_hics(self):
@@ -274,23 +665,22 @@ class TestCalculateHics(TestCase):
         self.assertEqual(calculation.type, Calculation.FEATURE_SUPER_SET_HICS)
 
 
-class TestRemoveUnusedDatasets(TestCase):
-    def test_remove_unused_datasets(self):
+class TestEnforceDataframeBudget(TestCase):
+    def test_enforce_dataframe_budget(self):
         dataset = _build_test_dataset()
 
         # Manually load the dataframe into memory
-        _get_dataframe(dataset.id)
+        get_dataframe(dataset.id)
 
-        self.assertLess(_dataframe_last_access[str(dataset.id)], time())
-        self.assertGreater(_dataframe_last_access[str(dataset.id)], time() - 60)
-        self.assertEqual(list(_dataframe_columns[str(dataset.id)]), [feature.name for feature in dataset.feature_set.all()])
-        self.assertIn(str(dataset.id), [dataset.name.decode('ascii') for dataset in sa.list()])
+        segment_names = ['{0}.{1}'.format(dataset.id, column_index) for column_index in range(3)]
+        for segment_name in segment_names:
+            self.assertIn(segment_name, [dataset.name.decode('ascii') for dataset in sa.list()])
 
-        remove_unused_dataframes(max_delta=0)
+        with self.settings(DATASET_CACHE_BUDGET=0):
+            enforce_dataframe_budget()
 
-        self.assertNotIn(str(dataset.id), _dataframe_last_access)
-        self.assertNotIn(str(dataset.id), _dataframe_columns)
-        self.assertNotIn(str(dataset.id), [dataset.name.decode('ascii') for dataset in sa.list()])
+        for segment_name in segment_names:
+            self.assertNotIn(segment_name, [dataset.name.decode('ascii') for dataset in sa.list()])
 
 
 class TestBuildSpectrogram(TestCase):
@@ -335,3 +725,46 @@ class TestCalculateConditionalDistributions(TestCase):
                              str(feature2.id): [-0.046074360000000002, -0.047435999999999999],
                              str(target.id): [0.0, 0.0]}
                           })
+
+    def test_calculate_conditional_distributions_text_categories(self):
+        dataset = DatasetFactory()
+        feature = FeatureFactory(dataset=dataset, name='Col1', labels=['zero', 'one', 'two'])
+        target = FeatureFactory(dataset=dataset, name='Col3')
+
+        feature_constraints = [{'feature': feature.id, 'categories': ['zero', 'one']}]
+        distributions = calculate_conditional_distributions(target.id, feature_constraints)
+
+        feature_constraints = [{'feature': feature.id, 'categories': [0, 1]}]
+        self.assertEqual(distributions, calculate_conditional_distributions(target.id, feature_constraints))
+
+    def test_calculate_conditional_distributions_text_target(self):
+        dataset = DatasetFactory(content__filename='text.csv',
+                                 content__data=b'status,value\nok,1\nfail,2\n,1\nok,2\n')
+        manifest = write_columnar(dataset)
+        feature = FeatureFactory(dataset=dataset, name='value')
+        target = FeatureFactory(dataset=dataset, name='status', labels=read_labels(dataset, manifest, 'status'))
+
+        feature_constraints = [{'feature': feature.id, 'range': {'from_value': 1, 'to_value': 1}}]
+        distributions_and_samples = calculate_conditional_distributions(target.id, feature_constraints, max_samples=2)
+
+        # Text is filtered and counted on its codes but returns its labels
+        self.assertEqual(distributions_and_samples,
+                         {'distribution': [{'value': None, 'probability': 0.5}, {'value': 'ok', 'probability': 0.5}],
+                          'samples': {
+                              str(feature.id): [1, 1],
+                              str(target.id): ['ok', None]}
+                          })
+        remove_columnar(dataset)
+
+    def test_calculate_conditional_distributions_in_chunks(self):
+        dataset = _build_test_dataset()
+        feature = Feature.objects.get(dataset=dataset, name='Col2')
+        target = Feature.objects.get(dataset=dataset, name='Col3')
+
+        def calculate():
+            feature_constraints = [{'feature': feature.id, 'range': {'from_value': -1, 'to_value': 0.5}}]
+            return calculate_conditional_distributions(target.id, feature_constraints, max_samples=4)
+
+        with patch('features.chunked.CHUNK_SIZE', 3):
+            distributions_and_samples = calculate()
+        self.assertEqual(distributions_and_samples, calculate())
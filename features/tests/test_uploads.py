@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import zipfile
+from io import BytesIO
+
+from django.test import TestCase
+
+from features.exceptions import NotZIPFileError, NoCSVInArchiveFoundError
+from users.tests.factories import UserFactory
+from features.uploads import HashingReader, create_dataset_from_upload, content_format, CSV, GZIP_CSV, NPZ, \
+    PARQUET
+
+
+def _zip(files) -> BytesIO:
+    zip_file = BytesIO()
+    with zipfile.ZipFile(zip_file, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    zip_file.seek(0)
+    return zip_file
+
+
+class TestHashingReader(TestCase):
+    def test_read(self):
+        reader = HashingReader(BytesIO(b'a,b\n1,2\n'))
+
+        self.assertEqual(reader.read(4), b'a,b\n')
+        self.assertEqual(reader.read(), b'1,2\n')
+        self.assertEqual(reader.hexdigest(), hashlib.sha256(b'a,b\n1,2\n').hexdigest())
+
+
+class TestCreateDatasetFromZip(TestCase):
+    def test_create_dataset_from_upload(self):
+        user = UserFactory()
+        data = b'a,b\n' + b'1,2\n' * 100000
+
+        dataset = create_dataset_from_upload(_zip({'readme.txt': b'', 'data.csv': data}), uploaded_by=user)
+
+        self.assertEqual(dataset.name, 'data.csv')
+        self.assertEqual(dataset.uploaded_by, user)
+        self.assertEqual(dataset.checksum, hashlib.sha256(data).hexdigest())
+        self.assertEqual(dataset.content.read(), data)
+        self.assertEqual(dataset.content_format, CSV)
+        dataset.delete()
+
+    def test_create_dataset_from_upload_signature_header(self):
+        data = b'PK\x03\x04,b\n1,2\n'
+
+        dataset = create_dataset_from_upload(_zip({'data.csv': data}), uploaded_by=UserFactory())
+
+        # Extracted CSV files are not detected again, whatever their header starts with
+        self.assertEqual(dataset.content_format, CSV)
+        dataset.delete()
+
+    def test_create_dataset_from_upload_errors(self):
+        user = UserFactory()
+
+        self.assertRaises(NotZIPFileError, create_dataset_from_upload, BytesIO(b'a,b\n1,2\n'), user)
+        self.assertRaises(NoCSVInArchiveFoundError, create_dataset_from_upload, _zip({'readme.txt': b''}), user)
+
+    def test_create_dataset_from_compressed_csv(self):
+        data = gzip.compress(b'a,b\n1,2\n')
+        upload_file = BytesIO(data)
+        upload_file.name = 'data.csv.gz'
+
+        dataset = create_dataset_from_upload(upload_file, uploaded_by=UserFactory())
+
+        # Compressed files are stored as they are
+        self.assertEqual(dataset.name, 'data.csv.gz')
+        self.assertEqual(dataset.content_format, GZIP_CSV)
+        self.assertEqual(dataset.checksum, hashlib.sha256(data).hexdigest())
+        self.assertEqual(dataset.content.read(), data)
+        dataset.delete()
+
+    def test_create_dataset_from_npz(self):
+        upload_file = _zip({'a.npy': b'', 'b.npy': b''})
+        upload_file.name = 'arrays.zip'
+
+        dataset = create_dataset_from_upload(upload_file, uploaded_by=UserFactory())
+
+        self.assertEqual(dataset.name, 'arrays.npz')
+        self.assertEqual(dataset.content_format, NPZ)
+        self.assertEqual(dataset.content.read(), upload_file.getvalue())
+        dataset.delete()
+
+    def test_create_dataset_from_zipped_parquet(self):
+        data = b'PAR1' + b'\0' * 8 + b'PAR1'
+
+        dataset = create_dataset_from_upload(_zip({'data.parquet': data}), uploaded_by=UserFactory())
+
+        self.assertEqual(dataset.name, 'data.parquet')
+        self.assertEqual(dataset.content_format, PARQUET)
+        self.assertEqual(dataset.content.read(), data)
+        dataset.delete()
+
+
+class TestContentFormat(TestCase):
+    def test_content_format(self):
+        self.assertEqual(content_format(BytesIO(b'a,b\n1,2\n')), CSV)
+        self.assertEqual(content_format(BytesIO(gzip.compress(b'a,b\n'))), GZIP_CSV)
+        self.assertEqual(content_format(BytesIO(b'PAR1' + b'\0' * 8 + b'PAR1')), PARQUET)
+        self.assertEqual(content_format(_zip({'a.npy': b''})), NPZ)
+
+        # Text that merely starts like a signature is CSV
+        self.assertEqual(content_format(BytesIO(b'PKEY,b\n1,2\n')), CSV)
+        self.assertEqual(content_format(BytesIO(b'PAR1,b\n1,2\n')), CSV)
+        self.assertEqual(content_format(BytesIO(b'ARROW1,b\n1,2\n')), CSV)
+
+        # File objects are rewound
+        upload_file = BytesIO(b'PAR1' + b'\0' * 8 + b'PAR1')
+        content_format(upload_file)
+        self.assertEqual(upload_file.tell(), 0)
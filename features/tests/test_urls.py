@@ -82,12 +82,38 @@ class TestFixedFeatureSetHicsUrl(TestCase):
         self.assertEqual(url, '/api/targets/391ec5ac-f741-45c9-855a-7615c89ce128/hics')
 
 
+class TestTargetDensitiesUrl(TestCase):
+    def test_target_densities_url(self):
+        url = reverse('target-densities', args=['391ec5ac-f741-45c9-855a-7615c89ce128'])
+        self.assertEqual(url, '/api/targets/391ec5ac-f741-45c9-855a-7615c89ce128/densities')
+
+
 class TestRetrieveCalculations(TestCase):
     def test_retrieve_calculations(self):
         url = reverse('calculation-list')
         self.assertEqual(url, '/api/calculations')
 
 
+class TestUploads(TestCase):
+    def test_upload_list(self):
+        url = reverse('upload-list')
+        self.assertEqual(url, '/api/datasets/uploads')
+
+    def test_upload_detail(self):
+        url = reverse('upload-detail', args=['391ec5ac-f741-45c9-855a-7615c89ce128'])
+        self.assertEqual(url, '/api/datasets/uploads/391ec5ac-f741-45c9-855a-7615c89ce128')
+
+    def test_upload_commit(self):
+        url = reverse('upload-commit', args=['391ec5ac-f741-45c9-855a-7615c89ce128'])
+        self.assertEqual(url, '/api/datasets/uploads/391ec5ac-f741-45c9-855a-7615c89ce128/commit')
+
+
+class TestDatasetCacheStatistics(TestCase):
+    def test_retrieve_dataset_cache_statistics(self):
+        url = reverse('dataset-cache-statistics')
+        self.assertEqual(url, '/api/cache')
+
+
 class TestCurrentExperimentView(TestCase):
     def test_retrieve_current_experiment(self):
         url = reverse('current-experiment-detail')
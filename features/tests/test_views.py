@@ -1,22 +1,30 @@
+import hashlib
 import os
 import zipfile
 from typing import Dict, Any, Callable
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from uuid import uuid4, UUID
 
+import numpy as np
 from django.core.handlers.wsgi import WSGIRequest
 from django.urls import reverse
 from rest_framework.status import HTTP_200_OK, HTTP_404_NOT_FOUND, HTTP_204_NO_CONTENT, \
-    HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN
+    HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN, HTTP_202_ACCEPTED, HTTP_409_CONFLICT
 from rest_framework.test import APITestCase
 
-from features.models import Experiment, Dataset, Calculation
-from features.serializers import FeatureSerializer, BinSerializer, \
+from features.columnar import write_columnar, remove_columnar
+from features.densities import pack_densities, DENSITY_POINTS
+from features.histograms import build_pyramid, merge_bins, pack_edges, pack_counts, pack_levels, BASE_BINS, \
+    DEFAULT_BINS
+from features.models import Experiment, Dataset, Calculation, Upload, Feature, Histogram, Density
+from features.serializers import FeatureSerializer, \
     DatasetSerializer, ExperimentSerializer, ExperimentTargetSerializer, \
     RelevancySerializer, RedundancySerializer, SpectrogramSerializer, CalculationSerializer
-from features.tests.factories import FeatureFactory, BinFactory, SliceFactory, \
+from features.tests.factories import FeatureFactory, HistogramFactory, SliceFactory, \
     DatasetFactory, ExperimentFactory, RelevancyFactory, RedundancyFactory, \
-    ResultCalculationMapFactory, SpectrogramFactory, CalculationFactory, CurrentExperimentFactory
+    ResultCalculationMapFactory, SpectrogramFactory, CalculationFactory, CurrentExperimentFactory, UploadFactory
+from features.tasks import calculate_feature_densities
+from features.uploads import staging_path, remove_staging
 from users.tests.factories import UserFactory
 
 
@@ -273,6 +281,50 @@ class TestTargetDetailView(FexumAPITestCase):
             self.assertEqual(response.json(), {'target': str(data['target'])})
             self.assertFalse(calculate_hics.called)
 
+    def test_select_target_of_duplicate_dataset(self):
+        experiment = ExperimentFactory(target=None, dataset__checksum='a' * 64)
+        self.client.force_authenticate(experiment.user)
+        target = FeatureFactory(dataset=experiment.dataset, name='target')
+
+        source_target = FeatureFactory(dataset=DatasetFactory(checksum='a' * 64), name='target')
+        source_map = ResultCalculationMapFactory(target=source_target)
+        CalculationFactory(result_calculation_map=source_map, type=Calculation.DEFAULT_HICS, max_iteration=30,
+                           current_iteration=30)
+
+        url = reverse('experiment-targets-detail', args=[experiment.id])
+        with patch('features.views.calculate_hics.subtask') as calculate_hics, patch(
+                'features.views.calculate_target_densities.delay') as calculate_target_densities:
+            response = self.client.put(url, data={'target': target.id}, format='json')
+
+        # The results of the duplicate are copied instead of being calculated
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertFalse(calculate_hics.called)
+        calculate_target_densities.assert_called_once_with(target_id=str(target.id))
+        self.assertTrue(Calculation.objects.filter(result_calculation_map__target=target,
+                                                   type=Calculation.DEFAULT_HICS).exists())
+
+    def test_select_target_of_duplicate_dataset_densities(self):
+        experiment = ExperimentFactory(target=None, dataset__checksum='a' * 64)
+        self.client.force_authenticate(experiment.user)
+        target = FeatureFactory(dataset=experiment.dataset, name='target')
+        FeatureFactory(dataset=experiment.dataset, name='feature')
+
+        source_target = FeatureFactory(dataset=DatasetFactory(checksum='a' * 64), name='target')
+        Density.objects.create(target=source_target, feature=FeatureFactory(dataset=source_target.dataset,
+                                                                            name='feature'),
+                               target_classes=[0, 1], values=b'\x00' * 8)
+
+        url = reverse('experiment-targets-detail', args=[experiment.id])
+        with patch('features.views.calculate_hics.subtask'), patch(
+                'features.views.chain'), patch(
+                'features.views.calculate_target_densities.delay') as calculate_target_densities:
+            response = self.client.put(url, data={'target': target.id}, format='json')
+
+        # The densities of the duplicate are copied instead of being calculated
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertFalse(calculate_target_densities.called)
+        self.assertEqual(Density.objects.filter(target=target).count(), 1)
+
     def test_select_target_feature_not_found(self):
         user = UserFactory()
         self.client.force_authenticate(user)
@@ -322,6 +374,37 @@ class TestDatasetListView(FexumAPITestCase):
         self.validate_error_on_unauthenticated('dataset-list', lambda url: self.client.get(url))
 
 
+class TestDatasetPreviewView(FexumAPITestCase):
+    def test_retrieve_preview(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+        dataset = DatasetFactory()
+
+        url = reverse('dataset-preview', args=[dataset.id, 2])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'columns': [{'name': 'Col1', 'dtype': '|u1', 'text': False},
+                        {'name': 'Col2', 'dtype': '<f8', 'text': False},
+                        {'name': 'Col3', 'dtype': '|u1', 'text': False}],
+            'rows': [[1, -0.24040447, 1], [3, 0.2011319, 1]]})
+
+    def test_retrieve_preview_dataset_not_found(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        url = reverse('dataset-preview', args=['5781ca8a-3c7d-46b4-897e-90d80e938258'])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+        self.assertEqual(response.json(), {'detail': 'Not found.'})
+
+    def test_retrieve_preview_unauthenticated(self):
+        self.validate_error_on_unauthenticated('dataset-preview', lambda url: self.client.get(url),
+                                               ['5781ca8a-3c7d-46b4-897e-90d80e938258'])
+
+
 class TestDatasetUploadView(FexumAPITestCase):
     file_name = 'features/tests/assets/test_file.csv'
     url = reverse('dataset-upload')
@@ -345,7 +428,9 @@ class TestDatasetUploadView(FexumAPITestCase):
             self.assertEqual(dataset.uploaded_by, user)
 
             with open(self.file_name, 'rb') as file_data:
-                self.assertEqual(dataset.content.read(), file_data.read())
+                content = file_data.read()
+                self.assertEqual(dataset.content.read(), content)
+                self.assertEqual(dataset.checksum, hashlib.sha256(content).hexdigest())
             initialize_from_dataset_mock.assert_called_once_with(dataset_id=dataset.id)
 
     def test_upload_dataset_no_zip_file(self):
@@ -406,8 +491,30 @@ class TestFeatureListView(FexumAPITestCase):
         self.assertEqual(first_obj.pop('name'), data['name'])
         self.assertEqual(first_obj.pop('is_categorical'), data['is_categorical'])
         self.assertEqual(first_obj.pop('categories'), data['categories'])
+        self.assertEqual(first_obj.pop('dtype'), data['dtype'])
+        self.assertEqual(first_obj.pop('labels'), data['labels'])
+        self.assertEqual(first_obj.pop('missing_count'), data['missing_count'])
+        self.assertEqual(first_obj.pop('distinct_count'), data['distinct_count'])
+        self.assertEqual(first_obj.pop('skewness'), data['skewness'])
+        self.assertEqual(first_obj.pop('kurtosis'), data['kurtosis'])
+        self.assertEqual(first_obj.pop('quantiles'), data['quantiles'])
+        self.assertEqual(first_obj.pop('stage'), data['stage'])
         self.assertEqual(len(first_obj), 0)
 
+    def test_retrieve_feature_list_pending_features(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        feature = FeatureFactory(stage=Feature.STATISTICS)
+        FeatureFactory(dataset=feature.dataset, stage=Feature.PENDING)
+
+        url = reverse('dataset-features-list', args=[feature.dataset.id])
+        response = self.client.get(url)
+
+        # Features without statistics are not listed yet
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual([listed_feature['id'] for listed_feature in response.json()], [str(feature.id)])
+
     def test_retrieve_feature_list_dataset_not_found(self):
         user = UserFactory()
         self.client.force_authenticate(user)
@@ -459,26 +566,186 @@ class TestFeatureSamplesView(FexumAPITestCase):
         self.validate_error_on_unauthenticated('feature-samples', lambda url: self.client.get(url), ['9b1fe7e4-9bb7-4388-a1e4-40a35465d310'])
 
 
+class TestFeatureDensityView(FexumAPITestCase):
+    def test_retrieve_density(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        feature = FeatureFactory()
+        target = FeatureFactory(dataset=feature.dataset)
+        Density.objects.create(target=target, feature=feature, target_classes=[0, 1],
+                               values=pack_densities([[0.5, 0.25], [0.125, 1]]))
+        url = reverse('feature-density', args=[feature.id, target.id])
+        with patch('features.views.calculate_densities.apply_async') as calculate_densities:
+            response = self.client.get(url)
+
+        # Persisted densities are served without calculating them
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json(), [{'target_class': 0, 'density_values': [0.5, 0.25]},
+                                           {'target_class': 1, 'density_values': [0.125, 1]}])
+        self.assertFalse(calculate_densities.called)
+
+    def test_retrieve_density_calculated(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        feature = FeatureFactory()
+        target = FeatureFactory(dataset=feature.dataset)
+        url = reverse('feature-density', args=[feature.id, target.id])
+        with patch('features.views.calculate_densities.apply_async') as calculate_densities:
+            calculate_densities.return_value.get.return_value = [{'target_class': 0, 'density_values': [0.5]}]
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json(), [{'target_class': 0, 'density_values': [0.5]}])
+        calculate_densities.assert_called_once_with(args=[str(target.id), str(feature.id)])
+
+    def test_retrieve_density_not_found(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        feature = FeatureFactory()
+        url = reverse('feature-density', args=[feature.id, '7a662af1-5cf2-4782-bcf2-02d601bcbb6e'])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+        self.assertEqual(response.json(), {'detail': 'Not found.'})
+
+
+class TestTargetDensitiesView(FexumAPITestCase):
+    def test_retrieve_densities(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        target = FeatureFactory()
+        stored_feature = FeatureFactory(dataset=target.dataset)
+        calculated_feature = FeatureFactory(dataset=target.dataset)
+        Density.objects.create(target=target, feature=stored_feature, target_classes=[0],
+                               values=pack_densities([[0.5, 0.25]]))
+        url = reverse('target-densities', args=[target.id])
+        with patch('features.views.calculate_feature_densities.apply_async') as calculate_feature_densities:
+            calculate_feature_densities.return_value.get.return_value = {
+                str(calculated_feature.id): [{'target_class': 0, 'density_values': [0.125]}]}
+            response = self.client.post(url, data={'features': [calculated_feature.id, stored_feature.id]},
+                                        format='json')
+
+        # Only the densities that are not persisted are calculated, all of them in one task
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json(), [
+            {'feature': str(calculated_feature.id), 'densities': [{'target_class': 0, 'density_values': [0.125]}]},
+            {'feature': str(stored_feature.id), 'densities': [{'target_class': 0, 'density_values': [0.5, 0.25]}]}])
+        calculate_feature_densities.assert_called_once_with(args=[str(target.id), [str(calculated_feature.id)]])
+
+    def test_retrieve_densities_missing_values(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        dataset = DatasetFactory(content__filename='missing.csv',
+                                 content__data=b'\n'.join([b'a,b,t', b'1,,0', b'2,5,1', b',3,0', b'4,2,1', b'3,1,0']))
+        write_columnar(dataset)
+        target = FeatureFactory(dataset=dataset, name='t', is_categorical=True, categories=[0, 1])
+        # Missing values turn the bounds into NaN, sketched features still know the bounds of their finite values
+        sketched_feature = FeatureFactory(dataset=dataset, name='a', min=np.nan, max=np.nan,
+                                          quantiles={'0': 1.0, '100': 4.0})
+        unsketched_feature = FeatureFactory(dataset=dataset, name='b', min=np.nan, max=np.nan, quantiles=None)
+
+        url = reverse('target-densities', args=[target.id])
+        with patch('features.views.calculate_feature_densities.apply_async') as calculate_feature_densities_task:
+            calculate_feature_densities_task.side_effect = lambda args: MagicMock(
+                get=lambda: calculate_feature_densities(*args))
+            response = self.client.post(url, data={'features': [sketched_feature.id, unsketched_feature.id]},
+                                        format='json')
+
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        json_data = response.json()
+        self.assertEqual([densities['feature'] for densities in json_data],
+                         [str(sketched_feature.id), str(unsketched_feature.id)])
+        self.assertEqual([density['target_class'] for density in json_data[0]['densities']], [0, 1])
+        self.assertEqual(len(json_data[0]['densities'][0]['density_values']), DENSITY_POINTS)
+        self.assertEqual(json_data[1]['densities'], [])
+        remove_columnar(dataset)
+
+    def test_retrieve_densities_other_dataset(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        target = FeatureFactory()
+        feature = FeatureFactory()
+        url = reverse('target-densities', args=[target.id])
+        response = self.client.post(url, data={'features': [feature.id]}, format='json')
+
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+        self.assertEqual(response.json(), {'detail': 'Not found.'})
+
+    def test_retrieve_densities_unauthenticated(self):
+        self.validate_error_on_unauthenticated('target-densities', lambda url: self.client.post(url),
+                                               ['7a662af1-5cf2-4782-bcf2-02d601bcbb6e'])
+
+
 class TestFeatureHistogramView(FexumAPITestCase):
     def test_retrieve_histogram(self):
         user = UserFactory()
         self.client.force_authenticate(user)
 
-        hbin = BinFactory()
+        histogram = HistogramFactory()
+
+        url = reverse('feature-histogram', args=[histogram.feature.id])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json(), [{'from_value': -1.0, 'to_value': 0.0, 'count': 4},
+                                           {'from_value': 0.0, 'to_value': 2.5, 'count': 7}])
+
+        # Histograms without a pyramid return the bins that overlap the range
+        response = self.client.get(url, {'from': 0.5})
+        self.assertEqual(response.json(), [{'from_value': 0.0, 'to_value': 2.5, 'count': 7}])
+
+    def test_retrieve_histogram_missing(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
 
-        url = reverse('feature-histogram', args=[hbin.feature.id])
+        feature = FeatureFactory()
+        url = reverse('feature-histogram', args=[feature.id])
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, HTTP_200_OK)
-        data = BinSerializer(instance=hbin).data
+        self.assertEqual(response.json(), [])
+
+    def test_retrieve_histogram_pyramid(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        feature = FeatureFactory()
+        levels = build_pyramid(np.ones(BASE_BINS, dtype=int))
+        counts, bin_edges = merge_bins(levels[0], np.linspace(0, 4, BASE_BINS + 1), DEFAULT_BINS)
+        Histogram.objects.create(feature=feature, bin_edges=pack_edges(bin_edges), counts=pack_counts(counts),
+                                 levels=pack_levels(levels))
+        url = reverse('feature-histogram', args=[feature.id])
+
+        # Coarser levels are used as long as they resolve the requested bins
+        response = self.client.get(url, {'bins': 2})
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json(), [{'from_value': 0.0, 'to_value': 2.0, 'count': 800},
+                                           {'from_value': 2.0, 'to_value': 4.0, 'count': 800}])
+
+        # Ranges are sliced from the coarsest level whose bins in the range split evenly into the requested bins
+        response = self.client.get(url, {'bins': 4, 'from': 1.5, 'to': 2.5})
         json_data = response.json()
-        self.assertEqual(len(json_data), 1)
-        first_obj = json_data.pop(0)
-        self.assertEqual(len(json_data), 0)
-        self.assertEqual(first_obj.pop('count'), data['count'])
-        self.assertAlmostEqual(first_obj.pop('to_value'), data['to_value'])
-        self.assertAlmostEqual(first_obj.pop('from_value'), data['from_value'])
-        self.assertEqual(len(first_obj), 0)
+        self.assertEqual([hbin['count'] for hbin in json_data], [100, 100, 100, 100])
+        for hbin, from_value in zip(json_data, [1.5, 1.75, 2.0, 2.25]):
+            self.assertAlmostEqual(hbin['from_value'], from_value)
+        self.assertAlmostEqual(json_data[-1]['to_value'], 2.5)
+
+    def test_retrieve_histogram_invalid_range(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        histogram = HistogramFactory()
+        url = reverse('feature-histogram', args=[histogram.feature.id])
+        response = self.client.get(url, {'from': 2, 'to': 1})
+
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {'non_field_errors': ['from has to be smaller than to']})
 
     def test_retrieve_histogram_not_found(self):
         user = UserFactory()
@@ -876,3 +1143,85 @@ class TestSetCurrentExperimentView(FexumAPITestCase):
 
         self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
         self.assertEqual(response.json(), {'detail': 'Not found.'})
+
+
+class TestDatasetCacheStatisticsView(FexumAPITestCase):
+    def test_retrieve_dataset_cache_statistics(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        statistics = {'budget': 1024, 'usage': 0, 'datasets': []}
+        with patch('features.views.get_cache_statistics.apply_async') as task_mock:
+            task_mock.return_value.get.return_value = statistics
+
+            response = self.client.get(reverse('dataset-cache-statistics'))
+
+        task_mock.assert_called_once_with()
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json(), statistics)
+
+    def test_retrieve_dataset_cache_statistics_unauthenticated(self):
+        self.validate_error_on_unauthenticated('dataset-cache-statistics', lambda url: self.client.get(url))
+
+
+class TestUploadViews(FexumAPITestCase):
+    def test_chunked_upload(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+
+        response = self.client.post(reverse('upload-list'))
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        upload = Upload.objects.get(pk=response.json()['id'])
+        self.assertEqual(upload.uploaded_by, user)
+        url = reverse('upload-detail', args=[upload.id])
+
+        response = self.client.put(url + '?offset=0', b'PK\x03', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(response.json()['offset'], 3)
+
+        # A retried chunk replaces what was received from its offset on
+        response = self.client.put(url + '?offset=2', b'\x04\x05', content_type='application/octet-stream')
+        self.assertEqual(response.json()['offset'], 4)
+
+        # Chunks must not leave a gap
+        response = self.client.put(url + '?offset=5', b'\x06', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, HTTP_409_CONFLICT)
+
+        response = self.client.get(url)
+        self.assertEqual(response.json()['offset'], 4)
+        self.assertEqual(response.json()['status'], Upload.RECEIVING)
+        with open(staging_path(upload), 'rb') as staging_file:
+            self.assertEqual(staging_file.read(), b'PK\x04\x05')
+
+        checksum = hashlib.sha256(b'PK\x04\x05').hexdigest()
+        with patch('features.views.commit_upload.delay') as commit_upload_mock:
+            response = self.client.post(reverse('upload-commit', args=[upload.id]), {'checksum': checksum})
+
+        self.assertEqual(response.status_code, HTTP_202_ACCEPTED)
+        self.assertEqual(response.json()['status'], Upload.PROCESSING)
+        commit_upload_mock.assert_called_once_with(upload_id=upload.id, checksum=checksum)
+
+        # Committed uploads don't take chunks anymore
+        response = self.client.put(url + '?offset=4', b'\x06', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+        remove_staging(upload)
+
+    def test_upload_of_another_user(self):
+        self.client.force_authenticate(UserFactory())
+        upload = UploadFactory()
+
+        response = self.client.get(reverse('upload-detail', args=[upload.id]))
+
+        self.assertEqual(response.status_code, HTTP_404_NOT_FOUND)
+
+    def test_commit_upload_invalid_checksum(self):
+        user = UserFactory()
+        self.client.force_authenticate(user)
+        upload = UploadFactory(uploaded_by=user)
+
+        response = self.client.post(reverse('upload-commit', args=[upload.id]), {'checksum': 'abc'})
+
+        self.assertEqual(response.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_upload_unauthenticated(self):
+        self.validate_error_on_unauthenticated('upload-list', lambda url: self.client.post(url))
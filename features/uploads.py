@@ -0,0 +1,197 @@
+"""
+Ingestion of uploaded archives. Uploads are spooled to temporary files by Django and the CSV is decompressed chunk by
+chunk into the media storage, so the memory of a web worker does not depend on the size of an upload.
+
+Parquet and Arrow files, NPZ archives and gzip or zstd compressed CSV files are stored as they were uploaded. Their
+format is recognized by their signature once on upload and stored with the dataset, they are only converted when the
+dataset is initialized.
+
+Large archives are uploaded in chunks that are appended to a staging file, so that an interrupted upload can be
+resumed from its last complete chunk.
+"""
+import hashlib
+import os
+import zipfile
+
+from django.conf import settings
+from django.core.files import File
+
+from features.exceptions import NoCSVInArchiveFoundError, NotZIPFileError
+from features.models import Dataset, Upload
+
+# Bytes that are copied or hashed at once
+BLOCK_SIZE = 1024 * 1024
+
+# Formats of dataset contents
+CSV = 'csv'
+GZIP_CSV = 'csv.gz'
+ZSTD_CSV = 'csv.zst'
+PARQUET = 'parquet'
+ARROW = 'arrow'
+NPZ = 'npz'
+
+# Formats that are parsed as CSV
+CSV_FORMATS = (CSV, GZIP_CSV, ZSTD_CSV)
+
+# Leading bytes of the binary formats, complete signatures so that no text can start with them. NPZ files are ZIP
+# archives of .npy files, so every ZIP archive is recognized as NPZ. Parquet files also end with their signature.
+_MAGIC_NUMBERS = (
+    (b'PAR1', PARQUET),
+    (b'ARROW1\x00\x00', ARROW),
+    (b'PK\x03\x04', NPZ),
+    (b'PK\x05\x06', NPZ),
+    (b'\x1f\x8b\x08', GZIP_CSV),
+    (b'\x28\xb5\x2f\xfd', ZSTD_CSV)
+)
+_PARQUET_FOOTER = b'PAR1'
+
+# Archive members with these extensions are stored as they are
+_MEMBER_FORMATS = (
+    ('.parquet', PARQUET),
+    ('.arrow', ARROW),
+    ('.feather', ARROW),
+    ('.csv.gz', GZIP_CSV),
+    ('.csv.zst', ZSTD_CSV)
+)
+
+
+class HashingReader(object):
+    """
+    File-like wrapper that hashes everything that is read through it.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1) -> bytes:
+        data = self.file.read(size)
+        self.sha256.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self.sha256.hexdigest()
+
+
+def file_checksum(path: str) -> str:
+    """
+    :param path: Path of a file
+    :return: SHA-256 of the file's content
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(BLOCK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def content_format(file) -> str:
+    """
+    :param file: Path or file object, file objects are rewound
+    :return: One of the formats by the file's signature, everything else is assumed to be CSV
+    """
+    if isinstance(file, str):
+        with open(file, 'rb') as content_file:
+            return content_format(content_file)
+
+    leading_bytes = file.read(8)
+    file_format = next((file_format for magic_number, file_format in _MAGIC_NUMBERS
+                        if leading_bytes.startswith(magic_number)), CSV)
+    if file_format == PARQUET:
+        file.seek(-len(_PARQUET_FOOTER), os.SEEK_END)
+        if len(leading_bytes) < 2 * len(_PARQUET_FOOTER) or file.read() != _PARQUET_FOOTER:
+            file_format = CSV
+    file.seek(0)
+    return file_format
+
+
+def dataset_format(dataset: Dataset) -> str:
+    """
+    :return: Format of the dataset's content as detected on upload, datasets of older uploads are detected again
+    """
+    return dataset.content_format or content_format(dataset.content.path)
+
+
+def staging_path(upload: Upload) -> str:
+    return os.path.join(settings.MEDIA_ROOT, 'uploads', '{0}.part'.format(upload.id))
+
+
+def append_chunk(upload: Upload, offset: int, stream) -> int:
+    """
+    Write a chunk to the staging file of an upload. Chunks that start before the end of the file replace everything
+    from their offset on, so a chunk can be retried if its response got lost.
+
+    :param upload: The upload, its row should be locked by the caller
+    :param offset: Position of the chunk's first byte in the archive, at most the upload's current offset
+    :param stream: File-like object of the chunk
+    :return: The upload's offset after the chunk
+    """
+    path = staging_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'r+b' if os.path.isfile(path) else 'wb') as staging_file:
+        staging_file.seek(offset)
+        for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+            staging_file.write(block)
+        staging_file.truncate()
+        return staging_file.tell()
+
+
+def remove_staging(upload: Upload):
+    try:
+        os.remove(staging_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def _save_dataset(source_file, name: str, uploaded_by, file_format: str) -> Dataset:
+    # Copy the file into the media storage and hash it on the way
+    reader = HashingReader(source_file)
+    dataset = Dataset(name=name, uploaded_by=uploaded_by, content_format=file_format)
+    # Without a seek method the storage copies the reader from its current position in chunks
+    dataset.content.save(name, File(reader, name=name), save=False)
+
+    dataset.checksum = reader.hexdigest()
+    dataset.save()
+    return dataset
+
+
+def create_dataset_from_upload(upload_file, uploaded_by) -> Dataset:
+    """
+    Create a dataset from an uploaded file. Parquet and Arrow files and compressed CSV files are stored as they are.
+    Of a ZIP archive the first CSV file or else the first file of another supported format is decompressed in chunks
+    into the media storage, archives that only contain .npy files are stored as NPZ.
+
+    :param upload_file: File object of the upload
+    :param uploaded_by: The uploading user
+    :return: The dataset
+    """
+    file_format = content_format(upload_file)
+    name = os.path.basename(getattr(upload_file, 'name', None) or 'dataset.{0}'.format(file_format))
+    if file_format in (PARQUET, ARROW, GZIP_CSV, ZSTD_CSV):
+        return _save_dataset(upload_file, name, uploaded_by, file_format)
+    if file_format != NPZ:
+        raise NotZIPFileError
+
+    try:
+        archive = zipfile.ZipFile(upload_file)
+    except zipfile.BadZipfile:
+        raise NotZIPFileError
+
+    member_names = [item for item in archive.namelist() if not item.endswith('/')]
+    csv_names = [item for item in member_names if item.endswith('csv')]
+    member_formats = dict(_MEMBER_FORMATS)
+    other_names = [item for item in member_names if item.endswith(tuple(member_formats))]
+    if not csv_names and not other_names and member_names and \
+            all(item.endswith('.npy') for item in member_names):
+        upload_file.seek(0)
+        return _save_dataset(upload_file, os.path.splitext(name)[0] + '.npz', uploaded_by, NPZ)
+
+    try:
+        member_name = (csv_names + other_names)[0]
+    except IndexError:
+        raise NoCSVInArchiveFoundError
+
+    # Extracted CSV files are never detected again, their first header might look like a signature
+    member_format = next((member_format for extension, member_format in _MEMBER_FORMATS
+                          if member_name.endswith(extension)), CSV)
+    with archive.open(member_name) as member_file:
+        return _save_dataset(member_file, member_name, uploaded_by, member_format)
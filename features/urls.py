@@ -4,7 +4,8 @@ from features.views import FeatureListView, FeatureSamplesView, DatasetListView,
     FeatureHistogramView, FeatureSlicesView, TargetDetailView, DatasetViewUploadView, \
     ExperimentListView, FeatureRelevancyResultsView, ExperimentDetailView, TargetRedundancyResults, \
     ConditionalDistributionsView, FeatureDensityView, FeatureSpectrogramView, FixedFeatureSetHicsView, \
-    CalculationListView, CurrentExperimentView, SetCurrentExperimentView
+    CalculationListView, CurrentExperimentView, SetCurrentExperimentView, DatasetCacheStatisticsView, \
+    UploadListView, UploadDetailView, UploadCommitView, DatasetPreviewView, TargetDensitiesView
 
 urlpatterns = [
     # Experiments
@@ -20,8 +21,13 @@ urlpatterns = [
     # Datasets
     url(r'datasets$', DatasetListView.as_view(), name='dataset-list'),
     url(r'datasets/upload$', DatasetViewUploadView.as_view(), name='dataset-upload'),
+    url(r'datasets/uploads$', UploadListView.as_view(), name='upload-list'),
+    url(r'datasets/uploads/(?P<upload_id>[a-zA-Z0-9-]+)$', UploadDetailView.as_view(), name='upload-detail'),
+    url(r'datasets/uploads/(?P<upload_id>[a-zA-Z0-9-]+)/commit$', UploadCommitView.as_view(), name='upload-commit'),
     url(r'datasets/(?P<dataset_id>[a-zA-Z0-9-]+)/features$', FeatureListView.as_view(),
         name='dataset-features-list'),
+    url(r'datasets/(?P<dataset_id>[a-zA-Z0-9-]+)/preview(?:/(?P<rows>[0-9]+))?$', DatasetPreviewView.as_view(),
+        name='dataset-preview'),
 
     # Features
     url(r'features/(?P<feature_id>[a-zA-Z0-9-]+)/samples(?:/(?P<max_samples>[0-9]+))?$', FeatureSamplesView.as_view(),
@@ -45,6 +51,8 @@ urlpatterns = [
     url(r'targets/(?P<target_id>[a-zA-Z0-9-]+)/hics',
         FixedFeatureSetHicsView.as_view(),
         name='fixed-feature-set-hics'),
+    url(r'targets/(?P<target_id>[a-zA-Z0-9-]+)/densities$', TargetDensitiesView.as_view(),
+        name='target-densities'),
 
     # Distributions
     url(r'targets/(?P<target_id>[a-zA-Z0-9-]+)/distributions(?:/(?P<max_samples>[0-9]+))?$',
@@ -52,4 +60,7 @@ urlpatterns = [
 
     # Calculations
     url(r'calculations$', CalculationListView.as_view(), name='calculation-list'),
+
+    # Dataset cache
+    url(r'cache$', DatasetCacheStatisticsView.as_view(), name='dataset-cache-statistics'),
 ]
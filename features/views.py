@@ -1,27 +1,35 @@
 import logging
-import zipfile
+from io import BytesIO
 
 from celery import chain
-from django.core.files import File
+from django.db import transaction
 from django.db.models import Count, F
 from django.shortcuts import get_object_or_404
 from django.utils.datastructures import MultiValueDictKeyError
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
-from rest_framework.status import HTTP_204_NO_CONTENT, HTTP_404_NOT_FOUND
+from rest_framework.status import HTTP_202_ACCEPTED, HTTP_204_NO_CONTENT, HTTP_404_NOT_FOUND
 from rest_framework.views import APIView
 
-from features.exceptions import NoCSVInArchiveFoundError, NotZIPFileError
+from features.exceptions import NotZIPFileError, UploadOffsetError, UploadNotReceivingError
 from features.models import Calculation
-from features.models import Feature, Bin, Dataset, Experiment, Slice, Relevancy, Redundancy, Spectrogram, \
-    ResultCalculationMap, CurrentExperiment
+from features.models import Feature, Histogram, Density, Dataset, Experiment, Slice, Relevancy, Redundancy, \
+    Spectrogram, ResultCalculationMap, CurrentExperiment, Upload
 from features.serializers import FeatureSerializer, BinSerializer, ExperimentSerializer, \
     DatasetSerializer, RedundancySerializer, \
     ExperimentTargetSerializer, RelevancySerializer, ConditionalDistributionRequestSerializer, \
-    DensitySerializer, \
-    SpectrogramSerializer, CalculationSerializer
+    DensitySerializer, FeatureDensitiesRequestSerializer, FeatureDensitiesSerializer, \
+    SpectrogramSerializer, CalculationSerializer, UploadSerializer, UploadChunkSerializer, UploadCommitSerializer, \
+    HistogramRequestSerializer
 from features.tasks import calculate_hics, calculate_conditional_distributions, initialize_from_dataset, \
-    calculate_densities, get_samples
+    calculate_densities, calculate_target_densities, calculate_feature_densities, get_samples, get_cache_statistics, \
+    commit_upload
+from features.uploads import create_dataset_from_upload, append_chunk
+from features.deduplication import copy_results, copy_densities
+from features.columnar import read_preview, PREVIEW_ROWS, MAX_PREVIEW_ROWS
+from features.histograms import query_pyramid, slice_bins, bin_list, unpack_edges, unpack_counts, \
+    unpack_levels, DEFAULT_BINS
+from features.densities import unpack_densities, density_list
 
 logger = logging.getLogger(__name__)
 
@@ -81,7 +89,12 @@ class TargetDetailView(APIView):
         serializer.save()
 
         target = Feature.objects.get(id=experiment.target.id)
-        result_calculation_map, _ = ResultCalculationMap.objects.get_or_create(target=target)
+        result_calculation_map, created = ResultCalculationMap.objects.get_or_create(target=target)
+        if created:
+            # The same target of a dataset with the same content was already calculated
+            copy_results(result_calculation_map)
+            if not copy_densities(target):
+                calculate_target_densities.delay(target_id=str(target.id))
 
         # early return to avoid duplicated calculation
         if Calculation.objects.filter(type=Calculation.DEFAULT_HICS,
@@ -145,28 +158,25 @@ class DatasetListView(APIView):
         return Response(serializer.data)
 
 
+class DatasetPreviewView(APIView):
+    def get(self, _, dataset_id, rows=None):
+        dataset = get_object_or_404(Dataset, pk=dataset_id)
+        # Only the head of the dataset is read, so it is served right away instead of by a worker
+        preview = read_preview(dataset, rows=PREVIEW_ROWS if rows is None else min(int(rows), MAX_PREVIEW_ROWS))
+        return Response(preview)
+
+
 class DatasetViewUploadView(APIView):
     parser_classes = (MultiPartParser, FormParser,)
 
     def put(self, request):
         try:
-            zip_file = request.FILES['file']
-            archive = zipfile.ZipFile(zip_file)
-        except (MultiValueDictKeyError, zipfile.BadZipfile):
+            # Spooled to a temporary file by the upload handler
+            upload_file = request.FILES['file']
+        except MultiValueDictKeyError:
             raise NotZIPFileError
 
-        try:
-            csv_name = [item for item in archive.namelist() if item.endswith('csv')][0]
-        except IndexError:
-            raise NoCSVInArchiveFoundError
-
-        with archive.open(csv_name) as zip_csv_file:
-            # Convert zipfile handle to Django file handle
-            csv_file = File(zip_csv_file)
-            dataset = Dataset.objects.create(
-                name=zip_csv_file.name,
-                content=csv_file,
-                uploaded_by=request.user)
+        dataset = create_dataset_from_upload(upload_file, uploaded_by=request.user)
 
         # Start tasks for feature calculation
         initialize_from_dataset.delay(dataset_id=dataset.id)
@@ -175,10 +185,65 @@ class DatasetViewUploadView(APIView):
         return Response(serializer.data)
 
 
+class UploadListView(APIView):
+    def post(self, request):
+        upload = Upload.objects.create(uploaded_by=request.user)
+        serializer = UploadSerializer(instance=upload)
+        return Response(serializer.data)
+
+
+class UploadDetailView(APIView):
+    def get(self, request, upload_id):
+        upload = get_object_or_404(Upload, pk=upload_id, uploaded_by=request.user)
+        serializer = UploadSerializer(instance=upload)
+        return Response(serializer.data)
+
+    def put(self, request, upload_id):
+        # The chunk is the raw body, its offset in the archive is passed in the query
+        chunk_serializer = UploadChunkSerializer(data=request.query_params)
+        chunk_serializer.is_valid(raise_exception=True)
+        offset = chunk_serializer.validated_data['offset']
+
+        with transaction.atomic():
+            # Concurrent chunks of the same upload are written one after another
+            upload = get_object_or_404(Upload.objects.select_for_update(), pk=upload_id, uploaded_by=request.user)
+            if upload.status != Upload.RECEIVING:
+                raise UploadNotReceivingError
+            if offset > upload.offset:
+                raise UploadOffsetError
+
+            # Empty chunks have no stream
+            upload.offset = append_chunk(upload, offset, request.stream or BytesIO())
+            upload.save(update_fields=['offset'])
+
+        serializer = UploadSerializer(instance=upload)
+        return Response(serializer.data)
+
+
+class UploadCommitView(APIView):
+    def post(self, request, upload_id):
+        commit_serializer = UploadCommitSerializer(data=request.data)
+        commit_serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            upload = get_object_or_404(Upload.objects.select_for_update(), pk=upload_id, uploaded_by=request.user)
+            if upload.status != Upload.RECEIVING:
+                raise UploadNotReceivingError
+            upload.status = Upload.PROCESSING
+            upload.save(update_fields=['status'])
+
+        # Verifying and extracting a large archive takes longer than a request should
+        commit_upload.delay(upload_id=upload.id, checksum=commit_serializer.validated_data['checksum'])
+
+        serializer = UploadSerializer(instance=upload)
+        return Response(serializer.data, status=HTTP_202_ACCEPTED)
+
+
 class FeatureListView(APIView):
     def get(self, _, dataset_id):
         dataset = get_object_or_404(Dataset, pk=dataset_id)
-        features = Feature.objects.filter(dataset=dataset).all()
+        # Features are listed as soon as their statistics are ready
+        features = Feature.objects.filter(dataset=dataset).exclude(stage=Feature.PENDING).all()
         serializer = FeatureSerializer(instance=features, many=True)
         return Response(serializer.data)
 
@@ -193,20 +258,68 @@ class FeatureSamplesView(APIView):
 
 class FeatureDensityView(APIView):
     def get(self, _, feature_id, target_id):
-        get_object_or_404(Feature, id=feature_id)
-        get_object_or_404(Feature, id=target_id)
+        feature = get_object_or_404(Feature, id=feature_id)
+        target = get_object_or_404(Feature, id=target_id)
 
-        densities_task = calculate_densities.apply_async(args=[target_id, feature_id])
-        densities = densities_task.get()
+        # Densities of a target are calculated in the background once it is selected
+        density = Density.objects.filter(target=target, feature=feature).first()
+        if density is not None:
+            densities = density_list(density.target_classes,
+                                     unpack_densities(density.values, len(density.target_classes)))
+        else:
+            densities_task = calculate_densities.apply_async(args=[target_id, feature_id])
+            densities = densities_task.get()
         serializer = DensitySerializer(instance=densities, many=True)
         return Response(serializer.data)
 
 
+class TargetDensitiesView(APIView):
+    def post(self, request, target_id):
+        target = get_object_or_404(Feature, id=target_id)
+        request_serializer = FeatureDensitiesRequestSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+        features = request_serializer.validated_data['features']
+
+        if any(feature.dataset_id != target.dataset_id for feature in features):
+            return Response(status=HTTP_404_NOT_FOUND, data={'detail': 'Not found.'})
+
+        densities = {}
+        for density in Density.objects.filter(target=target, feature__in=features):
+            densities[str(density.feature_id)] = density_list(
+                density.target_classes, unpack_densities(density.values, len(density.target_classes)))
+
+        # Densities that were not calculated in the background are calculated together in a single task
+        missing_feature_ids = [str(feature.id) for feature in features if str(feature.id) not in densities]
+        if len(missing_feature_ids) > 0:
+            densities_task = calculate_feature_densities.apply_async(args=[target_id, missing_feature_ids])
+            densities.update(densities_task.get())
+
+        serializer = FeatureDensitiesSerializer(instance=[{'feature': feature.id,
+                                                          'densities': densities[str(feature.id)]}
+                                                         for feature in features], many=True)
+        return Response(serializer.data)
+
+
 class FeatureHistogramView(APIView):
-    def get(self, _, feature_id):
+    def get(self, request, feature_id):
         feature = get_object_or_404(Feature, id=feature_id)
-        bins = Bin.objects.filter(feature=feature).order_by('id').all()
-        serializer = BinSerializer(instance=bins, many=True)
+        request_serializer = HistogramRequestSerializer(data=request.query_params)
+        request_serializer.is_valid(raise_exception=True)
+        query = request_serializer.validated_data
+
+        histogram = Histogram.objects.filter(feature=feature).first()
+        if histogram is None:
+            return Response([])
+
+        # Pyramids answer any resolution and range from their counts, categorical features have a bin per category
+        counts, bin_edges = unpack_counts(histogram.counts), unpack_edges(histogram.bin_edges)
+        if histogram.levels is not None:
+            counts, bin_edges = query_pyramid(unpack_levels(histogram.levels), bin_edges[0], bin_edges[-1],
+                                              bins=query.get('bins', DEFAULT_BINS), start=query.get('from'),
+                                              stop=query.get('to'))
+        else:
+            counts, bin_edges = slice_bins(counts, bin_edges, start=query.get('from'), stop=query.get('to'))
+        serializer = BinSerializer(instance=bin_list(counts, bin_edges), many=True)
         return Response(serializer.data)
 
 
@@ -281,3 +394,9 @@ class CalculationListView(APIView):
         calculations = Calculation.objects.filter(current_iteration__lt=F('max_iteration')).all()
         serializer = CalculationSerializer(instance=calculations, many=True)
         return Response(serializer.data)
+
+
+class DatasetCacheStatisticsView(APIView):
+    def get(self, _):
+        statistics_task = get_cache_statistics.apply_async()
+        return Response(statistics_task.get())
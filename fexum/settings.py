@@ -124,8 +124,14 @@ task_routes = {
     'features.tasks.calculate_densities': {
         'queue': 'realtime'
     },
+    'features.tasks.calculate_feature_densities': {
+        'queue': 'realtime'
+    },
     'features.tasks.get_samples': {
         'queue': 'realtime'
+    },
+    'features.tasks.get_cache_statistics': {
+        'queue': 'realtime'
     }
 }
 
@@ -155,9 +161,18 @@ CHANNEL_LAYERS = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Shared memory cache for datasets, has to stay below the worker's shm_size
+DATASET_CACHE_BUDGET = int(os.environ.get('DATASET_CACHE_BUDGET', 6*1024*1024*1024))
+# Evict as soon as a load would exceed the high watermark, down to the low watermark
+DATASET_CACHE_HIGH_WATERMARK = 0.9
+DATASET_CACHE_LOW_WATERMARK = 0.7
+
 # Fuck the limit
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10*1024*1024*1024
 
+# Spool uploads to temporary files on disk instead of keeping them in memory
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
 AUTH_USER_MODEL = 'users.User'
 
 # Security